@@ -0,0 +1,114 @@
+"""Deterministic in-process stand-ins for a ccxt exchange and the BigQuery client."""
+
+import json
+import time
+from typing import Any, Dict, List, Optional
+
+import ccxt
+
+
+class FakeExchange:
+    """
+    ccxt-like exchange serving synthetic candles from a formula, so every run sees the
+    same data. Candles exist from listing_ms for candle_count steps; fetch_ohlcv caps
+    pages at max_page, sleeps latency_s per request and raises RateLimitExceeded on
+    every rate_limit_every-th request (0 disables).
+    """
+
+    def __init__(
+        self,
+        exchange_id: str = "fakex",
+        latency_s: float = 0.0,
+        max_page: int = 1000,
+        candle_count: int = 100_000,
+        listing_ms: int = 1_672_531_200_000,
+        rate_limit_every: int = 0,
+        rate_limit_ms: int = 0,
+    ):
+        self.id = exchange_id
+        self.rateLimit = rate_limit_ms
+        self.latency_s = latency_s
+        self.max_page = max_page
+        self.candle_count = candle_count
+        self.listing_ms = listing_ms
+        self.rate_limit_every = rate_limit_every
+        self.requests = 0
+        self.rate_limited = 0
+
+    def parse_timeframe(self, timeframe: str) -> int:
+        return ccxt.Exchange.parse_timeframe(timeframe)
+
+    def _candle(self, ts_ms: int, index: int) -> List[Any]:
+        base = 100.0 + (index % 500) * 0.1
+        return [ts_ms, base, base + 1.0, base - 1.0, base + 0.5, 10.0 + index % 7]
+
+    def fetch_ohlcv(self, symbol: str, timeframe: str = "1m", since: Optional[int] = None, limit: Optional[int] = None):
+        self.requests += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        if self.rate_limit_every and self.requests % self.rate_limit_every == 0:
+            self.rate_limited += 1
+            raise ccxt.RateLimitExceeded(f"{self.id} fake rate limit")
+
+        step_ms = self.parse_timeframe(timeframe) * 1000
+        limit = min(limit or self.max_page, self.max_page)
+        last_index = self.candle_count - 1
+        if since is None:
+            first_index = max(0, last_index - limit + 1)
+        else:
+            first_index = max(0, -(-(since - self.listing_ms) // step_ms))
+        last = min(last_index, first_index + limit - 1)
+        return [self._candle(self.listing_ms + i * step_ms, i) for i in range(first_index, last + 1)]
+
+
+class _FakeTable:
+    def __init__(self, schema):
+        self.schema = schema
+        self.time_partitioning = None
+        self.clustering_fields = None
+
+
+class _FakeJob:
+    def result(self):
+        return self
+
+
+class FakeBigQueryClient:
+    """Counts streaming inserts and load jobs instead of calling BigQuery."""
+
+    def __init__(self, project: str = "bench-project", latency_s: float = 0.0):
+        self.project = project
+        self.latency_s = latency_s
+        self.insert_calls = 0
+        self.rows = 0
+        self.bytes = 0
+        self.load_jobs = 0
+        self._tables: Dict[str, _FakeTable] = {}
+
+    def get_table(self, table_id: str):
+        if table_id not in self._tables:
+            raise KeyError(table_id)
+        return self._tables[table_id]
+
+    def create_table(self, table):
+        self._tables[f"{table.project}.{table.dataset_id}.{table.table_id}"] = _FakeTable(table.schema)
+        return table
+
+    def update_table(self, table, fields):
+        return table
+
+    def insert_rows_json(self, table_id: str, payload: List[Dict[str, Any]], row_ids=None):
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        self.insert_calls += 1
+        self.rows += len(payload)
+        self.bytes += len(json.dumps(payload))
+        return []
+
+    def load_table_from_file(self, file_obj, table_id: str, job_config=None):
+        self.load_jobs += 1
+        for line in file_obj:
+            if line.strip():
+                self.rows += 1
+                self.bytes += len(line)
+        return _FakeJob()
@@ -0,0 +1,236 @@
+"""
+Offline throughput benchmarks for the collector's hot paths.
+
+Runs every stage against FakeExchange / FakeBigQueryClient and reports candles/sec,
+requests/sec, CPU time and peak traced memory per stage. Results are compared with
+benchmarks/baseline.json; a stage whose candles/sec drops more than --tolerance
+below its baseline fails the run.
+
+    PYTHONPATH=src python benchmarks/run.py
+    PYTHONPATH=src python benchmarks/run.py --update-baseline
+"""
+
+import argparse
+import atexit
+import functools
+import json
+import logging
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict
+
+from fakes import FakeBigQueryClient, FakeExchange
+
+from tda_collector import storage
+from tda_collector.adapter import _to_record, fetch_history_page
+from tda_collector.models import CandleBatch
+from tda_collector.pagecache import CachingPageFetcher, PageCache
+from tda_collector.scheduler import run_history_loop, run_live_loop
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+NO_BACKOFF = {"base_delay": 0.0, "max_delay": 0.0, "max_attempts": 5}
+
+
+class _StopLoop(Exception):
+    pass
+
+
+def _quiet_logger() -> logging.Logger:
+    logger = logging.getLogger("tda-bench")
+    logger.handlers = [logging.NullHandler()]
+    logger.propagate = False
+    return logger
+
+
+def _measure(fn: Callable[[], Dict[str, int]], trace_memory: bool = True) -> Dict[str, float]:
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    counts = fn()
+    cpu_s = time.process_time() - cpu_start
+    wall_s = time.perf_counter() - wall_start
+    result = {
+        "candles": counts["candles"],
+        "requests": counts["requests"],
+        "wall_s": round(wall_s, 4),
+        "cpu_s": round(cpu_s, 4),
+        "candles_per_s": round(counts["candles"] / wall_s, 1) if wall_s else 0.0,
+        "requests_per_s": round(counts["requests"] / wall_s, 1) if wall_s else 0.0,
+    }
+    if trace_memory:
+        # Separate pass: tracemalloc slows allocation-heavy code several times over.
+        tracemalloc.start()
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["peak_mem_kb"] = round(peak / 1024, 1)
+    return result
+
+
+def bench_adapter_history_pages(pages: int = 100, page_size: int = 1000) -> Dict[str, int]:
+    exchange = FakeExchange(candle_count=pages * page_size, max_page=page_size)
+    candles = 0
+    for page in range(pages):
+        since = exchange.listing_ms + page * page_size * 60_000
+        batch = fetch_history_page(exchange, "BTC/USDT", "1m", since, page_size)
+        candles += len(batch.to_bq_rows())
+    return {"candles": candles, "requests": exchange.requests}
+
+
+def bench_adapter_live_records(candles: int = 50_000) -> Dict[str, int]:
+    exchange = FakeExchange(candle_count=1000)
+    raw = exchange.fetch_ohlcv("BTC/USDT", "1m", since=exchange.listing_ms, limit=1000)
+    for i in range(candles):
+        _to_record("fakex", "BTC/USDT", "1m", raw[i % len(raw)]).to_bq_row()
+    return {"candles": candles, "requests": exchange.requests}
+
+
+def bench_storage_insert(batches: int = 100, batch_size: int = 500) -> Dict[str, int]:
+    client = FakeBigQueryClient()
+    exchange = FakeExchange(candle_count=batch_size)
+    batch = CandleBatch.from_ohlcv(
+        "fakex", "BTC/USDT", "1m", exchange.fetch_ohlcv("BTC/USDT", "1m", since=exchange.listing_ms, limit=batch_size)
+    )
+    storage._ensured_tables.discard(f"{client.project}.bench.ohlcv")
+    for _ in range(batches):
+        storage.insert_rows(client, "bench", "ohlcv", batch)
+    return {"candles": client.rows, "requests": client.insert_calls}
+
+
+def bench_history_loop(symbols: int = 2, candles_per_symbol: int = 50_000) -> Dict[str, int]:
+    exchange = FakeExchange(candle_count=candles_per_symbol, max_page=1000, rate_limit_every=97)
+    client = FakeBigQueryClient()
+    start = exchange.listing_ms
+    end = start + candles_per_symbol * 60_000
+    tasks = [(exchange, f"SYM{i}/USDT", "1m", start, end) for i in range(symbols)]
+    run_history_loop(
+        tasks,
+        storage_fn=storage.insert_rows,
+        logger=_quiet_logger(),
+        bq_client=client,
+        dataset="bench",
+        table="ohlcv",
+        page_limit=1000,
+        backoff_cfg=NO_BACKOFF,
+    )
+    return {"candles": client.rows, "requests": exchange.requests}
+
+
+@functools.lru_cache(maxsize=None)
+def _recorded_page_cache(symbols: int, candles_per_symbol: int) -> str:
+    """Page cache directory holding one recorded history_loop run (built once per process)."""
+    directory = tempfile.mkdtemp(prefix="tda-bench-pages-")
+    atexit.register(shutil.rmtree, directory, ignore_errors=True)
+    _run_history(symbols, candles_per_symbol, CachingPageFetcher(PageCache(directory)))
+    return directory
+
+
+def _run_history(symbols: int, candles_per_symbol: int, fetch_page_fn) -> Dict[str, int]:
+    exchange = FakeExchange(candle_count=candles_per_symbol, max_page=1000)
+    client = FakeBigQueryClient()
+    start = exchange.listing_ms
+    end = start + candles_per_symbol * 60_000
+    run_history_loop(
+        [(exchange, f"SYM{i}/USDT", "1m", start, end) for i in range(symbols)],
+        fetch_page_fn=fetch_page_fn,
+        storage_fn=storage.insert_rows,
+        logger=_quiet_logger(),
+        bq_client=client,
+        dataset="bench",
+        table="ohlcv",
+        page_limit=1000,
+        backoff_cfg=NO_BACKOFF,
+    )
+    return {"candles": client.rows, "requests": exchange.requests}
+
+
+def bench_history_replay(symbols: int = 2, candles_per_symbol: int = 50_000) -> Dict[str, int]:
+    """history_loop served offline from recorded pages: requests must stay 0."""
+    cache = PageCache(_recorded_page_cache(symbols, candles_per_symbol))
+    return _run_history(symbols, candles_per_symbol, CachingPageFetcher(cache, offline=True))
+
+
+def bench_live_loop(symbols: int = 300, cycles: int = 10) -> Dict[str, int]:
+    exchanges = [FakeExchange(exchange_id=f"fake{i}", candle_count=1000) for i in range(3)]
+    client = FakeBigQueryClient()
+    tasks = [(ex, f"SYM{i}/USDT", tf) for ex in exchanges for i in range(symbols // 3) for tf in ("1m", "1h")]
+    seen = {"cycles": 0}
+
+    def stop_after_cycles(_delay):
+        seen["cycles"] += 1
+        if seen["cycles"] >= cycles:
+            raise _StopLoop()
+
+    try:
+        run_live_loop(
+            0,
+            tasks,
+            storage_fn=storage.insert_rows,
+            logger=_quiet_logger(),
+            bq_client=client,
+            dataset="bench",
+            table="ohlcv",
+            backoff_cfg=NO_BACKOFF,
+            sleep_fn=stop_after_cycles,
+        )
+    except _StopLoop:
+        pass
+    return {"candles": client.rows, "requests": sum(ex.requests for ex in exchanges)}
+
+
+STAGES: Dict[str, Callable[[], Dict[str, int]]] = {
+    "adapter_history_pages": bench_adapter_history_pages,
+    "adapter_live_records": bench_adapter_live_records,
+    "storage_insert": bench_storage_insert,
+    "history_loop": bench_history_loop,
+    "history_replay": bench_history_replay,
+    "live_loop": bench_live_loop,
+}
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> Dict[str, str]:
+    regressions = {}
+    for stage, result in results.items():
+        expected = baseline.get(stage, {}).get("candles_per_s")
+        if expected and result["candles_per_s"] < expected * (1 - tolerance):
+            regressions[stage] = f"{result['candles_per_s']} candles/s vs baseline {expected}"
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="TDA collector offline benchmarks")
+    parser.add_argument("--stage", action="append", choices=sorted(STAGES), help="run only these stages")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH))
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed candles/sec drop (fraction)")
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak-memory pass")
+    args = parser.parse_args()
+
+    if "history_replay" in (args.stage or STAGES):
+        _recorded_page_cache(2, 50_000)  # record outside the timed replay
+    results = {name: _measure(STAGES[name], not args.no_memory) for name in (args.stage or STAGES)}
+    for name, result in results.items():
+        print(json.dumps({"stage": name, **result}))
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+        baseline.update(results)
+        baseline_path.write_text(json.dumps(baseline, indent=2, sort_keys=True) + "\n")
+        print(f"baseline written to {baseline_path}")
+        return 0
+
+    if not baseline_path.exists():
+        print(f"no baseline at {baseline_path}; run with --update-baseline first")
+        return 0
+    regressions = compare(results, json.loads(baseline_path.read_text()), args.tolerance)
+    for stage, detail in regressions.items():
+        print(f"REGRESSION {stage}: {detail}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
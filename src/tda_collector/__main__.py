@@ -1,5 +1,9 @@
 import argparse
+import functools
 import os
+import signal
+import sys
+import threading
 from datetime import datetime, timezone
 from pathlib import Path
 
@@ -7,10 +11,26 @@ from dotenv import load_dotenv
 from google.cloud import bigquery
 
 from tda_collector import adapter
+from tda_collector.catchup import CatchUpFetcher, HighWaterMarks, HighWaterSink
+from tda_collector.checkpoint import CheckpointStore
 from tda_collector.config import load_config
+from tda_collector.coverage import fetch_high_water_marks, plan_repair_tasks
+from tda_collector.dedup import LastWrittenCache
 from tda_collector.logging_util import build_logger, env_labels, log_struct
-from tda_collector.scheduler import run_history_loop, run_live_loop
-from tda_collector.storage import ensure_table
+from tda_collector.market_cache import MarketCache
+from tda_collector.metrics import start_metrics_server
+from tda_collector.pagecache import CachingPageFetcher, PageCache
+from tda_collector.probing import PageLimitCache
+from tda_collector.resample import ResamplingFetcher, ResamplingSink, plan_derived_tasks
+from tda_collector.ringbuffer import RingFeedingSink, RingStore, start_query_server, warm_ring_store
+from tda_collector.sinks import build_local_sinks, fan_out
+from tda_collector.sharding import run_local_shards, scale_rate_limits, select_shard, shard_dir, weight_by_frequency
+from tda_collector.scheduler import run_aligned_live_loop, run_history_loop, run_live_loop
+from tda_collector.spool import Spool, SpoolingSink, SpoolReplayer
+from tda_collector.storage import LoadJobSink, ensure_table, insert_rows
+from tda_collector.streaming import run_stream_loop
+from tda_collector.universe import LiveTaskSet, UniverseRefresher, resolve_universe
+from tda_collector.writer import BatchWriter
 
 
 def parse_iso8601_to_ms(value: str) -> int:
@@ -31,12 +51,61 @@ def parse_iso8601_to_ms(value: str) -> int:
 
 def parse_args():
     parser = argparse.ArgumentParser(description="TDA Large Collector")
-    parser.add_argument("--mode", choices=["live", "history"], default="live")
+    parser.add_argument("--mode", choices=["live", "stream", "history", "repair"], default="live")
     parser.add_argument("--config", default=os.environ.get("CONFIG_PATH", "./config.yaml"))
-    parser.add_argument("--start", help="ISO8601 start for history mode")
-    parser.add_argument("--end", help="ISO8601 end for history mode (optional)")
+    parser.add_argument("--start", help="ISO8601 start for history/repair mode")
+    parser.add_argument("--end", help="ISO8601 end for history/repair mode (optional)")
+    parser.add_argument(
+        "--history-sink",
+        choices=["stream", "load"],
+        default=os.environ.get("HISTORY_SINK", "stream"),
+        help="history writes via streaming inserts or staged BigQuery load jobs",
+    )
+    parser.add_argument("--staging-dir", default=os.environ.get("STAGING_DIR"), help="local staging dir for load jobs")
+    parser.add_argument(
+        "--checkpoint-path",
+        default=os.environ.get("CHECKPOINT_PATH", "./history_checkpoints.sqlite"),
+        help="SQLite file with committed history cursors",
+    )
+    parser.add_argument("--resume", action="store_true", help="skip history ranges already committed")
+    parser.add_argument(
+        "--page-cache-offline",
+        action="store_true",
+        help="history pages come only from settings.page_cache_dir recordings (no exchange requests)",
+    )
     parser.add_argument("--dataset", default=os.environ.get("BQ_DATASET", "crypto"))
     parser.add_argument("--table", default=os.environ.get("BQ_TABLE", "market_data_ohlcv"))
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=int(os.environ.get("METRICS_PORT", "0")),
+        help="serve Prometheus metrics on this port (0 disables)",
+    )
+    parser.add_argument(
+        "--query-port",
+        type=int,
+        default=int(os.environ.get("QUERY_PORT", "0")),
+        help="serve recent candles from memory on this port in live/stream mode (0 disables)",
+    )
+    parser.add_argument("--query-host", default=os.environ.get("QUERY_HOST", "127.0.0.1"))
+    parser.add_argument(
+        "--shard-index",
+        type=int,
+        default=int(os.environ.get("SHARD_INDEX", "0")),
+        help="this process's shard (0-based) when tasks are split across processes/pods",
+    )
+    parser.add_argument(
+        "--shard-count",
+        type=int,
+        default=int(os.environ.get("SHARD_COUNT", "1")),
+        help="total number of shards; 1 runs every task",
+    )
+    parser.add_argument(
+        "--local-shards",
+        type=int,
+        default=0,
+        help="run this many shard processes on this host (sets --shard-index/--shard-count per child)",
+    )
     parser.add_argument("--backoff-base", type=float, default=None)
     parser.add_argument("--backoff-factor", type=float, default=None)
     parser.add_argument("--backoff-max", type=float, default=None)
@@ -44,14 +113,104 @@ def parse_args():
     return parser.parse_args()
 
 
+def _build_live_storage(cfg, bq_client, logger, backoff_cfg):
+    """Compose the live storage_fn from settings; returns it with shutdown hooks in call order."""
+    settings = cfg.settings
+    storage_fn = functools.partial(insert_rows, insert_ids=settings.bq_insert_ids)
+    shutdown_hooks = []
+
+    spool = replayer = None
+    if settings.spool_enabled:
+        spool = Spool(
+            settings.spool_dir,
+            segment_max_bytes=settings.spool_segment_bytes,
+            max_total_bytes=settings.spool_max_bytes,
+            logger=logger,
+        )
+        replayer = SpoolReplayer(
+            spool,
+            bq_client,
+            interval_seconds=settings.spool_replay_interval_seconds,
+            batch_rows=settings.spool_replay_batch_rows,
+            logger=logger,
+        ).start()
+
+    if settings.writer_enabled:
+        writer = BatchWriter(
+            max_rows=settings.writer_max_rows,
+            max_bytes=settings.writer_max_bytes,
+            max_latency_seconds=settings.writer_max_latency_seconds,
+            queue_size=settings.writer_queue_size,
+            logger=logger,
+            backoff_cfg=backoff_cfg,
+            insert_ids=settings.bq_insert_ids,
+            spool=spool,
+        )
+        # The writer itself, not writer.submit: wrappers find its after_commit().
+        storage_fn = writer
+        shutdown_hooks.append(writer.close)
+    elif spool:
+        storage_fn = SpoolingSink(
+            storage_fn,
+            spool,
+            logger=logger,
+            backoff_cfg=backoff_cfg,
+            probe_interval_seconds=settings.spool_replay_interval_seconds,
+            insert_ids=settings.bq_insert_ids,
+        )
+
+    if spool:
+        shutdown_hooks.extend([replayer.stop, spool.close])
+    return storage_fn, shutdown_hooks
+
+
+def _seed_high_water_marks(cfg, args, bq_client, tasks, logger):
+    """Newest stored bar per live task from BigQuery, so catch-up starts where the last run stopped."""
+    labels = {**env_labels(), "mode": args.mode}
+    if bq_client is None:
+        return {}
+    since_ms = int(datetime.now(tz=timezone.utc).timestamp() * 1000) - int(
+        cfg.settings.live_catchup_lookback_seconds * 1000
+    )
+    series = {(client.id, symbol, timeframe) for client, symbol, timeframe in tasks}
+    try:
+        marks = fetch_high_water_marks(bq_client, args.dataset, args.table, series, since_ms)
+    except Exception as exc:
+        # Catch-up still covers gaps that start after this process wrote its first bars.
+        log_struct(logger, labels, {"event": "live_high_water_error", "error": str(exc)})
+        return {}
+    log_struct(logger, labels, {"event": "live_high_water_seeded", "series": len(series), "marks": len(marks)})
+    return marks
+
+
+def _live_tasks(clients, universe, priorities):
+    """(client, symbol, timeframe) for every resolved pair; records pair priorities."""
+    tasks = []
+    for ex_name, pairs in universe.items():
+        for pair in pairs:
+            priorities[(ex_name, pair.symbol)] = pair.priority
+            tasks.extend((clients[ex_name], pair.symbol, tf) for tf in pair.timeframes)
+    return tasks
+
+
+def _exit_on_sigterm(signum, frame):
+    # Turn SIGTERM into SystemExit so finally blocks (writer flush) run on container stop.
+    sys.exit(0)
+
+
 def main():
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+
     # Local convenience: load .env if present (noop in docker if not provided)
     env_path = Path(".env")
     if env_path.exists():
         load_dotenv(env_path, override=True)
 
     args = parse_args()
+    if args.local_shards > 1:
+        sys.exit(run_local_shards(sys.argv[1:], args.local_shards, args.metrics_port, query_port=args.query_port))
     cfg = load_config(args.config)
+    cfg.settings.spool_dir = shard_dir(cfg.settings.spool_dir, args.shard_index, args.shard_count)
     logger = build_logger(
         service_name=env_labels()["service_name"],
         environment=env_labels()["environment"],
@@ -60,26 +219,35 @@ def main():
         loki_password=os.environ.get("LOKI_PASSWORD"),
     )
 
-    bq_client = bigquery.Client()
-    ensure_table(bq_client, args.dataset, args.table)
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+
+    use_bigquery = any(spec["type"] == "bigquery" for spec in cfg.settings.sinks)
+    bq_client = None
+    if use_bigquery or args.mode == "repair":
+        bq_client = bigquery.Client()
+        ensure_table(bq_client, args.dataset, args.table)
+    local_sinks = build_local_sinks(cfg.settings.sinks, args.shard_index, args.shard_count)
 
     start_ms = end_ms = None
-    if args.mode == "history":
+    if args.mode in ("history", "repair"):
         if not args.start:
-            raise ValueError("--start is required for history mode")
+            raise ValueError(f"--start is required for {args.mode} mode")
         start_ms = parse_iso8601_to_ms(args.start)
         end_input = args.end or datetime.now(tz=timezone.utc).isoformat()
         end_ms = parse_iso8601_to_ms(end_input)
 
-    tasks_live = []
+    market_cache = None
+    if cfg.settings.market_cache_dir:
+        market_cache = MarketCache(cfg.settings.market_cache_dir, cfg.settings.market_cache_ttl_seconds)
+
+    clients = {ex_name: adapter.build_client(ex_name, market_cache) for ex_name in cfg.exchanges}
+    universe = resolve_universe(clients, cfg.exchanges, cfg.selectors, logger, mode=args.mode)
+    priorities = {}
+    tasks_live = _live_tasks(clients, universe, priorities)
     tasks_history = []
-    for ex_name, pairs in cfg.exchanges.items():
-        client = adapter.build_client(ex_name)
-        for pair in pairs:
-            for tf in pair.timeframes:
-                tasks_live.append((client, pair.symbol, tf))
-                if args.mode == "history":
-                    tasks_history.append((client, pair.symbol, tf, start_ms, end_ms))
+    if args.mode in ("history", "repair"):
+        tasks_history = [(client, symbol, tf, start_ms, end_ms) for client, symbol, tf in tasks_live]
 
     log_struct(logger, {**env_labels(), "mode": args.mode}, {"event": "config_loaded"})
 
@@ -89,27 +257,211 @@ def main():
         "max_delay": args.backoff_max or cfg.settings.backoff_max,
         "max_attempts": args.backoff_attempts or cfg.settings.backoff_attempts,
     }
+    guard_cfg = {
+        "capacity": cfg.settings.rate_limit_burst,
+        "failure_threshold": cfg.settings.breaker_failure_threshold,
+        "cooldown_seconds": cfg.settings.breaker_cooldown_seconds,
+    }
 
-    if args.mode == "live":
-        run_live_loop(
-            cfg.settings.update_interval_seconds,
-            tasks_live,
-            logger=logger,
-            bq_client=bq_client,
-            dataset=args.dataset,
-            table=args.table,
-            backoff_cfg=backoff_cfg,
+    resample_plan = {}
+    if cfg.settings.derive_timeframes and args.mode in ("live", "history"):
+        tasks_live, resample_plan = plan_derived_tasks(tasks_live)
+        tasks_history, _ = plan_derived_tasks(tasks_history)
+
+    # Each shard resolves selectors on its own, so their universes can briefly differ.
+    # Weighted assignment depends on the whole set; a per-key hash keeps every series
+    # on one shard whatever the others saw.
+    shard_weighted = cfg.settings.shard_weight_by_timeframe and not cfg.selectors
+    if args.shard_count > 1:
+        shard_weighted = shard_weighted and weight_by_frequency(args.mode, cfg.settings.live_schedule)
+        tasks_live, shares = select_shard(tasks_live, args.shard_index, args.shard_count, shard_weighted)
+        tasks_history, _ = select_shard(tasks_history, args.shard_index, args.shard_count, shard_weighted)
+        scale_rate_limits({task[0].id: task[0] for task in tasks_live}.values(), shares)
+        log_struct(
+            logger,
+            {**env_labels(), "mode": args.mode},
+            {
+                "event": "shard_selected",
+                "shard_index": args.shard_index,
+                "shard_count": args.shard_count,
+                "tasks": len(tasks_history) if args.mode in ("history", "repair") else len(tasks_live),
+            },
         )
+
+    refresh_universe = args.mode == "live" and bool(cfg.selectors) and cfg.settings.universe_refresh_seconds > 0
+
+    def build_refreshed_tasks(resolved):
+        # Same derivation and shard selection as at startup; rate limits keep their startup scale.
+        tasks = _live_tasks(clients, resolved, priorities)
+        if cfg.settings.derive_timeframes:
+            tasks, plan = plan_derived_tasks(tasks)
+            resample_plan.update(plan)
+        if args.shard_count > 1:
+            tasks, _ = select_shard(tasks, args.shard_index, args.shard_count, shard_weighted)
+        return tasks
+
+    if args.mode in ("live", "stream"):
+        live_storage_fn, shutdown_hooks = None, []
+        if use_bigquery:
+            live_storage_fn, shutdown_hooks = _build_live_storage(cfg, bq_client, logger, backoff_cfg)
+        live_storage_fn = fan_out(live_storage_fn, local_sinks)
+        shutdown_hooks.extend(sink.close for sink in local_sinks)
+        change_cache = LastWrittenCache() if cfg.settings.live_skip_unchanged else None
+        live_fetch_fn = adapter.fetch_last_two
+        if args.mode == "live" and cfg.settings.live_catchup_limit:
+            marks = HighWaterMarks(_seed_high_water_marks(cfg, args, bq_client, tasks_live, logger))
+            live_fetch_fn = CatchUpFetcher(
+                marks,
+                page_limit=cfg.settings.live_catchup_limit,
+                max_pages=cfg.settings.live_catchup_max_pages,
+                logger=logger,
+            )
+            live_storage_fn = HighWaterSink(live_storage_fn, marks)
+        if resample_plan or (refresh_universe and cfg.settings.derive_timeframes):
+            live_fetch_fn = ResamplingFetcher(
+                resample_plan, fetch_fn=live_fetch_fn, seed_page_limit=cfg.settings.history_page_limit
+            )
+        if args.query_port:
+            ring_store = RingStore(cfg.settings.ring_buffer_size)
+            live_storage_fn = RingFeedingSink(live_storage_fn, ring_store)
+            # Derived timeframes are warmed straight from the exchange too.
+            ring_tasks = list(tasks_live)
+            for client, symbol, timeframe in tasks_live:
+                _, targets = resample_plan.get((client.id, symbol, timeframe), (0, []))
+                ring_tasks.extend((client, symbol, target) for target, _ in targets)
+            threading.Thread(
+                target=warm_ring_store,
+                args=(ring_store, ring_tasks, logger),
+                kwargs={"mode": args.mode},
+                name="ring-warm",
+                daemon=True,
+            ).start()
+            start_query_server(ring_store, args.query_port, args.query_host)
+        task_set = None
+        if refresh_universe:
+            task_set = LiveTaskSet(tasks_live)
+            refresher = UniverseRefresher(
+                clients,
+                cfg.exchanges,
+                cfg.selectors,
+                universe,
+                build_refreshed_tasks,
+                task_set,
+                interval_seconds=cfg.settings.universe_refresh_seconds,
+                market_cache=market_cache,
+                logger=logger,
+            ).start()
+            shutdown_hooks.insert(0, refresher.stop)
+        try:
+            if args.mode == "stream":
+                run_stream_loop(
+                    tasks_live,
+                    storage_fn=live_storage_fn,
+                    logger=logger,
+                    bq_client=bq_client,
+                    dataset=args.dataset,
+                    table=args.table,
+                    backoff_cfg=backoff_cfg,
+                    client_factory=functools.partial(adapter.build_pro_client, market_cache=market_cache),
+                    flush_interval_seconds=cfg.settings.stream_flush_seconds,
+                    gap_page_limit=cfg.settings.history_page_limit,
+                    change_cache=change_cache,
+                )
+            elif cfg.settings.live_schedule == "aligned":
+                run_aligned_live_loop(
+                    tasks_live,
+                    fetch_fn=live_fetch_fn,
+                    storage_fn=live_storage_fn,
+                    logger=logger,
+                    bq_client=bq_client,
+                    dataset=args.dataset,
+                    table=args.table,
+                    backoff_cfg=backoff_cfg,
+                    workers_per_exchange=cfg.settings.live_workers_per_exchange,
+                    change_cache=change_cache,
+                    guard_cfg=guard_cfg,
+                    priorities=priorities,
+                    settle_seconds=cfg.settings.candle_settle_seconds,
+                    forming_refresh_seconds=cfg.settings.forming_refresh_seconds,
+                    task_set=task_set,
+                )
+            else:
+                run_live_loop(
+                    cfg.settings.update_interval_seconds,
+                    tasks_live,
+                    fetch_fn=live_fetch_fn,
+                    storage_fn=live_storage_fn,
+                    logger=logger,
+                    bq_client=bq_client,
+                    dataset=args.dataset,
+                    table=args.table,
+                    backoff_cfg=backoff_cfg,
+                    workers_per_exchange=cfg.settings.live_workers_per_exchange,
+                    change_cache=change_cache,
+                    guard_cfg=guard_cfg,
+                    priorities=priorities,
+                    task_set=task_set,
+                )
+        finally:
+            for hook in shutdown_hooks:
+                hook()
     else:
-        run_history_loop(
-            tasks_history,
-            logger=logger,
-            bq_client=bq_client,
-            dataset=args.dataset,
-            table=args.table,
-            page_limit=cfg.settings.history_page_limit,
-            backoff_cfg=backoff_cfg,
-        )
+        if args.mode == "repair":
+            window_tasks = len(tasks_history)
+            tasks_history = plan_repair_tasks(tasks_history, bq_client, args.dataset, args.table)
+            log_struct(
+                logger,
+                {**env_labels(), "mode": args.mode},
+                {"event": "repair_gaps_found", "series": window_tasks, "gaps": len(tasks_history)},
+            )
+        fetch_page_fn = adapter.fetch_history_page
+        if cfg.settings.page_cache_dir:
+            fetch_page_fn = CachingPageFetcher(PageCache(cfg.settings.page_cache_dir), offline=args.page_cache_offline)
+        elif args.page_cache_offline:
+            raise ValueError("--page-cache-offline needs settings.page_cache_dir")
+        history_storage_fn = insert_rows if use_bigquery else None
+        checkpoints = CheckpointStore(args.checkpoint_path)
+        load_sink = None
+        if use_bigquery and args.history_sink == "load":
+            load_sink = LoadJobSink(
+                staging_dir=args.staging_dir,
+                chunk_rows=cfg.settings.load_job_chunk_rows,
+                logger=logger,
+            )
+            history_storage_fn = load_sink
+        history_storage_fn = fan_out(history_storage_fn, local_sinks)
+        resampling_sink = None
+        if resample_plan:
+            resampling_sink = ResamplingSink(history_storage_fn, resample_plan)
+            history_storage_fn = resampling_sink
+        try:
+            run_history_loop(
+                tasks_history,
+                fetch_page_fn=fetch_page_fn,
+                storage_fn=history_storage_fn,
+                logger=logger,
+                bq_client=bq_client,
+                dataset=args.dataset,
+                table=args.table,
+                page_limit=cfg.settings.history_page_limit,
+                backoff_cfg=backoff_cfg,
+                workers_per_exchange=cfg.settings.history_workers_per_exchange,
+                shard_pages=cfg.settings.history_shard_pages,
+                checkpoints=checkpoints,
+                resume=args.resume,
+                guard_cfg=guard_cfg,
+                page_limits=PageLimitCache(cfg.settings.page_limit_cache_path or None),
+                max_page_limit=cfg.settings.history_max_page_limit,
+                probe_listing=cfg.settings.history_probe_listing,
+            )
+        finally:
+            if resampling_sink:
+                resampling_sink.close()
+            if load_sink:
+                load_sink.close()
+            for sink in local_sinks:
+                sink.close()
+            checkpoints.close()
 
 
 if __name__ == "__main__":
@@ -1,14 +1,36 @@
 from datetime import datetime, timezone
-from typing import Any, List, Tuple
+from typing import Any, List, Optional, Tuple
 
 import ccxt
 
-from tda_collector.models import OHLCVRecord
+from tda_collector.market_cache import MarketCache
+from tda_collector.models import CandleBatch, OHLCVRecord
 
 
-def build_client(exchange_id: str) -> ccxt.Exchange:
+def build_client(exchange_id: str, market_cache: Optional[MarketCache] = None) -> ccxt.Exchange:
     cls = getattr(ccxt, exchange_id)
-    return cls({"enableRateLimit": True})
+    client = cls({"enableRateLimit": True})
+    if market_cache:
+        try:
+            market_cache.preload(client)
+        except ccxt.BaseError:
+            # Exchange unreachable right now; markets load lazily on the first request as before.
+            pass
+    return client
+
+
+def build_pro_client(exchange_id: str, market_cache: Optional[MarketCache] = None):
+    """Async ccxt.pro client for WebSocket streaming (same exchange id as build_client)."""
+    import ccxt.pro
+
+    cls = getattr(ccxt.pro, exchange_id)
+    client = cls({"enableRateLimit": True})
+    if market_cache:
+        # Written by the REST client's preload; async clients only take the cached copy.
+        cached = market_cache.load(exchange_id)
+        if cached is not None:
+            client.set_markets(*cached)
+    return client
 
 
 def fetch_last_two(
@@ -31,11 +53,11 @@ def fetch_history_page(
     timeframe: str,
     since_ms: int,
     limit: int = 200,
-) -> List[OHLCVRecord]:
+) -> CandleBatch:
     candles: List[List[Any]] = client.fetch_ohlcv(
         symbol, timeframe=timeframe, since=since_ms, limit=limit
     )
-    return [_to_record(client.id, symbol, timeframe, c) for c in candles]
+    return CandleBatch.from_ohlcv(client.id, symbol, timeframe, candles)
 
 
 def _to_record(
@@ -0,0 +1,117 @@
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from tda_collector.adapter import fetch_history_page, fetch_last_two
+from tda_collector.checkpoint import after_commit
+from tda_collector.logging_util import env_labels, log_struct
+from tda_collector.metrics import LIVE_CATCHUP_ROWS
+from tda_collector.models import OHLCVRecord
+from tda_collector.timeframes import candle_open_ms, timeframe_ms
+
+SeriesKey = Tuple[str, str, str]
+
+
+class HighWaterMarks:
+    """Open time of the newest bar written per (exchange, symbol, timeframe)."""
+
+    def __init__(self, marks: Optional[Dict[SeriesKey, int]] = None):
+        self._lock = threading.Lock()
+        self._marks: Dict[SeriesKey, int] = dict(marks or {})
+
+    def get(self, key: SeriesKey) -> Optional[int]:
+        with self._lock:
+            return self._marks.get(key)
+
+    def advance(self, rows: Iterable[OHLCVRecord]) -> None:
+        with self._lock:
+            for row in rows:
+                key = (row.exchange, row.symbol, row.timeframe)
+                ts_ms = int(row.timestamp.timestamp() * 1000)
+                if ts_ms > self._marks.get(key, -1):
+                    self._marks[key] = ts_ms
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._marks)
+
+
+class HighWaterSink:
+    """
+    Live storage_fn wrapper that advances the high-water marks once rows are committed:
+    after the BatchWriter flushed them, or right away for a synchronous sink that
+    returned. Rows the writer drops leave the mark behind, so catch-up fetches them again.
+    """
+
+    def __init__(self, storage_fn: Callable, marks: HighWaterMarks):
+        self.storage_fn = storage_fn
+        self.marks = marks
+
+    def __call__(self, bq_client, dataset: str, table: str, rows: List[OHLCVRecord]) -> None:
+        self.storage_fn(bq_client, dataset, table, rows)
+        after_commit(self.storage_fn, lambda: self.marks.advance(rows))
+
+    def after_commit(self, callback: Callable[[], None]) -> None:
+        after_commit(self.storage_fn, callback)
+
+
+class CatchUpFetcher:
+    """
+    Live fetch_fn that resumes each series from its high-water mark. When at most
+    two bars are due (the usual cycle) it is fetch_fn unchanged; after a restart or
+    outage it asks for every bar since the mark in one request of up to page_limit
+    candles, and pages through longer gaps, at most max_pages per cycle (the next
+    cycle continues from the new mark).
+    """
+
+    def __init__(
+        self,
+        marks: HighWaterMarks,
+        fetch_fn: Callable = fetch_last_two,
+        page_fn: Callable = fetch_history_page,
+        page_limit: int = 1000,
+        max_pages: int = 10,
+        logger=None,
+        now_fn: Optional[Callable[[], float]] = None,
+    ):
+        self.marks = marks
+        self.fetch_fn = fetch_fn
+        self.page_fn = page_fn
+        self.page_limit = max(2, page_limit)
+        self.max_pages = max(1, max_pages)
+        self.logger = logger
+        self.now_fn = now_fn or (lambda: datetime.now(tz=timezone.utc).timestamp())
+
+    def __call__(self, client, symbol: str, timeframe: str) -> List[OHLCVRecord]:
+        mark = self.marks.get((client.id, symbol, timeframe))
+        if mark is None:
+            return list(self.fetch_fn(client, symbol, timeframe))
+        step_ms = timeframe_ms(client, timeframe)
+        current_open = candle_open_ms(int(self.now_fn() * 1000), timeframe, step_ms)
+        # Bars from the mark (re-fetched: it may have been forming) to the current one.
+        due = -(-(current_open - mark) // step_ms) + 1
+        if due <= 2:
+            return list(self.fetch_fn(client, symbol, timeframe))
+
+        rows: List[OHLCVRecord] = []
+        cursor, pages = mark, 0
+        while pages < self.max_pages:
+            page = self.page_fn(client, symbol, timeframe, cursor, max(2, min(due, self.page_limit)))
+            pages += 1
+            if not page:
+                break
+            rows.extend(page.records())
+            if page.last_ms <= cursor or page.last_ms >= current_open:
+                break
+            due -= len(page)
+            cursor = page.last_ms + step_ms
+        if not rows:
+            # Nothing after the mark (exchange gap); keep the series live.
+            return list(self.fetch_fn(client, symbol, timeframe))
+        LIVE_CATCHUP_ROWS.inc(len(rows), exchange=client.id)
+        log_struct(
+            self.logger,
+            {**env_labels(), "mode": "live", "exchange": client.id, "symbol": symbol, "timeframe": timeframe},
+            {"event": "live_catchup", "from_ms": mark, "rows": len(rows), "pages": pages},
+        )
+        return rows
@@ -0,0 +1,99 @@
+import sqlite3
+import threading
+import time
+from typing import List, Tuple
+
+
+class CheckpointStore:
+    """
+    Durable history progress in a local SQLite file.
+
+    Each row records the committed cursor of one history range
+    (exchange, symbol, timeframe, range_start_ms): everything in
+    [range_start_ms, cursor_ms) has been handed to storage successfully.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        # Shard processes may share the file; wait for each other's short writes.
+        self._conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS history_checkpoints (
+                exchange TEXT NOT NULL,
+                symbol TEXT NOT NULL,
+                timeframe TEXT NOT NULL,
+                range_start_ms INTEGER NOT NULL,
+                range_end_ms INTEGER NOT NULL,
+                cursor_ms INTEGER NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (exchange, symbol, timeframe, range_start_ms)
+            )
+            """
+        )
+
+    def record(
+        self,
+        exchange: str,
+        symbol: str,
+        timeframe: str,
+        range_start_ms: int,
+        range_end_ms: int,
+        cursor_ms: int,
+    ) -> None:
+        with self._lock:
+            self._conn.execute(
+                """
+                INSERT INTO history_checkpoints
+                    (exchange, symbol, timeframe, range_start_ms, range_end_ms, cursor_ms, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (exchange, symbol, timeframe, range_start_ms) DO UPDATE SET
+                    range_end_ms = MAX(range_end_ms, excluded.range_end_ms),
+                    cursor_ms = MAX(cursor_ms, excluded.cursor_ms),
+                    updated_at = excluded.updated_at
+                """,
+                (exchange, symbol, timeframe, range_start_ms, range_end_ms, cursor_ms, time.time()),
+            )
+
+    def committed_ranges(self, exchange: str, symbol: str, timeframe: str) -> List[Tuple[int, int]]:
+        """Committed [start_ms, cursor_ms) intervals for one series, ordered by start."""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT range_start_ms, cursor_ms FROM history_checkpoints
+                WHERE exchange = ? AND symbol = ? AND timeframe = ?
+                ORDER BY range_start_ms
+                """,
+                (exchange, symbol, timeframe),
+            ).fetchall()
+        return [(int(start), int(cursor)) for start, cursor in rows]
+
+    def resume_cursor(self, exchange: str, symbol: str, timeframe: str, start_ms: int) -> int:
+        """
+        First uncommitted timestamp at or after start_ms. Works across runs with
+        different range boundaries (e.g. another shard size) because it walks every
+        committed interval of the series.
+        """
+        cursor = start_ms
+        for range_start, committed in self.committed_ranges(exchange, symbol, timeframe):
+            if range_start <= cursor < committed:
+                cursor = committed
+        return cursor
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def after_commit(storage_fn, callback) -> None:
+    """
+    Run callback once the rows just passed to storage_fn are durable. Sinks that
+    stage rows (LoadJobSink) expose after_commit() to defer it until their commit.
+    """
+    defer = getattr(storage_fn, "after_commit", None)
+    if callable(defer):
+        defer(callback)
+    else:
+        callback()
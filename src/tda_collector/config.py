@@ -1,10 +1,14 @@
 import os
+import re
 from pathlib import Path
 from typing import Dict, List
 
 import yaml
 
-from tda_collector.models import Config, Settings, ExchangePair
+from tda_collector.models import Config, Settings, ExchangePair, SymbolSelector
+
+LIVE_SCHEDULES = {"interval", "aligned"}
+SINK_TYPES = {"bigquery", "sqlite", "duckdb", "parquet"}
 
 
 def load_config(path: str) -> Config:
@@ -25,21 +29,94 @@ def load_config(path: str) -> Config:
         backoff_max=float(settings_data.get("backoff_max", 32.0)),
         backoff_attempts=int(settings_data.get("backoff_attempts", 5)),
         history_page_limit=int(settings_data.get("history_page_limit", 200)),
+        history_workers_per_exchange=int(settings_data.get("history_workers_per_exchange", 1)),
+        history_shard_pages=int(settings_data.get("history_shard_pages", 10)),
+        live_workers_per_exchange=int(settings_data.get("live_workers_per_exchange", 1)),
+        live_schedule=str(settings_data.get("live_schedule", "interval")),
+        candle_settle_seconds=float(settings_data.get("candle_settle_seconds", 2.0)),
+        forming_refresh_seconds=float(settings_data.get("forming_refresh_seconds", 0)),
+        writer_enabled=bool(settings_data.get("writer_enabled", False)),
+        writer_max_rows=int(settings_data.get("writer_max_rows", 500)),
+        writer_max_bytes=int(settings_data.get("writer_max_bytes", 5_000_000)),
+        writer_max_latency_seconds=float(settings_data.get("writer_max_latency_seconds", 2.0)),
+        writer_queue_size=int(settings_data.get("writer_queue_size", 10_000)),
+        live_skip_unchanged=bool(settings_data.get("live_skip_unchanged", True)),
+        bq_insert_ids=bool(settings_data.get("bq_insert_ids", False)),
+        spool_enabled=bool(settings_data.get("spool_enabled", False)),
+        spool_dir=str(settings_data.get("spool_dir", "./spool")),
+        spool_segment_bytes=int(settings_data.get("spool_segment_bytes", 8 * 1024 * 1024)),
+        spool_max_bytes=int(settings_data.get("spool_max_bytes", 1024 * 1024 * 1024)),
+        spool_replay_interval_seconds=float(settings_data.get("spool_replay_interval_seconds", 30.0)),
+        spool_replay_batch_rows=int(settings_data.get("spool_replay_batch_rows", 500)),
+        load_job_chunk_rows=int(settings_data.get("load_job_chunk_rows", 500_000)),
+        rate_limit_burst=float(settings_data.get("rate_limit_burst", 1.0)),
+        breaker_failure_threshold=int(settings_data.get("breaker_failure_threshold", 5)),
+        breaker_cooldown_seconds=float(settings_data.get("breaker_cooldown_seconds", 30.0)),
+        stream_flush_seconds=float(settings_data.get("stream_flush_seconds", 1.0)),
+        derive_timeframes=bool(settings_data.get("derive_timeframes", False)),
+        history_max_page_limit=int(settings_data.get("history_max_page_limit", 5000)),
+        history_probe_listing=bool(settings_data.get("history_probe_listing", True)),
+        page_limit_cache_path=str(settings_data.get("page_limit_cache_path", "./page_limits.json")),
+        market_cache_dir=str(settings_data.get("market_cache_dir", "./market_cache")),
+        market_cache_ttl_seconds=float(settings_data.get("market_cache_ttl_seconds", 86_400)),
+        shard_weight_by_timeframe=bool(settings_data.get("shard_weight_by_timeframe", True)),
+        ring_buffer_size=int(settings_data.get("ring_buffer_size", 500)),
+        page_cache_dir=str(settings_data.get("page_cache_dir", "") or ""),
+        live_catchup_limit=int(settings_data.get("live_catchup_limit", 1000)),
+        live_catchup_max_pages=int(settings_data.get("live_catchup_max_pages", 10)),
+        live_catchup_lookback_seconds=float(settings_data.get("live_catchup_lookback_seconds", 7 * 86_400)),
+        universe_refresh_seconds=float(settings_data.get("universe_refresh_seconds", 3600)),
+        sinks=[
+            {"type": str(spec)} if isinstance(spec, str) else {**spec, "type": str(spec.get("type"))}
+            for spec in settings_data.get("sinks") or ["bigquery"]
+        ],
     )
 
+    if settings.live_schedule not in LIVE_SCHEDULES:
+        raise ValueError(
+            f"settings.live_schedule must be one of {sorted(LIVE_SCHEDULES)}, got {settings.live_schedule!r}"
+        )
+
+    for spec in settings.sinks:
+        if spec["type"] not in SINK_TYPES:
+            raise ValueError(f"settings.sinks types must be in {sorted(SINK_TYPES)}, got {spec['type']!r}")
+
     exchanges: Dict[str, List[ExchangePair]] = {}
+    selectors: Dict[str, List[SymbolSelector]] = {}
     for ex_name, pairs in exchanges_data.items():
         ex_pairs: List[ExchangePair] = []
         if not pairs:
             continue
         for pair in pairs:
+            if "select" in pair:
+                selectors.setdefault(ex_name, []).append(_parse_selector(ex_name, pair))
+                continue
             ex_pairs.append(
                 ExchangePair(
                     symbol=str(pair["symbol"]),
                     timeframes=[str(tf) for tf in pair.get("timeframes", [])],
+                    priority=int(pair.get("priority", 0)),
                 )
             )
         exchanges[ex_name] = ex_pairs
 
-    return Config(settings=settings, exchanges=exchanges)
+    return Config(settings=settings, exchanges=exchanges, selectors=selectors)
+
+
+def _parse_selector(ex_name: str, entry: Dict) -> SymbolSelector:
+    rule = entry.get("select") or {}
+    regex = rule.get("regex")
+    if regex is not None:
+        try:
+            re.compile(str(regex))
+        except re.error as exc:
+            raise ValueError(f"exchanges.{ex_name} select.regex {regex!r} is invalid: {exc}") from exc
+    return SymbolSelector(
+        timeframes=[str(tf) for tf in entry.get("timeframes", [])],
+        quote=str(rule["quote"]) if rule.get("quote") else None,
+        market_type=str(rule["type"]) if rule.get("type") else None,
+        regex=str(regex) if regex is not None else None,
+        top=int(rule.get("top", 0)),
+        priority=int(entry.get("priority", 0)),
+    )
 
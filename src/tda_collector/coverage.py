@@ -0,0 +1,185 @@
+from typing import Dict, Iterable, List, Tuple
+
+from google.cloud import bigquery
+
+from tda_collector.timeframes import candle_open_ms, timeframe_ms
+
+SeriesKey = Tuple[str, str, str]
+
+# Gaps-and-islands over distinct candle timestamps: consecutive candles share the
+# same (candle index - row number), so each island is one contiguous covered range.
+_COVERAGE_SQL = """
+WITH steps AS (
+  SELECT timeframe, step_ms
+  FROM UNNEST(@timeframes) AS timeframe WITH OFFSET AS i
+  JOIN UNNEST(@steps) AS step_ms WITH OFFSET AS j ON i = j
+),
+bars AS (
+  SELECT DISTINCT t.exchange, t.symbol, t.timeframe, UNIX_MILLIS(t.timestamp) AS ts_ms, s.step_ms
+  FROM `{table_id}` AS t
+  JOIN steps AS s USING (timeframe)
+  WHERE t.timestamp >= TIMESTAMP_MILLIS(@start_ms)
+    AND t.timestamp < TIMESTAMP_MILLIS(@end_ms)
+    AND t.exchange IN UNNEST(@exchanges)
+    AND t.symbol IN UNNEST(@symbols)
+),
+islands AS (
+  SELECT
+    exchange, symbol, timeframe, ts_ms, step_ms,
+    DIV(ts_ms, step_ms) - ROW_NUMBER() OVER (
+      PARTITION BY exchange, symbol, timeframe ORDER BY ts_ms
+    ) AS island
+  FROM bars
+)
+SELECT exchange, symbol, timeframe, MIN(ts_ms) AS first_ms, MAX(ts_ms) + ANY_VALUE(step_ms) AS end_ms
+FROM islands
+GROUP BY exchange, symbol, timeframe, island
+ORDER BY exchange, symbol, timeframe, first_ms
+"""
+
+
+_HIGH_WATER_SQL = """
+SELECT exchange, symbol, timeframe, UNIX_MILLIS(MAX(timestamp)) AS last_ms
+FROM `{table_id}`
+WHERE timestamp >= TIMESTAMP_MILLIS(@since_ms)
+  AND exchange IN UNNEST(@exchanges)
+  AND symbol IN UNNEST(@symbols)
+  AND timeframe IN UNNEST(@timeframes)
+GROUP BY exchange, symbol, timeframe
+"""
+
+
+def fetch_high_water_marks(
+    bq_client: bigquery.Client,
+    dataset: str,
+    table: str,
+    series: Iterable[SeriesKey],
+    since_ms: int,
+) -> Dict[SeriesKey, int]:
+    """
+    Newest stored candle per (exchange, symbol, timeframe) at or after since_ms, in
+    one aggregated query; since_ms bounds the partitions scanned. Series without a
+    candle in that window are absent.
+    """
+    wanted = set(series)
+    if not wanted:
+        return {}
+    table_id = f"{bq_client.project}.{dataset}.{table}"
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ScalarQueryParameter("since_ms", "INT64", since_ms),
+            bigquery.ArrayQueryParameter("exchanges", "STRING", sorted({ex for ex, _, _ in wanted})),
+            bigquery.ArrayQueryParameter("symbols", "STRING", sorted({sym for _, sym, _ in wanted})),
+            bigquery.ArrayQueryParameter("timeframes", "STRING", sorted({tf for _, _, tf in wanted})),
+        ]
+    )
+    rows = bq_client.query(_HIGH_WATER_SQL.format(table_id=table_id), job_config=job_config).result()
+    marks: Dict[SeriesKey, int] = {}
+    for row in rows:
+        key = (row["exchange"], row["symbol"], row["timeframe"])
+        if key in wanted:
+            marks[key] = int(row["last_ms"])
+    return marks
+
+
+def fetch_covered_ranges(
+    bq_client: bigquery.Client,
+    dataset: str,
+    table: str,
+    series: Iterable[Tuple[str, str, str, int]],
+    start_ms: int,
+    end_ms: int,
+) -> Dict[SeriesKey, List[Tuple[int, int]]]:
+    """
+    Covered [first_ms, end_ms) candle ranges per (exchange, symbol, timeframe) inside
+    the window, using one aggregated query for the whole table. series holds
+    (exchange, symbol, timeframe, step_ms) entries.
+    """
+    series = list(series)
+    wanted = {(ex, sym, tf) for ex, sym, tf, _ in series}
+    steps: Dict[str, int] = {tf: step for _, _, tf, step in series}
+    if not series:
+        return {}
+
+    table_id = f"{bq_client.project}.{dataset}.{table}"
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=[
+            bigquery.ArrayQueryParameter("timeframes", "STRING", list(steps)),
+            bigquery.ArrayQueryParameter("steps", "INT64", list(steps.values())),
+            bigquery.ArrayQueryParameter("exchanges", "STRING", sorted({ex for ex, _, _ in wanted})),
+            bigquery.ArrayQueryParameter("symbols", "STRING", sorted({sym for _, sym, _ in wanted})),
+            bigquery.ScalarQueryParameter("start_ms", "INT64", start_ms),
+            bigquery.ScalarQueryParameter("end_ms", "INT64", end_ms),
+        ]
+    )
+    rows = bq_client.query(_COVERAGE_SQL.format(table_id=table_id), job_config=job_config).result()
+
+    covered: Dict[SeriesKey, List[Tuple[int, int]]] = {key: [] for key in wanted}
+    for row in rows:
+        key = (row["exchange"], row["symbol"], row["timeframe"])
+        if key in covered:
+            covered[key].append((int(row["first_ms"]), int(row["end_ms"])))
+    return covered
+
+
+def missing_ranges(
+    covered: List[Tuple[int, int]],
+    start_ms: int,
+    end_ms: int,
+    timeframe: str,
+    step_ms: int,
+) -> List[Tuple[int, int]]:
+    """Candle-aligned [start, end) ranges of the window not present in covered."""
+    first_open = candle_open_ms(start_ms, timeframe, step_ms)
+    cursor = first_open if first_open == start_ms else first_open + step_ms
+    gaps: List[Tuple[int, int]] = []
+    for covered_start, covered_end in sorted(covered):
+        if covered_start > cursor:
+            gaps.append((cursor, min(covered_start, end_ms)))
+        cursor = max(cursor, covered_end)
+        if cursor >= end_ms:
+            break
+    if cursor < end_ms:
+        gaps.append((cursor, end_ms))
+    return [(gap_start, gap_end) for gap_start, gap_end in gaps if gap_start < gap_end]
+
+
+def plan_repair_tasks(
+    history_tasks: Iterable[Tuple],
+    bq_client: bigquery.Client,
+    dataset: str,
+    table: str,
+    timeframe_window_ms: int = 60_000,
+) -> List[Tuple]:
+    """
+    Turn (client, symbol, timeframe, start_ms, end_ms) history tasks into tasks that
+    cover only the missing candle ranges. Monthly series have no fixed step, so they
+    keep their full window (a handful of candles at most).
+    """
+    history_tasks = list(history_tasks)
+    if not history_tasks:
+        return []
+    start_ms = min(task[3] for task in history_tasks)
+    end_ms = max(task[4] for task in history_tasks)
+    steps = {
+        (client.id, symbol, timeframe): timeframe_ms(client, timeframe, timeframe_window_ms)
+        for client, symbol, timeframe, _, _ in history_tasks
+    }
+    covered = fetch_covered_ranges(
+        bq_client,
+        dataset,
+        table,
+        [(ex, sym, tf, step) for (ex, sym, tf), step in steps.items() if not tf.endswith("M")],
+        start_ms,
+        end_ms,
+    )
+
+    repair_tasks: List[Tuple] = []
+    for client, symbol, timeframe, task_start, task_end in history_tasks:
+        key = (client.id, symbol, timeframe)
+        if key not in covered:
+            repair_tasks.append((client, symbol, timeframe, task_start, task_end))
+            continue
+        for gap_start, gap_end in missing_ranges(covered[key], task_start, task_end, timeframe, steps[key]):
+            repair_tasks.append((client, symbol, timeframe, gap_start, gap_end))
+    return repair_tasks
@@ -0,0 +1,43 @@
+import threading
+from typing import Dict, List, Tuple
+
+from tda_collector.models import OHLCVRecord
+
+SeriesKey = Tuple[str, str, str]
+Fingerprint = Tuple[float, float, float, float, float]
+
+
+def fingerprint(record: OHLCVRecord) -> Fingerprint:
+    return (record.open, record.high, record.low, record.close, record.volume)
+
+
+class LastWrittenCache:
+    """
+    In-memory fingerprints of the bars last written per (exchange, symbol, timeframe,
+    timestamp), so the live loop only re-sends bars that are new or have changed.
+    Only the newest max_bars_per_series timestamps are kept per series.
+    """
+
+    def __init__(self, max_bars_per_series: int = 4):
+        self.max_bars_per_series = max(1, max_bars_per_series)
+        self._lock = threading.Lock()
+        self._series: Dict[SeriesKey, Dict[int, Fingerprint]] = {}
+
+    def changed(self, rows: List[OHLCVRecord]) -> List[OHLCVRecord]:
+        with self._lock:
+            result = []
+            for row in rows:
+                bars = self._series.get((row.exchange, row.symbol, row.timeframe))
+                ts_ms = int(row.timestamp.timestamp() * 1000)
+                if bars is None or bars.get(ts_ms) != fingerprint(row):
+                    result.append(row)
+            return result
+
+    def mark(self, rows: List[OHLCVRecord]) -> None:
+        with self._lock:
+            for row in rows:
+                bars = self._series.setdefault((row.exchange, row.symbol, row.timeframe), {})
+                ts_ms = int(row.timestamp.timestamp() * 1000)
+                bars[ts_ms] = fingerprint(row)
+                while len(bars) > self.max_bars_per_series:
+                    bars.pop(min(bars))
@@ -1,19 +1,130 @@
+import atexit
+import gzip
 import json
 import logging
 import os
+import queue
+import sys
+import threading
 import time
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-try:
-    from logging_loki import LokiHandler
-except ImportError:  # pragma: no cover - optional handler
-    LokiHandler = None  # type: ignore
+from tda_collector.metrics import LOKI_DROPPED, LOKI_PUSH_FAILURES
 
-try:  # used only for optional debug check
+try:  # Loki pushes and the optional debug check
     import requests  # type: ignore
-except Exception:  # pragma: no cover - optional dependency comes with logging_loki
+except Exception:  # pragma: no cover - installed from requirements.txt
     requests = None  # type: ignore
 
+_STOP = object()
+
+
+class BatchingLokiHandler(logging.Handler):
+    """
+    Loki handler that never blocks the caller: emit() only enqueues the formatted
+    record. A background thread groups records into streams by label set and pushes
+    gzip-compressed batches when batch_size records are waiting or flush_interval
+    seconds have passed. A full queue drops records and counts them in dropped.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        auth: Tuple[str, str],
+        tags: Dict[str, str],
+        verify_tls: bool = True,
+        batch_size: int = 500,
+        flush_interval: float = 2.0,
+        queue_size: int = 10_000,
+        timeout: float = 5.0,
+    ):
+        super().__init__()
+        self.url = url
+        self.auth = auth
+        self.tags = dict(tags)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.dropped = 0
+        self.push_failures = 0
+        self.session = requests.Session() if requests else None
+        if self.session is not None:
+            self.session.verify = verify_tls
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+        self._thread = threading.Thread(target=self._run, name="loki-push", daemon=True)
+        self._stopped = False
+        self._thread.start()
+        atexit.register(self.close)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            labels = {**self.tags, "severity": record.levelname.lower(), "logger": record.name}
+            entry = (int(record.created * 1e9), self.format(record), tuple(sorted(labels.items())))
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+            LOKI_DROPPED.inc()
+        except Exception:  # pragma: no cover - logging must not raise
+            self.handleError(record)
+
+    def close(self) -> None:
+        """Push everything queued so far, then stop the background thread."""
+        if not self._stopped:
+            self._stopped = True
+            try:
+                self._queue.put(_STOP, timeout=self.timeout)
+            except queue.Full:
+                pass
+            self._thread.join(self.timeout * 2)
+        super().close()
+
+    def _run(self) -> None:
+        batch: List[Tuple[int, str, tuple]] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            stopping = item is _STOP
+            if item is not None and not stopping:
+                batch.append(item)
+            if batch and (stopping or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._push(batch)
+                batch = []
+            if stopping:
+                return
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+
+    def _push(self, batch: List[Tuple[int, str, tuple]]) -> None:
+        if self.session is None:
+            return
+        streams: Dict[tuple, List[List[str]]] = {}
+        for ts_ns, line, labels in batch:
+            streams.setdefault(labels, []).append([str(ts_ns), line])
+        payload = {
+            "streams": [
+                {"stream": dict(labels), "values": sorted(values, key=lambda v: int(v[0]))}
+                for labels, values in streams.items()
+            ]
+        }
+        body = gzip.compress(json.dumps(payload).encode("utf-8"))
+        try:
+            resp = self.session.post(
+                self.url,
+                data=body,
+                auth=self.auth,
+                headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+                timeout=self.timeout,
+            )
+            if resp.status_code >= 300:
+                raise RuntimeError(f"status={resp.status_code} body={resp.text[:200]!r}")
+        except Exception as exc:  # pragma: no cover - network guard
+            self.push_failures += 1
+            LOKI_PUSH_FAILURES.inc()
+            print(f"[loki] push of {len(batch)} records failed: {exc}", file=sys.stderr)
+
 
 def build_logger(
     service_name: str,
@@ -78,10 +189,10 @@ def build_logger(
                 preview_user = username[:4] + "…" if len(username) > 4 else username
                 print(
                     f"[loki-debug] status={resp.status_code} body={resp.text!r} url={url} user={preview_user} verify_tls={verify_tls}",
-                    file=os.sys.stderr,
+                    file=sys.stderr,
                 )
         except Exception as exc:  # pragma: no cover - debug path
-            print(f"[loki-debug] request failed: {exc}", file=os.sys.stderr)
+            print(f"[loki-debug] request failed: {exc}", file=sys.stderr)
 
     logger = logging.getLogger(service_name)
 
@@ -98,19 +209,18 @@ def build_logger(
     clean_password = _env_clean(loki_password) or ""
     verify_tls = not _parse_env_bool(os.environ.get("LOKI_INSECURE"))
 
-    if normalized_loki_url and LokiHandler:
+    if normalized_loki_url and requests:
         _maybe_debug_request(normalized_loki_url, clean_username, clean_password, verify_tls)
-        loki_handler = LokiHandler(
+        loki_handler = BatchingLokiHandler(
             url=normalized_loki_url,
             auth=(clean_username, clean_password),
-            version="1",
             tags={"service": service_name, "environment": environment},
+            verify_tls=verify_tls,
+            batch_size=int(os.environ.get("LOKI_BATCH_SIZE", "500")),
+            flush_interval=float(os.environ.get("LOKI_FLUSH_SECONDS", "2.0")),
+            queue_size=int(os.environ.get("LOKI_QUEUE_SIZE", "10000")),
         )
         loki_handler.setFormatter(formatter)
-        try:
-            loki_handler.emitter.session.verify = verify_tls
-        except Exception:
-            pass
         logger.addHandler(loki_handler)
 
     logger.propagate = False
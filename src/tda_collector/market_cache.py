@@ -0,0 +1,58 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import ccxt
+
+
+class MarketCache:
+    """
+    On-disk copy of each exchange's load_markets() result (one JSON file per exchange).
+    Entries expire after ttl_seconds and are ignored when written by another ccxt
+    version, whose market structure may differ.
+    """
+
+    def __init__(self, directory: str, ttl_seconds: float = 86_400, version: str = ccxt.__version__):
+        self.directory = Path(directory)
+        self.ttl_seconds = ttl_seconds
+        self.version = version
+
+    def _path(self, exchange_id: str) -> Path:
+        return self.directory / f"{exchange_id}.json"
+
+    def load(
+        self, exchange_id: str, max_age_seconds: Optional[float] = None
+    ) -> Optional[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]:
+        """(markets, currencies) when a fresh entry exists, else None."""
+        ttl = self.ttl_seconds if max_age_seconds is None else min(self.ttl_seconds, max_age_seconds)
+        try:
+            entry = json.loads(self._path(exchange_id).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if entry.get("version") != self.version or time.time() - entry.get("saved_at", 0) > ttl:
+            return None
+        return entry["markets"], entry.get("currencies")
+
+    def save(self, exchange_id: str, markets: Dict[str, Any], currencies: Optional[Dict[str, Any]]) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        entry = {"version": self.version, "saved_at": time.time(), "markets": markets, "currencies": currencies}
+        path = self._path(exchange_id)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(entry, default=str), encoding="utf-8")
+        tmp.replace(path)
+
+    def preload(self, client) -> bool:
+        """
+        Give client its markets from the cache, or load them from the exchange and
+        cache them. Returns True on a cache hit.
+        """
+        cached = self.load(client.id)
+        if cached is not None:
+            markets, currencies = cached
+            client.set_markets(markets, currencies)
+            return True
+        client.load_markets()
+        self.save(client.id, client.markets, getattr(client, "currencies", None))
+        return False
@@ -0,0 +1,256 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:  # pragma: no cover - overridden
+        return []
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(v)}" for key, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = float(value)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts..., +Inf count], sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return sum(entry[0]) if entry else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total[0])) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+FETCH_SECONDS = REGISTRY.register(
+    Histogram("tda_fetch_seconds", "Exchange OHLCV request latency per attempt.", ["exchange", "mode"])
+)
+INSERT_SECONDS = REGISTRY.register(
+    Histogram("tda_insert_seconds", "BigQuery write latency per call.", ["table", "method"])
+)
+ROWS_WRITTEN = REGISTRY.register(
+    Counter("tda_rows_written_total", "Rows accepted by BigQuery.", ["table", "method"])
+)
+RETRIES = REGISTRY.register(
+    Counter("tda_retries_total", "Retries performed by retry_with_backoff.", ["error"])
+)
+RATE_LIMIT = REGISTRY.register(
+    Gauge("tda_rate_limit_requests_per_second", "Current adaptive request rate per exchange.", ["exchange"])
+)
+THROTTLED = REGISTRY.register(
+    Counter("tda_rate_limited_total", "RateLimitExceeded responses per exchange.", ["exchange"])
+)
+CIRCUIT_OPEN = REGISTRY.register(
+    Gauge("tda_circuit_open", "1 while the exchange circuit breaker is open.", ["exchange"])
+)
+LIVE_CYCLE_SECONDS = REGISTRY.register(
+    Gauge("tda_live_cycle_duration_seconds", "Wall time of the last live cycle or wake-up.", ["schedule"])
+)
+LIVE_INTERVAL_SECONDS = REGISTRY.register(
+    Gauge("tda_live_cycle_interval_seconds", "Configured live polling interval.")
+)
+LIVE_DRIFT_SECONDS = REGISTRY.register(
+    Gauge("tda_live_cycle_lag_seconds", "How late the last interval live cycle started after its tick.")
+)
+LIVE_OVERRUNS = REGISTRY.register(
+    Counter("tda_live_overrun_ticks_total", "Interval live ticks skipped because a cycle ran past them.")
+)
+LIVE_TASKS_DEFERRED = REGISTRY.register(
+    Counter("tda_live_tasks_deferred_total", "Live tasks deferred to the next cycle to keep the schedule.", ["exchange"])
+)
+LIVE_CYCLE_ERRORS = REGISTRY.register(
+    Counter("tda_live_task_errors_total", "Live tasks that failed.", ["exchange"])
+)
+LIVE_CATCHUP_ROWS = REGISTRY.register(
+    Counter("tda_live_catchup_rows_total", "Bars fetched by live catch-up after a gap.", ["exchange"])
+)
+HISTORY_CURSOR_LAG = REGISTRY.register(
+    Gauge(
+        "tda_history_cursor_lag_seconds",
+        "Distance from the history cursor to the end of its range.",
+        ["exchange", "symbol", "timeframe"],
+    )
+)
+LOKI_DROPPED = REGISTRY.register(
+    Counter("tda_loki_dropped_total", "Log records dropped because the Loki queue was full.")
+)
+LOKI_PUSH_FAILURES = REGISTRY.register(Counter("tda_loki_push_failures_total", "Failed Loki batch pushes."))
+STREAM_UPDATES = REGISTRY.register(
+    Counter("tda_stream_updates_total", "WebSocket OHLCV updates received.", ["exchange"])
+)
+STREAM_RECONNECTS = REGISTRY.register(
+    Counter("tda_stream_reconnects_total", "WebSocket stream reconnects.", ["exchange"])
+)
+UNIVERSE_SYMBOLS = REGISTRY.register(
+    Gauge("tda_universe_symbols", "Symbols resolved from selector rules.", ["exchange"])
+)
+PAGE_CACHE_HITS = REGISTRY.register(
+    Counter("tda_page_cache_hits_total", "History pages served from the page cache.", ["exchange"])
+)
+PAGE_CACHE_MISSES = REGISTRY.register(
+    Counter("tda_page_cache_misses_total", "History pages not in the page cache.", ["exchange"])
+)
+SPOOL_BYTES = REGISTRY.register(Gauge("tda_spool_bytes", "Bytes waiting in the disk spool."))
+SPOOL_SEGMENTS = REGISTRY.register(Gauge("tda_spool_segments", "Segment files waiting in the disk spool."))
+
+
+def timed(histogram: Histogram, func: Callable, **labels) -> Callable:
+    """Wrap func so every call is observed in histogram."""
+
+    def wrapper(*args, **kwargs):
+        with histogram.time(**labels):
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: Registry = REGISTRY
+
+    def do_GET(self):  # noqa: N802 - http.server naming
+        if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # noqa: A002 - keep scrapes out of stdout logs
+        return
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0", registry: Optional[Registry] = None) -> ThreadingHTTPServer:
+    """Serve Prometheus text format on /metrics from a daemon thread."""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry or REGISTRY})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    return server
@@ -1,6 +1,21 @@
-from dataclasses import dataclass
-from datetime import datetime
-from typing import List, Optional, Dict, Any
+import hashlib
+from array import array
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Dict, Any, Iterable, Sequence
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def bar_insert_id(exchange: str, symbol: str, timeframe: str, ts_ms: int, values: Sequence[float]) -> str:
+    """Stable BigQuery insertId for one bar version (same key and OHLCV values)."""
+    key = "|".join([exchange, symbol, timeframe, str(ts_ms), *map(repr, values)])
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def ms_to_iso(ts_ms: int) -> str:
+    return (_EPOCH + timedelta(milliseconds=ts_ms)).isoformat()
 
 
 @dataclass
@@ -11,18 +26,70 @@ class Settings:
     backoff_max: float = 32.0
     backoff_attempts: int = 5
     history_page_limit: int = 200
+    history_workers_per_exchange: int = 1
+    history_shard_pages: int = 10
+    live_workers_per_exchange: int = 1
+    live_schedule: str = "interval"
+    candle_settle_seconds: float = 2.0
+    forming_refresh_seconds: float = 0
+    writer_enabled: bool = False
+    writer_max_rows: int = 500
+    writer_max_bytes: int = 5_000_000
+    writer_max_latency_seconds: float = 2.0
+    writer_queue_size: int = 10_000
+    live_skip_unchanged: bool = True
+    bq_insert_ids: bool = False
+    spool_enabled: bool = False
+    spool_dir: str = "./spool"
+    spool_segment_bytes: int = 8 * 1024 * 1024
+    spool_max_bytes: int = 1024 * 1024 * 1024
+    spool_replay_interval_seconds: float = 30.0
+    spool_replay_batch_rows: int = 500
+    load_job_chunk_rows: int = 500_000
+    rate_limit_burst: float = 1.0
+    breaker_failure_threshold: int = 5
+    breaker_cooldown_seconds: float = 30.0
+    stream_flush_seconds: float = 1.0
+    derive_timeframes: bool = False
+    history_max_page_limit: int = 5000
+    history_probe_listing: bool = True
+    page_limit_cache_path: str = "./page_limits.json"
+    market_cache_dir: str = "./market_cache"
+    market_cache_ttl_seconds: float = 86_400
+    shard_weight_by_timeframe: bool = True
+    ring_buffer_size: int = 500
+    page_cache_dir: str = ""
+    live_catchup_limit: int = 1000
+    live_catchup_max_pages: int = 10
+    live_catchup_lookback_seconds: float = 7 * 86_400
+    universe_refresh_seconds: float = 3600
+    sinks: List[Dict[str, Any]] = field(default_factory=lambda: [{"type": "bigquery"}])
 
 
 @dataclass
 class ExchangePair:
     symbol: str
     timeframes: List[str]
+    priority: int = 0
+
+
+@dataclass
+class SymbolSelector:
+    """Rule expanding to every active market matching all of its filters."""
+
+    timeframes: List[str]
+    quote: Optional[str] = None
+    market_type: Optional[str] = None
+    regex: Optional[str] = None
+    top: int = 0
+    priority: int = 0
 
 
 @dataclass
 class Config:
     settings: Settings
     exchanges: Dict[str, List[ExchangePair]]
+    selectors: Dict[str, List[SymbolSelector]] = field(default_factory=dict)
 
 
 @dataclass
@@ -38,6 +105,12 @@ class OHLCVRecord:
     volume: float
     ingested_at: datetime
 
+    def insert_id(self) -> str:
+        """Stable BigQuery insertId for this exact bar version (same key and values)."""
+        ts_ms = int(self.timestamp.timestamp() * 1000)
+        values = (self.open, self.high, self.low, self.close, self.volume)
+        return bar_insert_id(self.exchange, self.symbol, self.timeframe, ts_ms, values)
+
     def to_bq_row(self) -> Dict[str, Any]:
         return {
             "timestamp": self.timestamp.isoformat(),
@@ -52,3 +125,117 @@ class OHLCVRecord:
             "ingested_at": self.ingested_at.isoformat(),
         }
 
+
+@dataclass
+class CandleBatch:
+    """
+    Columnar page of candles for one series: epoch-ms timestamps in an int64 array and
+    OHLCV values in float64 arrays, built straight from ccxt's lists. Timestamps are
+    ascending, so windowing is a binary search plus array slices.
+    """
+
+    exchange: str
+    symbol: str
+    timeframe: str
+    timestamps: array
+    open: array
+    high: array
+    low: array
+    close: array
+    volume: array
+    ingested_at: datetime
+
+    @classmethod
+    def from_ohlcv(
+        cls,
+        exchange: str,
+        symbol: str,
+        timeframe: str,
+        candles: Iterable[Sequence[Any]],
+        ingested_at: Optional[datetime] = None,
+    ) -> "CandleBatch":
+        columns = list(zip(*candles)) or [()] * 6
+        ts, o, h, l, c, v = columns[:6]
+        return cls(
+            exchange=exchange,
+            symbol=symbol,
+            timeframe=timeframe,
+            timestamps=array("q", map(int, ts)),
+            open=array("d", o),
+            high=array("d", h),
+            low=array("d", l),
+            close=array("d", c),
+            volume=array("d", v),
+            ingested_at=ingested_at or datetime.now(tz=timezone.utc),
+        )
+
+    def __len__(self) -> int:
+        return len(self.timestamps)
+
+    @property
+    def first_ms(self) -> int:
+        return self.timestamps[0]
+
+    @property
+    def last_ms(self) -> int:
+        return self.timestamps[-1]
+
+    def window(self, start_ms: int, end_ms: int) -> "CandleBatch":
+        """Candles with start_ms <= timestamp < end_ms."""
+        lo = bisect_left(self.timestamps, start_ms)
+        hi = bisect_left(self.timestamps, end_ms)
+        if lo == 0 and hi == len(self.timestamps):
+            return self
+        return CandleBatch(
+            exchange=self.exchange,
+            symbol=self.symbol,
+            timeframe=self.timeframe,
+            timestamps=self.timestamps[lo:hi],
+            open=self.open[lo:hi],
+            high=self.high[lo:hi],
+            low=self.low[lo:hi],
+            close=self.close[lo:hi],
+            volume=self.volume[lo:hi],
+            ingested_at=self.ingested_at,
+        )
+
+    def to_bq_rows(self) -> List[Dict[str, Any]]:
+        ingested_at = self.ingested_at.isoformat()
+        return [
+            {
+                "timestamp": ms_to_iso(ts),
+                "exchange": self.exchange,
+                "symbol": self.symbol,
+                "timeframe": self.timeframe,
+                "open": o,
+                "high": h,
+                "low": l,
+                "close": c,
+                "volume": v,
+                "ingested_at": ingested_at,
+            }
+            for ts, o, h, l, c, v in zip(self.timestamps, self.open, self.high, self.low, self.close, self.volume)
+        ]
+
+    def insert_ids(self) -> List[str]:
+        return [
+            bar_insert_id(self.exchange, self.symbol, self.timeframe, ts, values)
+            for ts, *values in zip(self.timestamps, self.open, self.high, self.low, self.close, self.volume)
+        ]
+
+    def records(self) -> List[OHLCVRecord]:
+        return [
+            OHLCVRecord(
+                timestamp=_EPOCH + timedelta(milliseconds=ts),
+                exchange=self.exchange,
+                symbol=self.symbol,
+                timeframe=self.timeframe,
+                open=o,
+                high=h,
+                low=l,
+                close=c,
+                volume=v,
+                ingested_at=self.ingested_at,
+            )
+            for ts, o, h, l, c, v in zip(self.timestamps, self.open, self.high, self.low, self.close, self.volume)
+        ]
@@ -0,0 +1,143 @@
+import gzip
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, List, Optional
+
+from tda_collector.metrics import PAGE_CACHE_HITS, PAGE_CACHE_MISSES
+from tda_collector.models import CandleBatch
+from tda_collector.timeframes import timeframe_ms
+
+
+class PageCacheMiss(LookupError):
+    """Raised by an offline fetcher for a page that was never recorded."""
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    tmp.replace(path)
+
+
+def fetch_candles(client, symbol: str, timeframe: str, since_ms: int, limit: int) -> List[List[Any]]:
+    return client.fetch_ohlcv(symbol, timeframe=timeframe, since=since_ms, limit=limit)
+
+
+class PageCache:
+    """
+    On-disk recordings of raw fetch_ohlcv pages. Page bodies are gzip-compressed JSON
+    stored under the sha256 of their content (blobs/), so identical pages are kept
+    once; refs/ maps each request (exchange, symbol, timeframe, since, limit) to its
+    blob and whether the page was closed when fetched. A closed ref is never
+    replaced: every candle of its window had closed, so the answer cannot change.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+
+    @staticmethod
+    def request_key(exchange: str, symbol: str, timeframe: str, since_ms: int, limit: int) -> str:
+        raw = json.dumps([exchange, symbol, timeframe, int(since_ms), int(limit)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _ref_path(self, key: str) -> Path:
+        return self.directory / "refs" / key[:2] / f"{key}.json"
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.directory / "blobs" / digest[:2] / f"{digest}.json.gz"
+
+    def _ref(self, key: str) -> Optional[dict]:
+        try:
+            return json.loads(self._ref_path(key).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def get(
+        self, exchange: str, symbol: str, timeframe: str, since_ms: int, limit: int, include_open: bool = False
+    ) -> Optional[List[List[Any]]]:
+        """Recorded candles for the request: closed pages only unless include_open."""
+        ref = self._ref(self.request_key(exchange, symbol, timeframe, since_ms, limit))
+        if ref is None or not (ref.get("closed") or include_open):
+            return None
+        try:
+            return json.loads(gzip.decompress(self._blob_path(ref["digest"]).read_bytes()))
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(
+        self,
+        exchange: str,
+        symbol: str,
+        timeframe: str,
+        since_ms: int,
+        limit: int,
+        candles: List[List[Any]],
+        closed: bool,
+    ) -> None:
+        key = self.request_key(exchange, symbol, timeframe, since_ms, limit)
+        existing = self._ref(key)
+        if existing and existing.get("closed"):
+            return
+        body = json.dumps(candles, separators=(",", ":")).encode("utf-8")
+        digest = hashlib.sha256(body).hexdigest()
+        blob = self._blob_path(digest)
+        if not blob.exists():
+            # mtime=0 keeps the compressed bytes identical for identical pages.
+            _atomic_write(blob, gzip.compress(body, mtime=0))
+        ref = {
+            "request": [exchange, symbol, timeframe, int(since_ms), int(limit)],
+            "digest": digest,
+            "closed": bool(closed),
+            "fetched_at_ms": int(datetime.now(tz=timezone.utc).timestamp() * 1000),
+        }
+        _atomic_write(self._ref_path(key), json.dumps(ref).encode("utf-8"))
+
+
+class CachingPageFetcher:
+    """
+    History fetch_page_fn that serves closed pages from a PageCache and records
+    every page it fetches. A page is closed when its whole requested window
+    [since, since + limit * step) ended at least one candle before the fetch.
+
+    offline=True never touches the exchange: any recorded page (closed or not) is
+    replayed, and a missing one raises PageCacheMiss, so a recorded run replays
+    deterministically with zero requests.
+
+    Misses go through fetch_fn (client, symbol, timeframe, since_ms, limit) -> raw
+    candles; through() swaps it, so a rate limiter can wrap the misses only.
+    """
+
+    def __init__(
+        self,
+        cache: PageCache,
+        offline: bool = False,
+        now_fn: Optional[Callable[[], float]] = None,
+        fetch_fn: Optional[Callable] = None,
+    ):
+        self.cache = cache
+        self.offline = offline
+        self.now_fn = now_fn or (lambda: datetime.now(tz=timezone.utc).timestamp())
+        self.fetch_fn = fetch_fn or fetch_candles
+
+    def through(self, fetch_fn: Callable) -> "CachingPageFetcher":
+        """The same cache with misses fetched by fetch_fn."""
+        return CachingPageFetcher(self.cache, self.offline, self.now_fn, fetch_fn)
+
+    def __call__(self, client, symbol: str, timeframe: str, since_ms: int, limit: int = 200) -> CandleBatch:
+        exchange = str(client.id)
+        candles = self.cache.get(exchange, symbol, timeframe, since_ms, limit, include_open=self.offline)
+        if candles is not None:
+            PAGE_CACHE_HITS.inc(exchange=exchange)
+            return CandleBatch.from_ohlcv(exchange, symbol, timeframe, candles)
+        PAGE_CACHE_MISSES.inc(exchange=exchange)
+        if self.offline:
+            raise PageCacheMiss(f"no recorded page for {exchange} {symbol} {timeframe} since={since_ms} limit={limit}")
+
+        candles = self.fetch_fn(client, symbol, timeframe, since_ms, limit)
+        step_ms = timeframe_ms(client, timeframe)
+        closed = since_ms + limit * step_ms <= int(self.now_fn() * 1000) - step_ms
+        self.cache.put(exchange, symbol, timeframe, since_ms, limit, [list(candle) for candle in candles], closed)
+        return CandleBatch.from_ohlcv(exchange, symbol, timeframe, candles)
@@ -0,0 +1,132 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+import ccxt
+
+# Errors an exchange raises for a limit it does not accept.
+_LIMIT_REJECTED = (ccxt.ExchangeError,)
+
+
+class PageLimitCache:
+    """
+    Largest page size each (exchange, timeframe) accepted, optionally persisted as a
+    small JSON file so later runs skip the discovery request.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path) if path else None
+        self._lock = threading.Lock()
+        self._limits: Dict[str, int] = {}
+        if self.path and self.path.exists():
+            try:
+                self._limits = {str(k): int(v) for k, v in json.loads(self.path.read_text()).items()}
+            except (ValueError, OSError):
+                self._limits = {}
+
+    @staticmethod
+    def _key(exchange: str, timeframe: str) -> str:
+        return f"{exchange}|{timeframe}"
+
+    def get(self, exchange: str, timeframe: str) -> Optional[int]:
+        with self._lock:
+            return self._limits.get(self._key(exchange, timeframe))
+
+    def set(self, exchange: str, timeframe: str, limit: int) -> None:
+        with self._lock:
+            self._limits[self._key(exchange, timeframe)] = int(limit)
+            if self.path:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                # Per-process temp name: shards may share the cache file.
+                tmp = self.path.with_suffix(f"{self.path.suffix}.{os.getpid()}.tmp")
+                tmp.write_text(json.dumps(self._limits, indent=2, sort_keys=True))
+                tmp.replace(self.path)
+
+
+def discover_page_limit(
+    fetch_page: Callable,
+    client,
+    symbol: str,
+    timeframe: str,
+    since_ms: int,
+    end_ms: int,
+    step_ms: int,
+    min_limit: int,
+    max_limit: int,
+) -> Optional[int]:
+    """
+    Largest page the exchange serves for timeframe: ask for max_limit candles from
+    since_ms (clamped to the window, halving on rejection) and take the count it
+    returns. Only a gap-free page of at least min_limit candles counts as capped by
+    the exchange; a sparse series returns fewer candles than the cap. When the whole
+    window fits in one accepted page the full count is returned, a size the exchange
+    is known to serve. Returns None when the answer does not tell a size (window too
+    short, sparse or short page).
+    """
+    limit = min(max_limit, (end_ms - since_ms) // step_ms)
+    while limit > min_limit:
+        try:
+            page = fetch_page(client, symbol, timeframe, since_ms, limit)
+        except _LIMIT_REJECTED:
+            limit //= 2
+            continue
+        if not page or len(page) < min_limit:
+            return None
+        contiguous = (page.last_ms - page.first_ms) // step_ms + 1 == len(page)
+        return len(page) if contiguous else None
+    return None
+
+
+def _listed_ms(client, symbol: str) -> Optional[int]:
+    """Listing time from the market's ccxt `created` metadata, when the exchange has one."""
+    markets = getattr(client, "markets", None)
+    market = markets.get(symbol) if isinstance(markets, dict) else None
+    created = market.get("created") if isinstance(market, dict) else None
+    return int(created) if isinstance(created, (int, float)) and created > 0 else None
+
+
+def find_first_candle_ms(
+    fetch_page: Callable,
+    client,
+    symbol: str,
+    timeframe: str,
+    start_ms: int,
+    end_ms: int,
+    step_ms: int,
+    confirm_limit: int = 1000,
+) -> int:
+    """
+    First candle at or after start_ms. One single-candle request at start_ms resolves
+    exchanges that answer with the first existing candle after since. An empty answer
+    cannot tell time before listing from a trading halt, so the search is seeded from
+    the market's `created` metadata instead of bisecting on empty answers: the listing
+    candle must exist, and a page of up to confirm_limit candles just before it must
+    hold nothing earlier. Otherwise start_ms is returned and nothing is skipped.
+    """
+    page = fetch_page(client, symbol, timeframe, start_ms, 1)
+    if page:
+        first = page.first_ms
+        # Served from since: either data exists there or the exchange jumped to the
+        # first candle. A candle before since means since is ignored.
+        return first if start_ms <= first < end_ms else start_ms
+
+    listed_ms = _listed_ms(client, symbol)
+    if listed_ms is None:
+        return start_ms
+    candidate = listed_ms // step_ms * step_ms
+    if not start_ms < candidate < end_ms:
+        return start_ms
+    try:
+        listing = fetch_page(client, symbol, timeframe, candidate, 1)
+        if not listing or not candidate <= listing.first_ms < end_ms:
+            return start_ms
+        confirm_since = max(start_ms, candidate - confirm_limit * step_ms)
+        before = fetch_page(client, symbol, timeframe, confirm_since, (candidate - confirm_since) // step_ms)
+    except _LIMIT_REJECTED:
+        return start_ms
+    # Candles before the listing time mean the metadata is wrong for this series.
+    if before and before.first_ms < candidate:
+        return start_ms
+    return listing.first_ms
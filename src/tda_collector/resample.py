@@ -0,0 +1,282 @@
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from tda_collector.adapter import fetch_history_page, fetch_last_two
+from tda_collector.checkpoint import after_commit
+from tda_collector.models import CandleBatch, OHLCVRecord
+from tda_collector.timeframes import DAY_MS, WEEK_OFFSET_MS, candle_close_ms, candle_open_ms, timeframe_ms
+
+Bar = Tuple[int, float, float, float, float, float]
+
+
+def derivable(base_ms: int, timeframe: str, step_ms: int) -> bool:
+    """True when every timeframe candle is a whole number of base candles."""
+    if timeframe.endswith("M"):
+        return DAY_MS % base_ms == 0
+    if step_ms <= base_ms or step_ms % base_ms:
+        return False
+    if timeframe.endswith("w"):
+        return WEEK_OFFSET_MS % base_ms == 0
+    return True
+
+
+def plan_derived_tasks(tasks: Iterable[Tuple], fallback_ms: int = 60_000) -> Tuple[List[Tuple], Dict]:
+    """
+    Drop tasks whose timeframe can be resampled from the finest timeframe configured
+    for the same exchange and symbol. Tasks are (client, symbol, timeframe, ...).
+
+    Returns the tasks still fetched and the plan
+    {(exchange, symbol, base_timeframe): (base_step_ms, [(timeframe, step_ms), ...])}.
+    """
+    tasks = list(tasks)
+    steps: Dict[Tuple[str, str], Dict[str, int]] = {}
+    for client, symbol, timeframe, *_ in tasks:
+        steps.setdefault((client.id, symbol), {})[timeframe] = timeframe_ms(client, timeframe, fallback_ms)
+
+    plan: Dict[Tuple[str, str, str], Tuple[int, List[Tuple[str, int]]]] = {}
+    derived: set = set()
+    for (exchange, symbol), by_timeframe in steps.items():
+        base = min(by_timeframe, key=by_timeframe.get)
+        base_ms = by_timeframe[base]
+        targets = [(tf, step) for tf, step in by_timeframe.items() if tf != base and derivable(base_ms, tf, step)]
+        if targets:
+            plan[(exchange, symbol, base)] = (base_ms, targets)
+            derived.update((exchange, symbol, tf) for tf, _ in targets)
+    fetched = [task for task in tasks if (task[0].id, task[1], task[2]) not in derived]
+    return fetched, plan
+
+
+def _aggregate(bars: Dict[int, Bar]) -> Bar:
+    ordered = [bars[ts] for ts in sorted(bars)]
+    return (
+        ordered[0][0],
+        ordered[0][1],
+        max(bar[2] for bar in ordered),
+        min(bar[3] for bar in ordered),
+        ordered[-1][4],
+        sum(bar[5] for bar in ordered),
+    )
+
+
+class Resampler:
+    """
+    Builds coarser candles of one series from its base-timeframe candles: first open,
+    max high, min low, last close, summed volume, with buckets aligned like the
+    exchange's (Monday weeks, calendar months).
+
+    Base candles are keyed by timestamp inside their bucket, so repeated updates of a
+    forming candle and out-of-order pages (parallel history shards) merge the same way.
+    A bucket is complete once it holds every base candle of its span.
+    """
+
+    def __init__(
+        self,
+        exchange: str,
+        symbol: str,
+        base_timeframe: str,
+        base_step_ms: int,
+        targets: Sequence[Tuple[str, int]],
+        max_open_buckets: int = 2,
+        floor_ms: int = 0,
+    ):
+        self.exchange = exchange
+        self.symbol = symbol
+        self.base_timeframe = base_timeframe
+        self.base_step_ms = base_step_ms
+        self.targets = list(targets)
+        self.max_open_buckets = max_open_buckets
+        # Buckets opening before floor_ms were not seeded in full; update() never emits them.
+        self.floor_ms = floor_ms
+        self._first_ms: Optional[int] = None
+        self._lock = threading.Lock()
+        # timeframe -> bucket open -> base timestamp -> bar
+        self._buckets: Dict[str, Dict[int, Dict[int, Bar]]] = {tf: {} for tf, _ in self.targets}
+
+    def _add(self, candles: Iterable[Sequence[Any]]) -> Dict[str, set]:
+        touched: Dict[str, set] = {tf: set() for tf, _ in self.targets}
+        for candle in candles:
+            bar = (int(candle[0]), *map(float, candle[1:6]))
+            if self._first_ms is None or bar[0] < self._first_ms:
+                self._first_ms = bar[0]
+            for timeframe, step_ms in self.targets:
+                bucket = candle_open_ms(bar[0], timeframe, step_ms)
+                self._buckets[timeframe].setdefault(bucket, {})[bar[0]] = bar
+                touched[timeframe].add(bucket)
+        return touched
+
+    def _complete(self, timeframe: str, step_ms: int, bucket: int) -> bool:
+        span = candle_close_ms(bucket, timeframe, step_ms) - bucket
+        return len(self._buckets[timeframe][bucket]) >= span // self.base_step_ms
+
+    def _batch(self, timeframe: str, bars: List[Bar]) -> CandleBatch:
+        return CandleBatch.from_ohlcv(self.exchange, self.symbol, timeframe, sorted(bars))
+
+    def update(self, candles: Iterable[Sequence[Any]]) -> List[CandleBatch]:
+        """
+        Live: current (possibly forming) bars of every bucket the candles touched.
+        The newest max_open_buckets buckets stay in memory, so the previous candle
+        that fetch_last_two returns every cycle keeps merging into its full bucket.
+        """
+        with self._lock:
+            touched = self._add(candles)
+            batches = []
+            for timeframe, _ in self.targets:
+                buckets = self._buckets[timeframe]
+                bars = [_aggregate(buckets[b]) for b in touched[timeframe] if b >= self.floor_ms]
+                for bucket in sorted(buckets)[: -self.max_open_buckets]:
+                    del buckets[bucket]
+                if bars:
+                    batches.append(self._batch(timeframe, bars))
+            return batches
+
+    def collect(self, candles: Iterable[Sequence[Any]]) -> List[CandleBatch]:
+        """History: bars of the buckets the candles completed; the rest wait for flush()."""
+        with self._lock:
+            touched = self._add(candles)
+            batches = []
+            for timeframe, step_ms in self.targets:
+                buckets = self._buckets[timeframe]
+                done = [b for b in touched[timeframe] if self._complete(timeframe, step_ms, b)]
+                if done:
+                    batches.append(self._batch(timeframe, [_aggregate(buckets.pop(b)) for b in done]))
+            return batches
+
+    def flush(self) -> List[CandleBatch]:
+        """
+        Bars of the buckets still open (the forming one at the range end, exchange
+        gaps), then forget them. Buckets opening before the first candle seen were cut
+        by the range start and are dropped rather than written short.
+        """
+        with self._lock:
+            batches = []
+            for timeframe, _ in self.targets:
+                buckets, self._buckets[timeframe] = self._buckets[timeframe], {}
+                bars = [_aggregate(bucket) for opened, bucket in buckets.items() if opened >= (self._first_ms or 0)]
+                if bars:
+                    batches.append(self._batch(timeframe, bars))
+            return batches
+
+    def seed_from_ms(self, now_ms: int) -> int:
+        """Earliest open among the buckets forming at now_ms: where a live seed fetch starts."""
+        return min(candle_open_ms(now_ms, tf, step_ms) for tf, step_ms in self.targets)
+
+
+def _record_bars(rows: Iterable[OHLCVRecord]) -> List[Bar]:
+    return [
+        (int(row.timestamp.timestamp() * 1000), row.open, row.high, row.low, row.close, row.volume)
+        for row in rows
+    ]
+
+
+def _batch_bars(batch: CandleBatch) -> Iterable[Bar]:
+    return zip(batch.timestamps, batch.open, batch.high, batch.low, batch.close, batch.volume)
+
+
+class ResamplingFetcher:
+    """
+    Live fetch_fn for base-timeframe tasks that also returns the derived bars. The
+    first call per series seeds its resampler with every base candle of the buckets
+    forming now, so derived bars are never built from a partial bucket.
+    """
+
+    def __init__(
+        self,
+        plan: Dict[Tuple[str, str, str], Tuple[int, List[Tuple[str, int]]]],
+        fetch_fn: Callable = fetch_last_two,
+        seed_page_fn: Callable = fetch_history_page,
+        seed_page_limit: int = 1000,
+        now_fn: Optional[Callable[[], float]] = None,
+    ):
+        self.plan = plan
+        self.fetch_fn = fetch_fn
+        self.seed_page_fn = seed_page_fn
+        self.seed_page_limit = seed_page_limit
+        self.now_fn = now_fn or (lambda: datetime.now(tz=timezone.utc).timestamp())
+        self._resamplers: Dict[Tuple[str, str, str], Resampler] = {}
+        self._lock = threading.Lock()
+
+    def _resampler(self, client, symbol: str, timeframe: str) -> Resampler:
+        key = (client.id, symbol, timeframe)
+        with self._lock:
+            resampler = self._resamplers.get(key)
+            if resampler is not None:
+                return resampler
+        base_ms, targets = self.plan[key]
+        resampler = Resampler(client.id, symbol, timeframe, base_ms, targets)
+        cursor = resampler.floor_ms = resampler.seed_from_ms(int(self.now_fn() * 1000))
+        while True:
+            page = self.seed_page_fn(client, symbol, timeframe, cursor, self.seed_page_limit)
+            if not page:
+                break
+            resampler.update(_batch_bars(page))
+            if page.last_ms < cursor or len(page) < self.seed_page_limit:
+                break
+            cursor = page.last_ms + base_ms
+        with self._lock:
+            return self._resamplers.setdefault(key, resampler)
+
+    def __call__(self, client, symbol: str, timeframe: str) -> List[OHLCVRecord]:
+        rows = list(self.fetch_fn(client, symbol, timeframe))
+        if (client.id, symbol, timeframe) not in self.plan:
+            return rows
+        resampler = self._resampler(client, symbol, timeframe)
+        for batch in resampler.update(_record_bars(rows)):
+            rows.extend(batch.records())
+        return rows
+
+
+class ResamplingSink:
+    """
+    History storage_fn wrapper: stores each base page, then the derived bars of every
+    bucket it completed. close() writes the buckets left open at range edges.
+    """
+
+    def __init__(self, storage_fn: Callable, plan: Dict[Tuple[str, str, str], Tuple[int, List[Tuple[str, int]]]]):
+        self.storage_fn = storage_fn
+        self.plan = plan
+        self._resamplers: Dict[Tuple[str, str, str], Resampler] = {}
+        self._lock = threading.Lock()
+        self._target = None
+
+    def _resampler(self, batch: CandleBatch) -> Resampler:
+        key = (batch.exchange, batch.symbol, batch.timeframe)
+        with self._lock:
+            resampler = self._resamplers.get(key)
+            if resampler is None:
+                base_ms, targets = self.plan[key]
+                resampler = Resampler(batch.exchange, batch.symbol, batch.timeframe, base_ms, targets)
+                self._resamplers[key] = resampler
+            return resampler
+
+    def __call__(self, bq_client, dataset: str, table: str, rows: CandleBatch) -> None:
+        self.storage_fn(bq_client, dataset, table, rows)
+        self._target = (bq_client, dataset, table)
+        if (rows.exchange, rows.symbol, rows.timeframe) not in self.plan:
+            return
+        for batch in self._resampler(rows).collect(_batch_bars(rows)):
+            self.storage_fn(bq_client, dataset, table, batch)
+
+    def after_commit(self, callback: Callable[[], None]) -> None:
+        after_commit(self.storage_fn, callback)
+
+    def bucket_bounds(self, exchange: str, symbol: str, timeframe: str, from_ms: int, to_ms: int) -> Tuple[int, int]:
+        """
+        [from_ms, to_ms) widened to whole buckets of every derived timeframe, so a
+        resumed range re-reads the base candles its first and last buckets need.
+        """
+        targets = self.plan.get((exchange, symbol, timeframe), (0, []))[1]
+        open_ms = min((candle_open_ms(from_ms, tf, step_ms) for tf, step_ms in targets), default=from_ms)
+        close_ms = max(
+            (candle_close_ms(candle_open_ms(to_ms - 1, tf, step_ms), tf, step_ms) for tf, step_ms in targets),
+            default=to_ms,
+        )
+        return open_ms, max(close_ms, to_ms)
+
+    def close(self) -> None:
+        if self._target is None:
+            return
+        bq_client, dataset, table = self._target
+        for resampler in self._resamplers.values():
+            for batch in resampler.flush():
+                self.storage_fn(bq_client, dataset, table, batch)
@@ -1,11 +1,19 @@
 import random
+import threading
 import time
-from typing import Callable, Tuple, Optional
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Tuple, Optional
 
 import ccxt
 
+from tda_collector.logging_util import env_labels, log_struct
+from tda_collector.metrics import CIRCUIT_OPEN, RATE_LIMIT, RETRIES, THROTTLED
+
 RETRY_EXCEPTIONS = (ccxt.NetworkError, ccxt.RateLimitExceeded)
 
+# Request cost ccxt computed for the calls made by the current thread, if capturing.
+_request_costs = threading.local()
+
 
 def retry_with_backoff(
     func: Callable,
@@ -32,6 +40,7 @@ def retry_with_backoff(
         except RETRY_EXCEPTIONS as exc:
             if attempt >= max_attempts:
                 raise
+            RETRIES.inc(error=type(exc).__name__)
             sleep_for = min(max_delay, base_delay * (factor ** (attempt - 1)))
             sleep_for += jitter_fn(base_delay)
             sleep_fn(sleep_for)
@@ -39,3 +48,326 @@ def retry_with_backoff(
             # Non-retryable
             raise
 
+
+def retry_after_seconds(client) -> Optional[float]:
+    """
+    Seconds the exchange asked us to wait according to the last response headers:
+    Retry-After (seconds or HTTP date), or an exhausted X-RateLimit-Remaining with
+    its reset (seconds, or epoch seconds for large values).
+    """
+    headers = getattr(client, "last_response_headers", None)
+    if not isinstance(headers, dict) or not headers:
+        return None
+    lowered = {str(key).lower(): value for key, value in headers.items()}
+    retry_after = lowered.get("retry-after")
+    if retry_after is not None:
+        try:
+            return max(0.0, float(retry_after))
+        except (TypeError, ValueError):
+            try:
+                return max(0.0, parsedate_to_datetime(str(retry_after)).timestamp() - time.time())
+            except (TypeError, ValueError):
+                return None
+    remaining = lowered.get("x-ratelimit-remaining")
+    reset = lowered.get("x-ratelimit-reset")
+    try:
+        if remaining is not None and reset is not None and float(remaining) <= 0:
+            reset = float(reset)
+            return max(0.0, reset - time.time()) if reset > 1e9 else reset
+    except (TypeError, ValueError):
+        return None
+    return None
+
+
+class TokenBucket:
+    """
+    Rate limiter shared by every worker of one exchange.
+
+    Scheduled as a virtual clock (GCRA): each acquire(cost) reserves cost / rate
+    seconds, up to capacity calls may start back to back, and callers sleep until
+    their reserved slot outside the lock. The rate adapts AIMD-style: throttled()
+    halves it and pauses the bucket (for Retry-After when known), every success adds
+    a small step back up to the seeded rate. A rate of 0 means unlimited.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: float = 1.0,
+        min_rate_fraction: float = 0.1,
+        increase_fraction: float = 0.05,
+        sleep_fn: Optional[Callable[[float], None]] = None,
+        now_fn: Optional[Callable[[], float]] = None,
+    ):
+        self.max_rate = max(0.0, rate)
+        self.rate = self.max_rate
+        self.min_rate = self.max_rate * min_rate_fraction
+        self.increase = self.max_rate * increase_fraction
+        self.capacity = max(1.0, capacity)
+        self._sleep_fn = sleep_fn or time.sleep
+        self._now_fn = now_fn or time.monotonic
+        self._lock = threading.Lock()
+        self._tat = 0.0
+        self._paused_until = 0.0
+
+    def acquire(self, cost: float = 1.0) -> None:
+        with self._lock:
+            now = self._now_fn()
+            if self.rate > 0:
+                interval = cost / self.rate
+                burst = (self.capacity - 1) / self.rate
+                tat = max(self._tat, now, self._paused_until)
+                start = max(now, tat - burst, self._paused_until)
+                self._tat = max(tat, start) + interval
+            else:
+                start = max(now, self._paused_until)
+        if start > now:
+            self._sleep_fn(start - now)
+
+    def throttled(self, retry_after: Optional[float] = None) -> None:
+        with self._lock:
+            if self.rate > 0:
+                self.rate = max(self.min_rate, self.rate / 2)
+            # Unpaced buckets without Retry-After leave the wait to the caller's backoff.
+            pause = retry_after if retry_after is not None else (1 / self.rate if self.rate > 0 else 0.0)
+            self._paused_until = max(self._paused_until, self._now_fn() + pause)
+
+    def charge(self, cost: float) -> None:
+        """Book cost found out after a call started: the next callers wait for it."""
+        with self._lock:
+            if self.rate > 0:
+                self._tat = max(self._tat, self._now_fn()) + cost / self.rate
+
+    def succeeded(self) -> None:
+        if self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def wrap(self, func: Callable, cost: float = 1.0) -> Callable:
+        def limited(*args, **kwargs):
+            self.acquire(cost)
+            return func(*args, **kwargs)
+
+        return limited
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an exchange whose circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and rejects calls for
+    cooldown_seconds; then lets a single probe through (half-open) whose result
+    closes or re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        cooldown_seconds: float = 30.0,
+        now_fn: Optional[Callable[[], float]] = None,
+    ):
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown_seconds = cooldown_seconds
+        self.state = self.CLOSED
+        self._now_fn = now_fn or time.monotonic
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self._now_fn() - self._opened_at >= self.cooldown_seconds:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def retry_in(self) -> float:
+        """Seconds until the next probe may run (0 when calls are allowed)."""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self._opened_at + self.cooldown_seconds - self._now_fn())
+
+    def record_success(self) -> bool:
+        """Returns True when this success closed an open circuit."""
+        if self.state == self.CLOSED and not self._failures:
+            return False
+        with self._lock:
+            reopened = self.state != self.CLOSED
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+            return reopened
+
+    def record_failure(self) -> bool:
+        """Returns True when this failure opened the circuit."""
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self._failures >= self.failure_threshold
+            ):
+                self.state = self.OPEN
+                self._opened_at = self._now_fn()
+                self._probing = False
+                return True
+            return False
+
+
+def _capture_request_costs(client) -> None:
+    """
+    Record every cost ccxt's calculate_rate_limiter_cost() returns for client: the
+    endpoint's `cost` metadata, scaled by `byLimit` for the requested limit.
+    """
+    if getattr(client, "_tda_costs_captured", False) is not False:
+        return
+    calculate = getattr(client, "calculate_rate_limiter_cost", None)
+    if not callable(calculate):
+        return
+
+    def captured(*args, **kwargs):
+        cost = calculate(*args, **kwargs)
+        total = getattr(_request_costs, "total", None)
+        if total is not None:
+            _request_costs.total = total + float(cost)
+        return cost
+
+    client.calculate_rate_limiter_cost = captured
+    client._tda_costs_captured = True
+
+
+class ExchangeGuard:
+    """
+    Token bucket plus circuit breaker for one exchange, shared by all its tasks.
+
+    Calls are charged in ccxt cost units. The cost of a call is the one ccxt computed
+    for the previous call with the same cost key (e.g. the page limit), read from the
+    endpoint's `cost`/`byLimit` metadata; a first call is charged 1 and the rest is
+    booked once ccxt has priced it.
+    """
+
+    def __init__(
+        self,
+        exchange_id: str,
+        bucket: TokenBucket,
+        breaker: CircuitBreaker,
+        logger=None,
+        sleep_fn: Optional[Callable[[float], None]] = None,
+    ):
+        self.exchange_id = exchange_id
+        self.bucket = bucket
+        self.breaker = breaker
+        self.logger = logger
+        self._sleep_fn = sleep_fn or time.sleep
+        self._costs: Dict[Any, float] = {}
+
+    def wrap(
+        self,
+        client,
+        func: Callable,
+        cost: Optional[float] = None,
+        wait_when_open: bool = False,
+        cost_key: Optional[Callable[..., Any]] = None,
+    ) -> Callable:
+        """
+        Rate-limit and circuit-break func. With the circuit open the call raises
+        CircuitOpenError, or with wait_when_open sleeps until the next probe. Without
+        a fixed cost each call is charged what ccxt priced the last call with the same
+        cost_key(*args) (one key when omitted).
+        """
+        if cost is None:
+            _capture_request_costs(client)
+
+        def guarded(*args, **kwargs):
+            while not self.breaker.allow():
+                if not wait_when_open:
+                    raise CircuitOpenError(f"circuit open for {self.exchange_id}")
+                self._sleep_fn(max(self.breaker.retry_in(), 0.1))
+            key = cost_key(*args) if cost_key else None
+            charged = cost if cost is not None else self._costs.get(key, 1.0)
+            self.bucket.acquire(charged)
+            _request_costs.total = 0.0
+            try:
+                result = func(*args, **kwargs)
+            except ccxt.RateLimitExceeded:
+                # Throttling is the bucket's job: the exchange answered, so the circuit stays closed.
+                self.bucket.throttled(retry_after_seconds(client))
+                THROTTLED.inc(exchange=self.exchange_id)
+                RATE_LIMIT.set(self.bucket.rate, exchange=self.exchange_id)
+                self._reachable()
+                raise
+            except ccxt.NetworkError as exc:
+                if self.breaker.record_failure():
+                    CIRCUIT_OPEN.set(1, exchange=self.exchange_id)
+                    self._log({"event": "circuit_opened", "error": str(exc)})
+                raise
+            except Exception:
+                # Exchange-side errors (bad symbol, ...) still prove the exchange is reachable.
+                self._reachable()
+                raise
+            finally:
+                priced, _request_costs.total = _request_costs.total, None
+                if cost is None and priced > 0:
+                    self._costs[key] = priced
+                    if priced > charged:
+                        self.bucket.charge(priced - charged)
+            exhausted_for = retry_after_seconds(client)
+            if exhausted_for:
+                # The exchange reports its budget as used up; slow down before it answers 429.
+                self.bucket.throttled(exhausted_for)
+                RATE_LIMIT.set(self.bucket.rate, exchange=self.exchange_id)
+            elif self.bucket.rate < self.bucket.max_rate:
+                self.bucket.succeeded()
+                RATE_LIMIT.set(self.bucket.rate, exchange=self.exchange_id)
+            self._reachable()
+            return result
+
+        return guarded
+
+    def _reachable(self) -> None:
+        if self.breaker.record_success():
+            CIRCUIT_OPEN.set(0, exchange=self.exchange_id)
+            self._log({"event": "circuit_closed"})
+
+    def _log(self, fields: Dict) -> None:
+        if self.logger:
+            log_struct(self.logger, {**env_labels(), "exchange": self.exchange_id}, fields)
+
+
+def guard_for_client(
+    client,
+    capacity: float = 1.0,
+    failure_threshold: int = 5,
+    cooldown_seconds: float = 30.0,
+    logger=None,
+    paced: bool = True,
+) -> ExchangeGuard:
+    """
+    Guard seeded from ccxt's rateLimit (milliseconds per unit of request cost).
+    paced=False leaves steady pacing to ccxt's own throttle (serial callers), which
+    prices requests from the same endpoint metadata: the bucket then only pauses
+    after a 429 or an exhausted budget, next to the circuit breaker.
+    """
+    rate_limit_ms = getattr(client, "rateLimit", 0)
+    if not paced or not isinstance(rate_limit_ms, (int, float)) or rate_limit_ms <= 0:
+        rate_limit_ms = 0
+    rate = 1000 / rate_limit_ms if rate_limit_ms else 0.0
+    return ExchangeGuard(
+        str(getattr(client, "id", None)),
+        TokenBucket(rate, capacity=capacity),
+        CircuitBreaker(failure_threshold, cooldown_seconds),
+        logger=logger,
+    )
@@ -0,0 +1,239 @@
+import json
+import struct
+import threading
+from array import array
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from tda_collector.adapter import fetch_history_page
+from tda_collector.checkpoint import after_commit
+from tda_collector.logging_util import env_labels, log_struct
+from tda_collector.models import OHLCVRecord
+from tda_collector.timeframes import timeframe_ms
+
+SeriesKey = Tuple[str, str, str]
+Bar = Tuple[int, float, float, float, float, float]
+
+# Binary responses: one little-endian record per candle, oldest first.
+BAR_STRUCT = struct.Struct("<qddddd")
+
+
+class CandleRing:
+    """
+    The newest `capacity` candles of one series in preallocated arrays (int64 open
+    times, float64 OHLCV), kept in ascending time order. A repeated timestamp replaces
+    the stored bar, so updates of the forming candle overwrite in place.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self._ts = array("q", bytes(8 * self.capacity))
+        self._values = [array("d", bytes(8 * self.capacity)) for _ in range(5)]
+        self._start = 0
+        self._len = 0
+
+    def __len__(self) -> int:
+        return self._len
+
+    def _slot(self, position: int) -> int:
+        return (self._start + position) % self.capacity
+
+    def _find(self, ts_ms: int) -> int:
+        """Position of the first stored bar with open time >= ts_ms."""
+        lo, hi = 0, self._len
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._ts[self._slot(mid)] < ts_ms:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _write(self, slot: int, bar: Bar) -> None:
+        self._ts[slot] = bar[0]
+        for column, value in zip(self._values, bar[1:]):
+            column[slot] = value
+
+    def _read(self, slot: int) -> Bar:
+        return (self._ts[slot], *(column[slot] for column in self._values))
+
+    def put(self, bar: Bar, overwrite: bool = True) -> None:
+        if not self._len or bar[0] > self._ts[self._slot(self._len - 1)]:
+            if self._len < self.capacity:
+                self._write(self._slot(self._len), bar)
+                self._len += 1
+            else:
+                self._write(self._start, bar)
+                self._start = (self._start + 1) % self.capacity
+            return
+        position = self._find(bar[0])
+        if position < self._len and self._ts[self._slot(position)] == bar[0]:
+            if overwrite:
+                self._write(self._slot(position), bar)
+            return
+        if position == 0 and self._len == self.capacity:
+            return  # older than everything kept
+        # Rare out-of-order insert (startup warm-up racing the live loop): rebuild in order.
+        bars = self.latest(self._len)
+        bars.insert(position, bar)
+        bars = bars[-self.capacity :]
+        self._start, self._len = 0, len(bars)
+        for slot, stored in enumerate(bars):
+            self._write(slot, stored)
+
+    def latest(self, limit: int, since_ms: Optional[int] = None) -> List[Bar]:
+        """Up to limit newest bars (with open time >= since_ms), oldest first."""
+        first = max(0, self._len - max(0, limit))
+        if since_ms is not None:
+            first = max(first, self._find(since_ms))
+        return [self._read(self._slot(position)) for position in range(first, self._len)]
+
+
+class RingStore:
+    """Thread-safe CandleRing per (exchange, symbol, timeframe)."""
+
+    def __init__(self, capacity: int = 500):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._rings: Dict[SeriesKey, CandleRing] = {}
+
+    def _ring(self, key: SeriesKey) -> CandleRing:
+        ring = self._rings.get(key)
+        if ring is None:
+            ring = self._rings[key] = CandleRing(self.capacity)
+        return ring
+
+    def add_records(self, rows: Iterable[OHLCVRecord]) -> None:
+        with self._lock:
+            for row in rows:
+                ts_ms = int(row.timestamp.timestamp() * 1000)
+                self._ring((row.exchange, row.symbol, row.timeframe)).put(
+                    (ts_ms, row.open, row.high, row.low, row.close, row.volume)
+                )
+
+    def seed(self, key: SeriesKey, bars: Iterable[Sequence]) -> None:
+        """Startup fill: add bars the live loop has not already stored."""
+        with self._lock:
+            ring = self._ring(key)
+            for bar in bars:
+                ring.put((int(bar[0]), *map(float, bar[1:6])), overwrite=False)
+
+    def latest(self, key: SeriesKey, limit: int, since_ms: Optional[int] = None) -> List[Bar]:
+        with self._lock:
+            ring = self._rings.get(key)
+            return ring.latest(limit, since_ms) if ring else []
+
+    def series(self) -> List[Dict]:
+        with self._lock:
+            return [
+                {"exchange": ex, "symbol": sym, "timeframe": tf, "bars": len(ring)}
+                for (ex, sym, tf), ring in sorted(self._rings.items())
+            ]
+
+
+class RingFeedingSink:
+    """Live storage_fn wrapper that records every written bar in the ring store first."""
+
+    def __init__(self, storage_fn: Callable, store: RingStore):
+        self.storage_fn = storage_fn
+        self.store = store
+
+    def __call__(self, bq_client, dataset: str, table: str, rows: List[OHLCVRecord]) -> None:
+        self.store.add_records(rows)
+        self.storage_fn(bq_client, dataset, table, rows)
+
+    def after_commit(self, callback: Callable[[], None]) -> None:
+        after_commit(self.storage_fn, callback)
+
+
+def warm_ring_store(
+    store: RingStore,
+    tasks: Iterable[Tuple],
+    logger=None,
+    page_fn: Callable = fetch_history_page,
+    now_fn: Optional[Callable[[], float]] = None,
+    mode: str = "live",
+) -> None:
+    """Fill each (client, symbol, timeframe) ring with its newest candles, one page per series."""
+    now_ms = int((now_fn or (lambda: datetime.now(tz=timezone.utc).timestamp()))() * 1000)
+    labels = {**env_labels(), "mode": mode}
+    series = rows = 0
+    for client, symbol, timeframe, *_ in tasks:
+        since_ms = now_ms - store.capacity * timeframe_ms(client, timeframe)
+        try:
+            page = page_fn(client, symbol, timeframe, since_ms, store.capacity)
+        except Exception as exc:
+            log_struct(
+                logger,
+                {**labels, "exchange": client.id, "symbol": symbol, "timeframe": timeframe},
+                {"event": "ring_warm_error", "error": str(exc)},
+            )
+            continue
+        bars = zip(page.timestamps, page.open, page.high, page.low, page.close, page.volume)
+        store.seed((client.id, symbol, timeframe), bars)
+        series += 1
+        rows += len(page)
+    log_struct(logger, labels, {"event": "ring_warmed", "series": series, "rows": rows})
+
+
+class _QueryHandler(BaseHTTPRequestHandler):
+    store: RingStore
+
+    def _send(self, status: int, content_type: str, body: bytes, headers: Optional[Dict] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, status: int, payload) -> None:
+        self._send(status, "application/json", json.dumps(payload).encode("utf-8"))
+
+    def do_GET(self):  # noqa: N802 - http.server naming
+        url = urlparse(self.path)
+        params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        if url.path == "/series":
+            self._json(200, self.store.series())
+            return
+        if url.path != "/candles":
+            self.send_error(404)
+            return
+        try:
+            key = (params["exchange"], params["symbol"], params["timeframe"])
+            limit = int(params.get("limit", self.store.capacity))
+            since_ms = int(params["since"]) if "since" in params else None
+        except (KeyError, ValueError):
+            self._json(400, {"error": "exchange, symbol and timeframe are required; limit/since are integers"})
+            return
+        bars = self.store.latest(key, limit, since_ms)
+        if params.get("format") == "binary":
+            body = b"".join(BAR_STRUCT.pack(*bar) for bar in bars)
+            self._send(200, "application/octet-stream", body, {"X-Candle-Count": str(len(bars))})
+            return
+        self._json(
+            200,
+            {
+                "exchange": key[0],
+                "symbol": key[1],
+                "timeframe": key[2],
+                "columns": ["timestamp", "open", "high", "low", "close", "volume"],
+                "candles": [list(bar) for bar in bars],
+            },
+        )
+
+    def log_message(self, format, *args):  # noqa: A002 - keep queries out of stdout logs
+        return
+
+
+def start_query_server(store: RingStore, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve /candles and /series from the ring store on a daemon thread."""
+    handler = type("QueryHandler", (_QueryHandler,), {"store": store})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="query-http", daemon=True)
+    thread.start()
+    return server
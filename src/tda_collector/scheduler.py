@@ -1,10 +1,160 @@
+import functools
+import heapq
 import time
-from typing import Callable, Iterable, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
 
 from tda_collector.adapter import fetch_last_two, fetch_history_page
+from tda_collector.checkpoint import CheckpointStore, after_commit
+from tda_collector.dedup import LastWrittenCache
 from tda_collector.logging_util import log_struct, env_labels
+from tda_collector.metrics import (
+    FETCH_SECONDS,
+    HISTORY_CURSOR_LAG,
+    LIVE_CYCLE_ERRORS,
+    LIVE_CYCLE_SECONDS,
+    LIVE_DRIFT_SECONDS,
+    LIVE_INTERVAL_SECONDS,
+    LIVE_OVERRUNS,
+    LIVE_TASKS_DEFERRED,
+    timed,
+)
+from tda_collector.pagecache import CachingPageFetcher
+from tda_collector.probing import PageLimitCache, discover_page_limit, find_first_candle_ms
 from tda_collector.storage import insert_rows
-from tda_collector.resilience import retry_with_backoff
+from tda_collector.resilience import CircuitOpenError, ExchangeGuard, guard_for_client, retry_with_backoff
+from tda_collector.timeframes import next_close_ms, timeframe_ms
+from tda_collector.universe import LiveTaskSet, task_key
+
+# Longest aligned-loop sleep while a LiveTaskSet may hand over new tasks.
+TASK_SET_POLL_SECONDS = 5.0
+
+
+class ExchangePools:
+    """
+    One bounded thread pool per exchange so tasks fan out per exchange while
+    different exchanges progress side by side.
+    """
+
+    def __init__(self, workers_per_exchange: int = 1, name: str = "worker"):
+        self.workers_per_exchange = max(1, int(workers_per_exchange))
+        self.name = name
+        self._pools: Dict[str, ThreadPoolExecutor] = {}
+
+    def _pool(self, exchange_id: str) -> ThreadPoolExecutor:
+        pool = self._pools.get(exchange_id)
+        if pool is None:
+            pool = ThreadPoolExecutor(
+                max_workers=self.workers_per_exchange,
+                thread_name_prefix=f"{self.name}-{exchange_id}",
+            )
+            self._pools[exchange_id] = pool
+        return pool
+
+    def map(self, func: Callable, tasks: Iterable[Tuple]) -> List:
+        """Run func(*task) for every task; results keep the task order."""
+        tasks = list(tasks)
+        if self.workers_per_exchange == 1:
+            return [func(*task) for task in tasks]
+        futures = [self._pool(str(getattr(task[0], "id", None))).submit(func, *task) for task in tasks]
+        return [f.result() for f in futures]
+
+    def shutdown(self) -> None:
+        for pool in self._pools.values():
+            pool.shutdown(wait=True)
+        self._pools.clear()
+
+
+def _guards_for(
+    tasks: Iterable[Tuple], guard_cfg: Optional[Dict] = None, logger=None, paced: bool = True
+) -> Dict[str, ExchangeGuard]:
+    """
+    One shared rate limiter and circuit breaker per exchange. Serial loops keep
+    relying on ccxt's own throttling for steady pacing (paced=False).
+    """
+    guards: Dict[str, ExchangeGuard] = {}
+    for task in tasks:
+        client = task[0]
+        exchange_id = str(getattr(client, "id", None))
+        if exchange_id not in guards:
+            guards[exchange_id] = guard_for_client(client, logger=logger, paced=paced, **(guard_cfg or {}))
+    return guards
+
+
+def _live_task_runner(
+    tasks: List[Tuple],
+    fetch_fn: Callable,
+    storage_fn: Callable,
+    logger,
+    labels: Dict,
+    bq_client,
+    dataset: str,
+    table: str,
+    backoff_cfg: Dict,
+    guards: Dict[str, ExchangeGuard],
+    change_cache: Optional[LastWrittenCache] = None,
+) -> Callable[..., bool]:
+    def run_task(client, symbol, timeframe) -> bool:
+        task_labels = {**labels, "exchange": getattr(client, "id", None), "symbol": symbol, "timeframe": timeframe}
+        guard = guards.get(str(getattr(client, "id", None)))
+        task_fetch = timed(FETCH_SECONDS, fetch_fn, exchange=getattr(client, "id", None), mode="live")
+        task_fetch = guard.wrap(client, task_fetch) if guard else task_fetch
+        try:
+            # fetch_last_two returns (prev, curr); resampling fetchers append derived bars.
+            rows = list(retry_with_backoff(task_fetch, (client, symbol, timeframe), **backoff_cfg))
+            if change_cache:
+                # Skip bars whose OHLCV is identical to what was already written.
+                rows = change_cache.changed(rows)
+            if rows:
+                retry_with_backoff(storage_fn, (bq_client, dataset, table, rows), **backoff_cfg)
+                if change_cache:
+                    # Only committed bars count as written; dropped ones are sent again.
+                    after_commit(storage_fn, functools.partial(change_cache.mark, rows))
+            log_struct(
+                logger,
+                task_labels,
+                {"event": "live_cycle_complete", "message": "live insert ok", "rows": len(rows)},
+            )
+            return True
+        except CircuitOpenError as exc:
+            # The exchange is failing; skip it this round instead of piling up retries.
+            log_struct(logger, task_labels, {"event": "live_task_skipped", "reason": str(exc)})
+            return False
+        except Exception as exc:  # pragma: no cover - runtime guard
+            LIVE_CYCLE_ERRORS.inc(exchange=getattr(client, "id", None))
+            log_struct(logger, task_labels, {"event": "live_cycle_error", "error": str(exc)})
+            return False
+
+    return run_task
+
+
+def _carry_over(old_tasks: List[Tuple], old_state: List, new_tasks: List[Tuple], init: Callable) -> List:
+    """Per-task state for new_tasks: kept by key for tasks in old_tasks, init(task) for added ones."""
+    carried = {task_key(task): state for task, state in zip(old_tasks, old_state)}
+    state = []
+    for task in new_tasks:
+        key = task_key(task)
+        state.append(carried[key] if key in carried else init(task))
+    return state
+
+
+def _add_guards(
+    guards: Dict[str, ExchangeGuard], tasks: Iterable[Tuple], guard_cfg: Optional[Dict], logger, paced: bool
+) -> None:
+    """Give exchanges first seen in tasks their guard; the runner reads guards by exchange id."""
+    missing = [task for task in tasks if str(getattr(task[0], "id", None)) not in guards]
+    guards.update(_guards_for(missing, guard_cfg, logger, paced=paced))
+
+
+def _pair_priority(task: Tuple, priorities: Optional[Dict[Tuple[str, str], int]]) -> int:
+    return (priorities or {}).get((str(getattr(task[0], "id", None)), task[1]), 0)
+
+
+def _priority_order(
+    tasks: List[Tuple], priorities: Optional[Dict[Tuple[str, str], int]], slack: List[float]
+) -> List[int]:
+    """Task indexes, most important first: higher pair priority, then least slack."""
+    return sorted(range(len(tasks)), key=lambda i: (-_pair_priority(tasks[i], priorities), slack[i], i))
 
 
 def run_live_loop(
@@ -17,30 +167,277 @@ def run_live_loop(
     dataset="crypto",
     table="market_data_ohlcv",
     backoff_cfg=None,
+    workers_per_exchange: int = 1,
+    sleep_fn: Optional[Callable[[float], None]] = None,
+    change_cache: Optional[LastWrittenCache] = None,
+    guard_cfg: Optional[Dict] = None,
+    priorities: Optional[Dict[Tuple[str, str], int]] = None,
+    timeframe_window_ms: int = 60_000,
+    clock_fn: Optional[Callable[[], float]] = None,
+    task_set: Optional[LiveTaskSet] = None,
 ):
+    """
+    Poll every task once per interval on a fixed-rate timeline: cycle k is due at
+    start + k * interval whatever the previous cycles took.
+
+    Under overload tasks are shed by urgency. fetch_last_two returns the previous bar
+    too, so a task can wait until one candle after its last successful run without
+    losing a closed bar; its slack is the time left until then. Tasks run by pair
+    priority, then least slack (fast timeframes first). A task with slack beyond the next tick
+    is deferred when it would not finish before that tick at the average task
+    duration. A cycle that still overruns skips the ticks it ran through instead of
+    drifting.
+
+    A task that never ran has no slack: it runs before the others, but its first run
+    waits for the next cycle when it would not finish before the tick, so thousands
+    of new tasks are staggered over the first cycles instead of overrunning one.
+    The first task of each exchange in a cycle is never deferred, so the staggering
+    moves on even when a single fetch takes longer than the interval.
+    With task_set, the loop switches to its newest task list between cycles;
+    surviving tasks keep their state.
+    """
     labels = {**env_labels(), "mode": "live"}
     backoff_cfg = backoff_cfg or {}
-    while True:
-        for client, symbol, timeframe in tasks:
-            try:
-                prev_bar, curr_bar = retry_with_backoff(
-                    fetch_fn, (client, symbol, timeframe), **backoff_cfg
-                )
-                retry_with_backoff(
-                    storage_fn, (bq_client, dataset, table, [prev_bar, curr_bar]), **backoff_cfg
+    sleep_fn = sleep_fn or time.sleep
+    clock_fn = clock_fn or time.monotonic
+    version, tasks = task_set.snapshot() if task_set is not None else (0, list(tasks))
+    pools = ExchangePools(workers_per_exchange, name="live")
+    paced = pools.workers_per_exchange > 1
+    guards = _guards_for(tasks, guard_cfg, logger, paced=paced)
+    run_task = _live_task_runner(
+        tasks, fetch_fn, storage_fn, logger, labels, bq_client, dataset, table, backoff_cfg,
+        guards=guards,
+        change_cache=change_cache,
+    )
+    steps = [timeframe_ms(client, timeframe, timeframe_window_ms) for client, _, timeframe in tasks]
+    last_run: List[Optional[float]] = [None] * len(tasks)
+    interval_ms = int(interval_seconds * 1000)
+    LIVE_INTERVAL_SECONDS.set(interval_seconds)
+    task_seconds = {"avg": 0.0}
+    cycle_started: Set[Optional[str]] = set()
+    next_tick = clock_fn()
+
+    def slack_seconds(index: int, now: float) -> float:
+        if last_run[index] is None:
+            return float("-inf")
+        return last_run[index] + steps[index] / 1000 - now
+
+    def run_indexed(client, symbol, timeframe, index, deadline) -> Optional[bool]:
+        if deadline is None:
+            return run_task(client, symbol, timeframe)
+        started = clock_fn()
+        exchange_id = getattr(client, "id", None)
+        # The first task of an exchange runs every cycle: once one fetch outlasts the
+        # interval nothing would fit, and never-run tasks would be deferred forever.
+        if (
+            exchange_id in cycle_started
+            and started + task_seconds["avg"] > deadline
+            and (last_run[index] is None or slack_seconds(index, started) > deadline - started + interval_seconds)
+        ):
+            LIVE_TASKS_DEFERRED.inc(exchange=exchange_id)
+            return None
+        cycle_started.add(exchange_id)
+        ok = run_task(client, symbol, timeframe)
+        if ok:
+            # A failed run captured nothing, so its slack still counts from the last success.
+            last_run[index] = started
+        # Exponential average; races between pool threads only blur it slightly.
+        task_seconds["avg"] += 0.2 * ((clock_fn() - started) - task_seconds["avg"])
+        return ok
+
+    try:
+        while True:
+            if task_set is not None and task_set.version != version:
+                version, new_tasks = task_set.snapshot()
+                state = _carry_over(
+                    tasks,
+                    list(zip(steps, last_run)),
+                    new_tasks,
+                    lambda task: (timeframe_ms(task[0], task[2], timeframe_window_ms), None),
                 )
-                log_struct(
-                    logger,
-                    {**labels, "exchange": client.id, "symbol": symbol, "timeframe": timeframe},
-                    {"event": "live_cycle_complete", "message": "live insert ok"},
+                tasks[:], steps[:], last_run[:] = new_tasks, [s[0] for s in state], [s[1] for s in state]
+                _add_guards(guards, tasks, guard_cfg, logger, paced)
+            tick = next_tick
+            next_tick = tick + interval_seconds
+            started = clock_fn()
+            deadline = next_tick if interval_seconds > 0 else None
+            slack = [slack_seconds(index, started) for index in range(len(tasks))]
+            order = _priority_order(tasks, priorities, slack)
+            cycle_started.clear()
+            results = pools.map(run_indexed, [(*tasks[i], i, deadline) for i in order])
+            finished = clock_fn()
+            duration_ms = int((finished - started) * 1000)
+            lag_ms = int((started - tick) * 1000)
+            overrun_ticks = 0
+            if interval_seconds > 0 and finished > next_tick:
+                # Skip the ticks this cycle ran through and stay on the original phase.
+                overrun_ticks = int((finished - next_tick) // interval_seconds) + 1
+                next_tick += overrun_ticks * interval_seconds
+                LIVE_OVERRUNS.inc(overrun_ticks)
+            LIVE_CYCLE_SECONDS.set(duration_ms / 1000, schedule="interval")
+            LIVE_DRIFT_SECONDS.set(lag_ms / 1000)
+            log_struct(
+                logger,
+                labels,
+                {
+                    "event": "live_cycle_summary",
+                    "tasks": len(results),
+                    "errors": results.count(False),
+                    "deferred": results.count(None),
+                    "duration_ms": duration_ms,
+                    "interval_ms": interval_ms,
+                    "headroom_ms": interval_ms - duration_ms,
+                    "lag_ms": lag_ms,
+                    "overrun_ticks": overrun_ticks,
+                },
+            )
+            sleep_fn(max(0.0, next_tick - clock_fn()))
+    finally:
+        pools.shutdown()
+
+
+def run_aligned_live_loop(
+    tasks: Iterable[Tuple],
+    fetch_fn: Callable = fetch_last_two,
+    storage_fn: Callable = insert_rows,
+    logger=None,
+    bq_client=None,
+    dataset="crypto",
+    table="market_data_ohlcv",
+    backoff_cfg=None,
+    workers_per_exchange: int = 1,
+    settle_seconds: float = 2.0,
+    forming_refresh_seconds: float = 0,
+    timeframe_window_ms: int = 60_000,
+    sleep_fn: Optional[Callable[[float], None]] = None,
+    now_fn: Optional[Callable[[], float]] = None,
+    change_cache: Optional[LastWrittenCache] = None,
+    guard_cfg: Optional[Dict] = None,
+    priorities: Optional[Dict[Tuple[str, str], int]] = None,
+    task_set: Optional[LiveTaskSet] = None,
+):
+    """
+    Live loop that wakes each task shortly after its candle closes instead of polling
+    every task on a fixed interval. forming_refresh_seconds > 0 additionally refreshes
+    the still-forming bar at that cadence. With task_set, tasks it adds run at the
+    next wake and then follow their closes; removed ones are dropped from the schedule.
+    """
+    labels = {**env_labels(), "mode": "live"}
+    backoff_cfg = backoff_cfg or {}
+    sleep_fn = sleep_fn or time.sleep
+    now_fn = now_fn or time.time
+    version, tasks = task_set.snapshot() if task_set is not None else (0, list(tasks))
+    pools = ExchangePools(workers_per_exchange, name="live")
+    paced = pools.workers_per_exchange > 1
+    guards = _guards_for(tasks, guard_cfg, logger, paced=paced)
+    run_task = _live_task_runner(
+        tasks, fetch_fn, storage_fn, logger, labels, bq_client, dataset, table, backoff_cfg,
+        guards=guards,
+        change_cache=change_cache,
+    )
+    steps = [timeframe_ms(client, timeframe, timeframe_window_ms) for client, _, timeframe in tasks]
+    settle_ms = int(settle_seconds * 1000)
+    refresh_ms = int(forming_refresh_seconds * 1000)
+
+    def next_due_ms(index: int, now_ms: int) -> int:
+        # Settled wake of the earliest close not yet run settle_ms after: a refresh
+        # wake between a close and close + settle does not consume that close.
+        due = next_close_ms(now_ms - settle_ms, tasks[index][2], steps[index]) + settle_ms
+        if refresh_ms > 0:
+            due = min(due, now_ms + refresh_ms)
+        return due
+
+    # Every task runs once at startup so the forming bar is current, then follows its closes.
+    now_ms = int(now_fn() * 1000)
+    schedule = [(now_ms, index) for index in range(len(tasks))]
+    heapq.heapify(schedule)
+
+    try:
+        while schedule or task_set is not None:
+            if task_set is not None and task_set.version != version:
+                version, new_tasks = task_set.snapshot()
+                now_ms = int(now_fn() * 1000)
+                due_at = {index: due_ms for due_ms, index in schedule}
+                state = _carry_over(
+                    tasks,
+                    [(steps[index], due_at.get(index, now_ms)) for index in range(len(tasks))],
+                    new_tasks,
+                    lambda task: (timeframe_ms(task[0], task[2], timeframe_window_ms), now_ms),
                 )
-            except Exception as exc:  # pragma: no cover - runtime guard
+                tasks[:], steps[:] = new_tasks, [s[0] for s in state]
+                schedule = [(due_ms, index) for index, (_, due_ms) in enumerate(state)]
+                heapq.heapify(schedule)
+                _add_guards(guards, tasks, guard_cfg, logger, paced)
+
+            now_ms = int(now_fn() * 1000)
+            due: List[int] = []
+            lag_ms = 0
+            while schedule and schedule[0][0] <= now_ms:
+                due_ms, index = heapq.heappop(schedule)
+                lag_ms = max(lag_ms, now_ms - due_ms)
+                due.append(index)
+
+            if due:
+                # Higher-priority pairs first when several tasks wake together.
+                due.sort(key=lambda index: -_pair_priority(tasks[index], priorities))
+                started = time.monotonic()
+                results = pools.map(run_task, [tasks[index] for index in due])
+                duration_ms = int((time.monotonic() - started) * 1000)
+                LIVE_CYCLE_SECONDS.set(duration_ms / 1000, schedule="aligned")
                 log_struct(
                     logger,
-                    {**labels, "exchange": getattr(client, "id", None), "symbol": symbol, "timeframe": timeframe},
-                    {"event": "live_cycle_error", "error": str(exc)},
+                    labels,
+                    {
+                        "event": "live_wake_summary",
+                        "tasks": len(results),
+                        "errors": results.count(False),
+                        "duration_ms": duration_ms,
+                        "lag_ms": lag_ms,
+                    },
                 )
-        time.sleep(interval_seconds)
+                # Schedule from the wake time, not from after the run: a run that crossed
+                # a candle close did not see that candle closed, so it is fetched again.
+                for index in due:
+                    heapq.heappush(schedule, (next_due_ms(index, now_ms), index))
+
+            wait_ms = schedule[0][0] - int(now_fn() * 1000) if schedule else None
+            if task_set is not None:
+                # Wake up regularly to pick up tasks added meanwhile.
+                poll_ms = int(TASK_SET_POLL_SECONDS * 1000)
+                wait_ms = poll_ms if wait_ms is None else min(wait_ms, poll_ms)
+            if wait_ms > 0:
+                sleep_fn(wait_ms / 1000)
+    finally:
+        pools.shutdown()
+
+
+def _history_shards(
+    tasks: Iterable[Tuple], shard_span: Callable[..., int], step_for: Callable
+) -> List[Tuple]:
+    """
+    Split each (client, symbol, timeframe, start_ms, end_ms) task into independent
+    time shards, ordered round-robin across tasks so every exchange gets work early.
+    Shards carry their task's start_ms and end_ms last to look up per-task probe
+    results and bound resumed derived buckets.
+    """
+    per_task: List[List[Tuple]] = []
+    for client, symbol, timeframe, start_ms, end_ms in tasks:
+        step_ms = step_for(client, timeframe)
+        span = max(step_ms, shard_span(client, timeframe, step_ms))
+        shards = []
+        shard_start = start_ms
+        while shard_start < end_ms:
+            shard_end = min(end_ms, shard_start + span)
+            shards.append((client, symbol, timeframe, shard_start, shard_end, step_ms, start_ms, end_ms))
+            shard_start = shard_end
+        per_task.append(shards)
+
+    interleaved: List[Tuple] = []
+    for round_index in range(max((len(shards) for shards in per_task), default=0)):
+        for shards in per_task:
+            if round_index < len(shards):
+                interleaved.append(shards[round_index])
+    return interleaved
 
 
 def run_history_loop(
@@ -54,35 +451,142 @@ def run_history_loop(
     page_limit: int = 200,
     timeframe_window_ms: int = 60_000,
     backoff_cfg=None,
+    workers_per_exchange: int = 1,
+    shard_pages: int = 10,
+    checkpoints: Optional[CheckpointStore] = None,
+    resume: bool = False,
+    guard_cfg: Optional[Dict] = None,
+    page_limits: Optional[PageLimitCache] = None,
+    max_page_limit: int = 0,
+    probe_listing: bool = False,
 ):
+    """
+    Backfill each task's [start_ms, end_ms) window page by page.
+
+    Before paging, probe_listing looks up each series' first candle so ranges
+    starting before the listing skip the empty part, and with page_limits and
+    max_page_limit > page_limit the largest page each (exchange, timeframe) accepts is
+    discovered once, cached, and used instead of page_limit.
+
+    With workers_per_exchange > 1 every window is split into shards of
+    shard_pages * page_limit candles that run in parallel on one pool per exchange.
+
+    Requests of each exchange share one adaptive rate limiter and circuit breaker
+    (guard_cfg); while an exchange's circuit is open its ranges wait for the next probe.
+
+    With a checkpoint store the committed cursor of every range is recorded after
+    each stored page; resume=True starts each range after its committed cursor. When
+    storage_fn derives coarser timeframes (bucket_bounds()), a resumed range is widened
+    to the derived buckets around its cursor and end, so buckets cut by the restart
+    are rebuilt from every base candle.
+    """
     labels = {**env_labels(), "mode": "history"}
     backoff_cfg = backoff_cfg or {}
-    for client, symbol, timeframe, start_ms, end_ms in tasks:
-        # Derive step from exchange timeframe parsing when available; fallback to provided window.
-        step_ms = timeframe_window_ms
-        if hasattr(client, "parse_timeframe"):
-            try:
-                step_ms = int(client.parse_timeframe(timeframe) * 1000)
-            except Exception:
-                step_ms = timeframe_window_ms
+    tasks = list(tasks)
+    pools = ExchangePools(workers_per_exchange, name="history")
+    guards = _guards_for(tasks, guard_cfg, logger, paced=pools.workers_per_exchange > 1)
+    first_candle: Dict[Tuple, int] = {}
+
+    def guarded_page_fetch(client) -> Callable:
+        guard = guards.get(str(getattr(client, "id", None)))
+        caching = isinstance(fetch_page_fn, CachingPageFetcher)
+        # Page cache hits skip the exchange, so only misses take rate tokens and count as requests.
+        inner = fetch_page_fn.fetch_fn if caching else fetch_page_fn
+        page_fetch = timed(FETCH_SECONDS, inner, exchange=getattr(client, "id", None), mode="history")
+        if guard:
+            # Page cost grows with the limit on exchanges with `byLimit` weights.
+            page_fetch = guard.wrap(
+                client, page_fetch, wait_when_open=True, cost_key=lambda client, symbol, timeframe, since, limit: limit
+            )
+        return fetch_page_fn.through(page_fetch) if caching else page_fetch
+
+    def limit_for(client, timeframe) -> int:
+        discovered = page_limits.get(client.id, timeframe) if page_limits else None
+        return discovered or page_limit
+
+    def prepare(client, symbol, timeframe, start_ms, end_ms) -> None:
+        page_fetch = guarded_page_fetch(client)
+
+        def fetch(*args):
+            return retry_with_backoff(page_fetch, args, **backoff_cfg)
+
+        step_ms = step_for(client, timeframe)
+        range_labels = {**labels, "exchange": client.id, "symbol": symbol, "timeframe": timeframe}
+        try:
+            first_ms = start_ms
+            if probe_listing:
+                first_ms = find_first_candle_ms(fetch, client, symbol, timeframe, start_ms, end_ms, step_ms)
+                first_candle[(client.id, symbol, timeframe, start_ms)] = first_ms
+                if first_ms > start_ms:
+                    log_struct(
+                        logger,
+                        range_labels,
+                        {"event": "history_listing_probed", "start_ms": start_ms, "first_ms": first_ms},
+                    )
+            if page_limits is not None and max_page_limit > page_limit and page_limits.get(client.id, timeframe) is None:
+                discovered = discover_page_limit(
+                    fetch, client, symbol, timeframe, first_ms, end_ms, step_ms, page_limit, max_page_limit
+                )
+                if discovered:
+                    page_limits.set(client.id, timeframe, discovered)
+                    log_struct(logger, range_labels, {"event": "history_page_limit_discovered", "limit": discovered})
+        except Exception as exc:  # pragma: no cover - runtime guard
+            # Probing is an optimisation; the range is still backfilled with defaults.
+            log_struct(logger, range_labels, {"event": "history_probe_error", "error": str(exc)})
 
-        cursor = start_ms
-        while cursor < end_ms:
+    def backfill_range(client, symbol, timeframe, start_ms, end_ms, step_ms, task_start_ms, task_end_ms) -> None:
+        page_fetch = guarded_page_fetch(client)
+        range_labels = {**labels, "exchange": getattr(client, "id", None), "symbol": symbol, "timeframe": timeframe}
+        task_limit = limit_for(client, timeframe)
+        listed_ms = first_candle.get((getattr(client, "id", None), symbol, timeframe, task_start_ms), task_start_ms)
+        cursor = max(start_ms, listed_ms)
+        fetch_end_ms = end_ms
+        if checkpoints and resume:
+            resumed = checkpoints.resume_cursor(client.id, symbol, timeframe, cursor)
+            # A fresh range has no checkpoint row: keep the probed listing cursor.
+            if resumed > cursor:
+                cursor = resumed
+                log_struct(
+                    logger,
+                    range_labels,
+                    {"event": "history_resumed", "start_ms": start_ms, "cursor_ms": cursor, "end_ms": end_ms},
+                )
+            bucket_bounds = getattr(storage_fn, "bucket_bounds", None)
+            if callable(bucket_bounds) and cursor < end_ms:
+                # Base candles of straddling derived buckets committed by an earlier run (this
+                # range's or a finished neighbour's) are fetched again to rebuild those buckets.
+                open_ms, close_ms = bucket_bounds(client.id, symbol, timeframe, cursor, end_ms)
+                if checkpoints.resume_cursor(client.id, symbol, timeframe, open_ms) > open_ms:
+                    cursor = max(listed_ms, min(cursor, open_ms))
+                if checkpoints.resume_cursor(client.id, symbol, timeframe, end_ms) > end_ms:
+                    fetch_end_ms = min(task_end_ms, max(end_ms, close_ms))
+        while cursor < fetch_end_ms:
             try:
                 rows = retry_with_backoff(
-                    fetch_page_fn, (client, symbol, timeframe, cursor, page_limit), **backoff_cfg
+                    page_fetch, (client, symbol, timeframe, cursor, task_limit), **backoff_cfg
                 )
                 if not rows:
                     break
                 # Keep only candles inside the requested window.
-                bounded_rows = [
-                    row for row in rows if cursor <= int(row.timestamp.timestamp() * 1000) < end_ms
-                ]
+                bounded_rows = rows.window(cursor, fetch_end_ms)
                 if bounded_rows:
                     retry_with_backoff(
                         storage_fn, (bq_client, dataset, table, bounded_rows), **backoff_cfg
                     )
-                    cursor = int(bounded_rows[-1].timestamp.timestamp() * 1000 + step_ms)
+                    cursor = bounded_rows.last_ms + step_ms
+                    if checkpoints and cursor > start_ms:
+                        after_commit(
+                            storage_fn,
+                            functools.partial(
+                                checkpoints.record,
+                                client.id,
+                                symbol,
+                                timeframe,
+                                start_ms,
+                                end_ms,
+                                min(cursor, end_ms),
+                            ),
+                        )
                     log_struct(
                         logger,
                         {**labels, "exchange": client.id, "symbol": symbol, "timeframe": timeframe},
@@ -95,13 +599,14 @@ def run_history_loop(
                     )
                 else:
                     # No rows inside the requested window; advance cursor using the fetched page.
-                    first_ms = int(rows[0].timestamp.timestamp() * 1000)
-                    last_ms = int(rows[-1].timestamp.timestamp() * 1000)
-                    cursor = int(last_ms + step_ms)
-                    if first_ms >= end_ms:
+                    cursor = rows.last_ms + step_ms
+                    if rows.first_ms >= fetch_end_ms:
                         break
 
-                if cursor >= end_ms:
+                HISTORY_CURSOR_LAG.set(
+                    max(0, end_ms - cursor) / 1000, exchange=client.id, symbol=symbol, timeframe=timeframe
+                )
+                if cursor >= fetch_end_ms:
                     break
             except Exception as exc:  # pragma: no cover - runtime guard
                 log_struct(
@@ -110,5 +615,24 @@ def run_history_loop(
                     {"event": "history_error", "error": str(exc)},
                 )
                 break
-    log_struct(logger, labels, {"event": "history_complete", "message": "history mode finished"})
 
+    def step_for(client, timeframe) -> int:
+        # Derive step from exchange timeframe parsing when available; fallback to provided window.
+        return timeframe_ms(client, timeframe, timeframe_window_ms)
+
+    try:
+        if probe_listing or (page_limits is not None and max_page_limit > page_limit):
+            pools.map(prepare, tasks)
+        if pools.workers_per_exchange > 1:
+            shards = _history_shards(
+                tasks, lambda client, timeframe, step_ms: shard_pages * limit_for(client, timeframe) * step_ms, step_for
+            )
+        else:
+            shards = [
+                (client, symbol, timeframe, start_ms, end_ms, step_for(client, timeframe), start_ms, end_ms)
+                for client, symbol, timeframe, start_ms, end_ms in tasks
+            ]
+        pools.map(backfill_range, shards)
+    finally:
+        pools.shutdown()
+    log_struct(logger, labels, {"event": "history_complete", "message": "history mode finished"})
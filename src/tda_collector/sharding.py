@@ -0,0 +1,170 @@
+import hashlib
+import signal
+import subprocess
+import sys
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from tda_collector.timeframes import DAY_MS, timeframe_ms
+
+TaskKey = Tuple[str, str, str]
+
+
+def stable_hash(key: TaskKey) -> int:
+    """Process- and host-independent hash of an (exchange, symbol, timeframe) key."""
+    digest = hashlib.blake2b("|".join(key).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def frequency_weight(step_ms: int) -> float:
+    """Candles per day: a 1m series costs 1440x a 1d one under the aligned schedule."""
+    return DAY_MS / max(1, step_ms)
+
+
+def weight_by_frequency(mode: str, live_schedule: str) -> bool:
+    """
+    Whether a series' request cost grows with its candle frequency: history pages and
+    aligned live wakes do, while the interval schedule and streams cost one request or
+    subscription per series whatever its timeframe.
+    """
+    return mode in ("history", "repair") or (mode == "live" and live_schedule == "aligned")
+
+
+def assign_shards(weights: Dict[TaskKey, float], shard_count: int) -> Dict[TaskKey, int]:
+    """
+    Deterministic shard per key. Equal weights use hash modulo shard_count, so a key
+    keeps its shard when others are added; otherwise the heaviest keys go first to
+    the least loaded shard (ties broken by hash), which evens out mixed timeframes.
+    """
+    if shard_count <= 1:
+        return {key: 0 for key in weights}
+    if len(set(weights.values())) <= 1:
+        return {key: stable_hash(key) % shard_count for key in weights}
+    loads = [0.0] * shard_count
+    assignment: Dict[TaskKey, int] = {}
+    for key in sorted(weights, key=lambda k: (-weights[k], stable_hash(k))):
+        shard = min(range(shard_count), key=lambda index: (loads[index], index))
+        assignment[key] = shard
+        loads[shard] += weights[key]
+    return assignment
+
+
+def select_shard(
+    tasks: Iterable[Tuple],
+    shard_index: int,
+    shard_count: int,
+    weighted: bool = True,
+    timeframe_window_ms: int = 60_000,
+) -> Tuple[List[Tuple], Dict[str, float]]:
+    """
+    Tasks (client, symbol, timeframe, ...) owned by shard_index, plus this shard's
+    share of each exchange's total weight, to scale its request budget.
+    """
+    tasks = list(tasks)
+    if shard_count <= 1:
+        return tasks, {}
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"shard index {shard_index} outside 0..{shard_count - 1}")
+
+    weights: Dict[TaskKey, float] = {}
+    for client, symbol, timeframe, *_ in tasks:
+        step_ms = timeframe_ms(client, timeframe, timeframe_window_ms)
+        weights[(client.id, symbol, timeframe)] = frequency_weight(step_ms) if weighted else 1.0
+    assignment = assign_shards(weights, shard_count)
+
+    totals: Dict[str, float] = {}
+    owned: Dict[str, float] = {}
+    for key, weight in weights.items():
+        totals[key[0]] = totals.get(key[0], 0.0) + weight
+        if assignment[key] == shard_index:
+            owned[key[0]] = owned.get(key[0], 0.0) + weight
+    shares = {exchange: owned.get(exchange, 0.0) / total for exchange, total in totals.items() if total}
+    selected = [task for task in tasks if assignment[(task[0].id, task[1], task[2])] == shard_index]
+    return selected, shares
+
+
+def scale_rate_limits(clients: Iterable, shares: Dict[str, float]) -> None:
+    """
+    Stretch each client's ccxt rateLimit (ms between requests) by 1 / share, so the
+    shards of one exchange together stay within its single budget.
+    """
+    for client in clients:
+        share = shares.get(client.id)
+        rate_limit_ms = getattr(client, "rateLimit", 0)
+        if share and isinstance(rate_limit_ms, (int, float)) and rate_limit_ms > 0:
+            client.rateLimit = rate_limit_ms / share
+
+
+def shard_dir(directory: str, shard_index: int, shard_count: int) -> str:
+    """
+    Per-shard subdirectory for state a process owns exclusively (the spool seals and
+    deletes every segment in its directory), so shards on one volume stay apart.
+    """
+    if shard_count <= 1:
+        return directory
+    return str(Path(directory) / f"shard-{shard_index}")
+
+
+def shard_path(path: str, shard_index: int, shard_count: int) -> str:
+    """
+    Per-shard file name for single-file stores (lake.duckdb -> lake.shard-1.duckdb):
+    DuckDB locks its file for one writer process.
+    """
+    if shard_count <= 1:
+        return path
+    file = Path(path)
+    return str(file.with_name(f"{file.stem}.shard-{shard_index}{file.suffix}"))
+
+
+def shard_argv(
+    argv: Sequence[str], shard_index: int, shard_count: int, metrics_port: int = 0, query_port: int = 0
+) -> List[str]:
+    """argv for one child of --local-shards: same options with its own shard, metrics and query ports."""
+    drop_with_value = {"--local-shards", "--shard-index", "--shard-count", "--metrics-port", "--query-port"}
+    args: List[str] = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+            continue
+        name = arg.split("=", 1)[0]
+        if name in drop_with_value:
+            skip = "=" not in arg
+            continue
+        args.append(arg)
+    args += ["--shard-index", str(shard_index), "--shard-count", str(shard_count)]
+    if metrics_port:
+        args += ["--metrics-port", str(metrics_port + shard_index)]
+    if query_port:
+        args += ["--query-port", str(query_port + shard_index)]
+    return args
+
+
+def run_local_shards(
+    argv: Sequence[str],
+    shard_count: int,
+    metrics_port: int = 0,
+    spawn: Optional[Callable[[List[str]], subprocess.Popen]] = None,
+    query_port: int = 0,
+) -> int:
+    """
+    Run shard_count collector processes on this host, one per shard, and wait for
+    them. SIGTERM/SIGINT are forwarded so every child flushes before exiting.
+    Returns the highest child exit code.
+    """
+    spawn = spawn or (lambda args: subprocess.Popen([sys.executable, "-m", "tda_collector", *args]))
+    children = [
+        spawn(shard_argv(argv, index, shard_count, metrics_port, query_port)) for index in range(shard_count)
+    ]
+
+    def forward(signum, frame):
+        for child in children:
+            if child.poll() is None:
+                child.send_signal(signum)
+
+    previous = {sig: signal.signal(sig, forward) for sig in (signal.SIGTERM, signal.SIGINT)}
+    try:
+        return max(child.wait() for child in children)
+    finally:
+        for sig, handler in previous.items():
+            signal.signal(sig, handler)
@@ -0,0 +1,380 @@
+import csv
+import os
+import sqlite3
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from tda_collector.checkpoint import after_commit
+from tda_collector.metrics import ROWS_WRITTEN
+from tda_collector.models import CandleBatch, OHLCVRecord
+from tda_collector.sharding import shard_path
+
+Rows = Union[CandleBatch, List[OHLCVRecord]]
+# (timestamp_ms, exchange, symbol, timeframe, open, high, low, close, volume, ingested_at_ms)
+RowTuple = Tuple[int, str, str, str, float, float, float, float, float, int]
+
+COLUMNS = ("timestamp", "exchange", "symbol", "timeframe", "open", "high", "low", "close", "volume", "ingested_at")
+
+
+def row_tuples(rows: Rows) -> List[RowTuple]:
+    """Flat rows for either a columnar CandleBatch or a list of records."""
+    if isinstance(rows, CandleBatch):
+        ingested_ms = int(rows.ingested_at.timestamp() * 1000)
+        return [
+            (ts, rows.exchange, rows.symbol, rows.timeframe, o, h, l, c, v, ingested_ms)
+            for ts, o, h, l, c, v in zip(rows.timestamps, rows.open, rows.high, rows.low, rows.close, rows.volume)
+        ]
+    return [
+        (
+            int(r.timestamp.timestamp() * 1000),
+            r.exchange,
+            r.symbol,
+            r.timeframe,
+            r.open,
+            r.high,
+            r.low,
+            r.close,
+            r.volume,
+            int(r.ingested_at.timestamp() * 1000),
+        )
+        for r in rows
+    ]
+
+
+class Sink:
+    """
+    Destination for candle rows. Sinks are callable with the storage_fn signature
+    (bq_client, dataset, table, rows), so any of them plugs into the scheduler; the
+    table name picks the local table or directory. close() flushes buffered rows.
+    """
+
+    def __call__(self, bq_client, dataset: str, table: str, rows: Rows) -> None:
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.flush()
+
+
+class SQLiteSink(Sink):
+    """
+    Embedded SQLite store: one executemany upsert per call, keyed by series and
+    timestamp. Writers from other processes are waited for up to busy_timeout seconds.
+    """
+
+    method = "sqlite"
+    _sql_type = {
+        "timestamp": "BIGINT",
+        "ingested_at": "BIGINT",
+        "exchange": "TEXT",
+        "symbol": "TEXT",
+        "timeframe": "TEXT",
+    }
+
+    def __init__(self, path: str, busy_timeout: float = 30.0):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = self._connect(path)
+        self._tables: set = set()
+
+    def _connect(self, path: str):
+        conn = sqlite3.connect(path, timeout=self.busy_timeout, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _ensure(self, table: str) -> str:
+        name = '"' + table.replace('"', '""') + '"'
+        if table not in self._tables:
+            columns = ", ".join(f"{col} {self._sql_type.get(col, 'DOUBLE')}" for col in COLUMNS)
+            self._conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} ({columns}, PRIMARY KEY (exchange, symbol, timeframe, timestamp))"
+            )
+            self._tables.add(table)
+        return name
+
+    def __call__(self, bq_client, dataset: str, table: str, rows: Rows) -> None:
+        values = row_tuples(rows)
+        if not values:
+            return
+        with self._lock:
+            name = self._ensure(table)
+            self._conn.execute("BEGIN")
+            try:
+                self._upsert(name, values)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        ROWS_WRITTEN.inc(len(values), table=table, method=self.method)
+
+    def _upsert(self, name: str, values: List[RowTuple]) -> None:
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        self._conn.executemany(f"INSERT OR REPLACE INTO {name} VALUES ({placeholders})", values)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class DuckDBSink(SQLiteSink):
+    """
+    Embedded DuckDB store (optional `duckdb` package), same upsert layout as SQLiteSink.
+    A batch is staged as a temporary CSV file and upserted by one INSERT ... SELECT
+    from read_csv: DuckDB binds executemany parameters row by row, which is orders
+    of magnitude slower than its vectorized scan.
+    """
+
+    method = "duckdb"
+    _csv_columns = ", ".join(f"'{col}': '{SQLiteSink._sql_type.get(col, 'DOUBLE')}'" for col in COLUMNS)
+
+    def _connect(self, path: str):
+        try:
+            import duckdb
+        except ImportError as exc:
+            raise RuntimeError("the duckdb sink needs the duckdb package (pip install duckdb)") from exc
+        return duckdb.connect(path)
+
+    def _upsert(self, name: str, values: List[RowTuple]) -> None:
+        # A key repeated within one statement is not replaced again; keep each bar's last update.
+        latest = {(row[1], row[2], row[3], row[0]): row for row in values}
+        fd, staged = tempfile.mkstemp(prefix="duckdb-batch-", suffix=".csv")
+        try:
+            with os.fdopen(fd, "w", newline="", encoding="utf-8") as file:
+                csv.writer(file).writerows(latest.values())
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {name} SELECT * FROM read_csv(?, header = false, delim = ',', "
+                f"quote = '\"', escape = '\"', columns = {{{self._csv_columns}}})",
+                [staged],
+            )
+        finally:
+            os.unlink(staged)
+
+
+class ParquetSink(Sink):
+    """
+    Local Parquet lake (optional `pyarrow` package) laid out as
+    <root>/<table>/date=YYYY-MM-DD/exchange=<id>/symbol=<BASE-QUOTE>/part-<uuid>.parquet.
+
+    Rows are buffered per partition and appended as row groups of row_group_rows to
+    an open part file; at most max_open_files stay open (least recently used closed
+    first). Once max_buffered_rows are pending, every flush_interval_seconds (from a
+    background thread, 0 disables) or on flush(), every buffer is written and every
+    file closed, and after_commit() callbacks run: a Parquet file is only readable
+    once its footer is written. The lake is append-only, so repeated forming-bar
+    updates are separate rows and the newest ingested_at wins.
+    """
+
+    method = "parquet"
+
+    def __init__(
+        self,
+        path: str,
+        row_group_rows: int = 100_000,
+        max_open_files: int = 64,
+        max_buffered_rows: int = 1_000_000,
+        flush_interval_seconds: float = 300.0,
+    ):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise RuntimeError("the parquet sink needs the pyarrow package (pip install pyarrow)") from exc
+        self._pa, self._pq = pa, pq
+        self.root = Path(path)
+        self.row_group_rows = max(1, row_group_rows)
+        self.max_open_files = max(1, max_open_files)
+        self.max_buffered_rows = max(self.row_group_rows, max_buffered_rows)
+        self.schema = pa.schema(
+            [
+                ("timestamp", pa.timestamp("ms", tz="UTC")),
+                ("exchange", pa.string()),
+                ("symbol", pa.string()),
+                ("timeframe", pa.string()),
+                ("open", pa.float64()),
+                ("high", pa.float64()),
+                ("low", pa.float64()),
+                ("close", pa.float64()),
+                ("volume", pa.float64()),
+                ("ingested_at", pa.timestamp("ms", tz="UTC")),
+            ]
+        )
+        self._lock = threading.Lock()
+        self._buffers: Dict[Tuple[str, str, str, str], List[RowTuple]] = {}
+        self._buffered = 0
+        self._writers: "OrderedDict[Tuple[str, str, str, str], Any]" = OrderedDict()
+        self._callbacks: List[Callable[[], None]] = []
+        self.flush_interval_seconds = flush_interval_seconds
+        self._stop = threading.Event()
+        self._thread = None
+        if flush_interval_seconds > 0:
+            self._thread = threading.Thread(target=self._run, name="parquet-flusher", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        # Live mode writes a few hundred rows a minute: without this nothing would
+        # reach disk until max_buffered_rows, and a kill would lose all of it.
+        while not self._stop.wait(self.flush_interval_seconds):
+            self.flush()
+
+    @staticmethod
+    def partition(table: str, row: RowTuple) -> Tuple[str, str, str, str]:
+        day = datetime.fromtimestamp(row[0] / 1000, tz=timezone.utc).strftime("%Y-%m-%d")
+        return table, day, row[1], row[2].replace("/", "-").replace(":", "_")
+
+    def __call__(self, bq_client, dataset: str, table: str, rows: Rows) -> None:
+        values = row_tuples(rows)
+        callbacks: List[Callable[[], None]] = []
+        with self._lock:
+            for row in values:
+                key = self.partition(table, row)
+                buffer = self._buffers.setdefault(key, [])
+                buffer.append(row)
+                if len(buffer) >= self.row_group_rows:
+                    self._write(key)
+            self._buffered += len(values)
+            if self._buffered >= self.max_buffered_rows:
+                callbacks = self._commit()
+        ROWS_WRITTEN.inc(len(values), table=table, method=self.method)
+        for callback in callbacks:
+            callback()
+
+    def after_commit(self, callback: Callable[[], None]) -> None:
+        """Run callback once the rows written so far are in closed Parquet files."""
+        with self._lock:
+            if self._buffers or self._writers:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def _write(self, key: Tuple[str, str, str, str]) -> None:
+        rows = self._buffers.pop(key, None)
+        if not rows:
+            return
+        writer = self._writers.pop(key, None)
+        if writer is None:
+            if len(self._writers) >= self.max_open_files:
+                _, oldest = self._writers.popitem(last=False)
+                oldest.close()
+            table, day, exchange, symbol = key
+            directory = self.root / table / f"date={day}" / f"exchange={exchange}" / f"symbol={symbol}"
+            directory.mkdir(parents=True, exist_ok=True)
+            writer = self._pq.ParquetWriter(str(directory / f"part-{uuid.uuid4().hex}.parquet"), self.schema)
+        self._writers[key] = writer
+        arrays = [self._pa.array(column, type=field.type) for column, field in zip(zip(*rows), self.schema)]
+        writer.write_table(self._pa.Table.from_arrays(arrays, schema=self.schema))
+
+    def _commit(self) -> List[Callable[[], None]]:
+        for key in list(self._buffers):
+            self._write(key)
+        for writer in self._writers.values():
+            writer.close()
+        self._writers.clear()
+        self._buffered = 0
+        callbacks, self._callbacks = self._callbacks, []
+        return callbacks
+
+    def flush(self) -> None:
+        with self._lock:
+            callbacks = self._commit()
+        for callback in callbacks:
+            callback()
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join()
+        self.flush()
+
+
+class FanoutSink(Sink):
+    """
+    Writes every call to each sink in order. All sinks are attempted even when one
+    fails, then the first error is re-raised. retry_with_backoff only retries network
+    errors, so a failing local sink fails the whole write: a live task logs it and
+    writes the bars again next cycle (to every sink), and a history range stops
+    there and continues from its checkpoint with --resume. after_commit() fires once
+    every sink has committed.
+    """
+
+    def __init__(self, sinks: Iterable[Callable]):
+        self.sinks = list(sinks)
+
+    def __call__(self, bq_client, dataset: str, table: str, rows: Rows) -> None:
+        error: Optional[BaseException] = None
+        for sink in self.sinks:
+            try:
+                sink(bq_client, dataset, table, rows)
+            except Exception as exc:
+                error = error or exc
+        if error is not None:
+            raise error
+
+    def after_commit(self, callback: Callable[[], None]) -> None:
+        lock = threading.Lock()
+        pending = [len(self.sinks)]
+
+        def done() -> None:
+            with lock:
+                pending[0] -= 1
+                if pending[0]:
+                    return
+            callback()
+
+        for sink in self.sinks:
+            after_commit(sink, done)
+
+    def flush(self) -> None:
+        for sink in self.sinks:
+            flush = getattr(sink, "flush", None)
+            if callable(flush):
+                flush()
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            close = getattr(sink, "close", None)
+            if callable(close):
+                close()
+
+
+def build_local_sinks(specs: Iterable[Dict[str, Any]], shard_index: int = 0, shard_count: int = 1) -> List[Sink]:
+    """
+    Local sinks from the settings.sinks list; "bigquery" entries are composed by the
+    caller. With several shards every SQLite/DuckDB file gets a per-shard name; the
+    Parquet tree stays shared because every writer creates its own uniquely named files.
+    """
+    sinks: List[Sink] = []
+    for spec in specs:
+        kind = spec["type"]
+        if kind == "sqlite":
+            sinks.append(SQLiteSink(shard_path(spec.get("path", "./lake.sqlite"), shard_index, shard_count)))
+        elif kind == "duckdb":
+            sinks.append(DuckDBSink(shard_path(spec.get("path", "./lake.duckdb"), shard_index, shard_count)))
+        elif kind == "parquet":
+            sinks.append(
+                ParquetSink(
+                    spec.get("path", "./lake"),
+                    row_group_rows=int(spec.get("row_group_rows", 100_000)),
+                    max_open_files=int(spec.get("max_open_files", 64)),
+                    max_buffered_rows=int(spec.get("max_buffered_rows", 1_000_000)),
+                    flush_interval_seconds=float(spec.get("flush_interval_seconds", 300)),
+                )
+            )
+    return sinks
+
+
+def fan_out(primary: Optional[Callable], local_sinks: List[Sink]) -> Optional[Callable]:
+    """storage_fn writing to primary (BigQuery path, may be None) and every local sink."""
+    targets = ([primary] if primary else []) + list(local_sinks)
+    if len(targets) == 1:
+        return targets[0]
+    return FanoutSink(targets) if targets else None
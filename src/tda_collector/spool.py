@@ -0,0 +1,268 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from tda_collector.logging_util import env_labels, log_struct
+from tda_collector.metrics import SPOOL_BYTES, SPOOL_SEGMENTS
+from tda_collector.resilience import retry_with_backoff
+from tda_collector.storage import bq_insert_ids, bq_payload, insert_json_rows
+
+_ACTIVE_SUFFIX = ".open"
+_SEALED_SUFFIX = ".seg"
+
+
+def _size(path: Path) -> int:
+    try:
+        return path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+
+class Spool:
+    """
+    Append-only on-disk spool for rows the sink could not write.
+
+    Rows go to an active segment file (one JSON line per row, fsync batched every
+    fsync_every appends or fsync_interval_seconds); a segment is sealed once it
+    exceeds segment_max_bytes. Total disk usage is capped at max_total_bytes by
+    dropping the oldest sealed segments.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        segment_max_bytes: int = 8 * 1024 * 1024,
+        max_total_bytes: int = 1024 * 1024 * 1024,
+        fsync_every: int = 64,
+        fsync_interval_seconds: float = 1.0,
+        logger=None,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.segment_max_bytes = max(1, segment_max_bytes)
+        self.max_total_bytes = max(self.segment_max_bytes, max_total_bytes)
+        self.fsync_every = max(1, fsync_every)
+        self.fsync_interval_seconds = fsync_interval_seconds
+        self.logger = logger
+        self.rows_dropped = 0
+        self._lock = threading.Lock()
+        self._active = None
+        self._active_path: Optional[Path] = None
+        self._unsynced = 0
+        self._last_fsync = time.monotonic()
+        self._sequence = 0
+        # Segments left active by a previous process are sealed so they replay first.
+        for leftover in self.directory.glob(f"*{_ACTIVE_SUFFIX}"):
+            leftover.rename(leftover.with_suffix(_SEALED_SUFFIX))
+
+    def append(self, dataset: str, table: str, payload: List[Dict[str, Any]], row_ids: Optional[List] = None) -> None:
+        row_ids = row_ids or [None] * len(payload)
+        lines = "".join(
+            json.dumps({"dataset": dataset, "table": table, "row": row, "row_id": row_id}) + "\n"
+            for row, row_id in zip(payload, row_ids)
+        )
+        with self._lock:
+            if self._active is None:
+                self._open_segment()
+            self._active.write(lines)
+            self._unsynced += len(payload)
+            if (
+                self._unsynced >= self.fsync_every
+                or time.monotonic() - self._last_fsync >= self.fsync_interval_seconds
+            ):
+                self._fsync()
+            if self._active.tell() >= self.segment_max_bytes:
+                self._seal()
+            self._enforce_limit()
+
+    def depth(self) -> Tuple[int, int]:
+        """(segment count, total bytes) currently on disk."""
+        segments = self._segments(include_active=True)
+        return len(segments), sum(_size(p) for p in segments)
+
+    def drain(self, insert_fn: Callable, bq_client, batch_rows: int = 500) -> int:
+        """
+        Replay spooled rows oldest segment first; a segment is deleted only after all
+        of its rows were inserted. Returns replayed rows; raises on the first failure.
+        """
+        with self._lock:
+            if self._active is not None:
+                self._seal()
+        replayed = 0
+        for segment in self._segments(include_active=False):
+            batches: Dict[Tuple[str, str], Dict[str, List]] = {}
+            try:
+                with segment.open("r", encoding="utf-8") as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        entry = json.loads(line)
+                        batch = batches.setdefault((entry["dataset"], entry["table"]), {"rows": [], "row_ids": []})
+                        batch["rows"].append(entry["row"])
+                        batch["row_ids"].append(entry["row_id"])
+            except FileNotFoundError:
+                # Dropped by the disk limit while we were draining.
+                continue
+            for (dataset, table), batch in batches.items():
+                for offset in range(0, len(batch["rows"]), batch_rows):
+                    row_ids = batch["row_ids"][offset : offset + batch_rows]
+                    insert_fn(
+                        bq_client,
+                        dataset,
+                        table,
+                        batch["rows"][offset : offset + batch_rows],
+                        row_ids if any(row_ids) else None,
+                    )
+            # Rows from a partially replayed segment may be re-sent on the next drain;
+            # insertIds (bq_insert_ids) let BigQuery drop those duplicates.
+            segment.unlink(missing_ok=True)
+            replayed += sum(len(batch["rows"]) for batch in batches.values())
+        return replayed
+
+    def close(self) -> None:
+        with self._lock:
+            if self._active is not None:
+                self._seal()
+
+    def _segments(self, include_active: bool) -> List[Path]:
+        pattern = "*" if include_active else f"*{_SEALED_SUFFIX}"
+        return sorted(p for p in self.directory.glob(pattern) if p.suffix in (_ACTIVE_SUFFIX, _SEALED_SUFFIX))
+
+    def _open_segment(self) -> None:
+        self._sequence += 1
+        # Time-ordered names keep replay in write order across restarts.
+        name = f"{time.time_ns():020d}-{os.getpid()}-{self._sequence:06d}{_ACTIVE_SUFFIX}"
+        self._active_path = self.directory / name
+        self._active = self._active_path.open("a", encoding="utf-8")
+
+    def _fsync(self) -> None:
+        self._active.flush()
+        os.fsync(self._active.fileno())
+        self._unsynced = 0
+        self._last_fsync = time.monotonic()
+
+    def _seal(self) -> None:
+        self._fsync()
+        self._active.close()
+        self._active_path.rename(self._active_path.with_suffix(_SEALED_SUFFIX))
+        self._active = None
+        self._active_path = None
+
+    def _enforce_limit(self) -> None:
+        sealed = self._segments(include_active=False)
+        total = sum(_size(p) for p in self._segments(include_active=True))
+        while sealed and total > self.max_total_bytes:
+            oldest = sealed.pop(0)
+            size = _size(oldest)
+            try:
+                with oldest.open("r", encoding="utf-8") as f:
+                    dropped = sum(1 for line in f if line.strip())
+                oldest.unlink()
+            except FileNotFoundError:
+                continue
+            total -= size
+            self.rows_dropped += dropped
+            if self.logger:
+                log_struct(
+                    self.logger,
+                    {**env_labels(), "mode": "spool"},
+                    {"event": "spool_overflow", "rows_dropped": dropped, "bytes": size},
+                )
+
+
+class SpoolingSink:
+    """
+    storage_fn wrapper that spools rows to disk when the wrapped sink keeps failing.
+
+    After a failure the sink is considered down for probe_interval_seconds and rows go
+    straight to the spool instead of paying the retry/backoff cost on every task.
+    """
+
+    def __init__(
+        self,
+        storage_fn: Callable,
+        spool: Spool,
+        logger=None,
+        backoff_cfg: Optional[Dict[str, Any]] = None,
+        probe_interval_seconds: float = 30.0,
+        insert_ids: bool = False,
+    ):
+        self.storage_fn = storage_fn
+        self.spool = spool
+        self.logger = logger
+        self.backoff_cfg = backoff_cfg or {}
+        self.probe_interval_seconds = probe_interval_seconds
+        self.insert_ids = insert_ids
+        self._down_until = 0.0
+
+    def __call__(self, bq_client, dataset: str, table: str, rows: List) -> None:
+        error = "sink marked down"
+        if time.monotonic() >= self._down_until:
+            try:
+                retry_with_backoff(self.storage_fn, (bq_client, dataset, table, rows), **self.backoff_cfg)
+                return
+            except Exception as exc:
+                self._down_until = time.monotonic() + self.probe_interval_seconds
+                error = str(exc)
+        row_ids = bq_insert_ids(rows) if self.insert_ids else None
+        self.spool.append(dataset, table, bq_payload(rows), row_ids)
+        if self.logger:
+            log_struct(
+                self.logger,
+                {**env_labels(), "mode": "spool", "table": table},
+                {"event": "spool_write", "rows": len(rows), "error": error},
+            )
+
+
+class SpoolReplayer:
+    """Background thread that drains the spool into BigQuery once it accepts writes again."""
+
+    def __init__(
+        self,
+        spool: Spool,
+        bq_client,
+        insert_fn: Callable = insert_json_rows,
+        interval_seconds: float = 30.0,
+        batch_rows: int = 500,
+        logger=None,
+    ):
+        self.spool = spool
+        self.bq_client = bq_client
+        self.insert_fn = insert_fn
+        self.interval_seconds = interval_seconds
+        self.batch_rows = batch_rows
+        self.logger = logger
+        self.labels = {**env_labels(), "mode": "spool"}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="spool-replayer", daemon=True)
+
+    def start(self) -> "SpoolReplayer":
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def replay_once(self) -> int:
+        segments, size = self.spool.depth()
+        SPOOL_SEGMENTS.set(segments)
+        SPOOL_BYTES.set(size)
+        if not segments:
+            return 0
+        log_struct(self.logger, self.labels, {"event": "spool_depth", "segments": segments, "bytes": size})
+        try:
+            replayed = self.spool.drain(self.insert_fn, self.bq_client, self.batch_rows)
+        except Exception as exc:  # pragma: no cover - runtime guard
+            log_struct(self.logger, self.labels, {"event": "spool_replay_error", "error": str(exc)})
+            return 0
+        log_struct(self.logger, self.labels, {"event": "spool_replayed", "rows": replayed})
+        return replayed
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            self.replay_once()
@@ -1,27 +1,37 @@
-from typing import List, Set
+import json
+import shutil
+import tempfile
+import threading
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
 
 from google.cloud import bigquery
 
-from tda_collector.models import OHLCVRecord
+from tda_collector.logging_util import env_labels, log_struct
+from tda_collector.metrics import INSERT_SECONDS, ROWS_WRITTEN
+from tda_collector.models import CandleBatch, OHLCVRecord
 
 
 _ensured_tables: Set[str] = set()
 
+OHLCV_SCHEMA = [
+    bigquery.SchemaField("timestamp", "TIMESTAMP", mode="REQUIRED"),
+    bigquery.SchemaField("exchange", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("symbol", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("timeframe", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("open", "FLOAT"),
+    bigquery.SchemaField("high", "FLOAT"),
+    bigquery.SchemaField("low", "FLOAT"),
+    bigquery.SchemaField("close", "FLOAT"),
+    bigquery.SchemaField("volume", "FLOAT"),
+    bigquery.SchemaField("ingested_at", "TIMESTAMP"),
+]
+
 
 def ensure_table(client: bigquery.Client, dataset: str, table: str) -> bigquery.Table:
     table_id = f"{client.project}.{dataset}.{table}"
-    schema = [
-        bigquery.SchemaField("timestamp", "TIMESTAMP", mode="REQUIRED"),
-        bigquery.SchemaField("exchange", "STRING", mode="REQUIRED"),
-        bigquery.SchemaField("symbol", "STRING", mode="REQUIRED"),
-        bigquery.SchemaField("timeframe", "STRING", mode="REQUIRED"),
-        bigquery.SchemaField("open", "FLOAT"),
-        bigquery.SchemaField("high", "FLOAT"),
-        bigquery.SchemaField("low", "FLOAT"),
-        bigquery.SchemaField("close", "FLOAT"),
-        bigquery.SchemaField("volume", "FLOAT"),
-        bigquery.SchemaField("ingested_at", "TIMESTAMP"),
-    ]
+    schema = list(OHLCV_SCHEMA)
 
     table_obj = bigquery.Table(table_id, schema=schema)
     table_obj.time_partitioning = bigquery.TimePartitioning(field="timestamp")
@@ -49,7 +59,37 @@ def ensure_table(client: bigquery.Client, dataset: str, table: str) -> bigquery.
     return table_obj
 
 
-def insert_rows(client: bigquery.Client, dataset: str, table: str, rows: List[OHLCVRecord]) -> None:
+def insert_rows(
+    client: bigquery.Client,
+    dataset: str,
+    table: str,
+    rows: Union[CandleBatch, List[OHLCVRecord]],
+    insert_ids: bool = False,
+) -> None:
+    row_ids = bq_insert_ids(rows) if insert_ids else None
+    insert_json_rows(client, dataset, table, bq_payload(rows), row_ids=row_ids)
+
+
+def bq_payload(rows: Union[CandleBatch, List[OHLCVRecord]]) -> List[Dict[str, Any]]:
+    """BigQuery JSON rows for either a columnar CandleBatch or a list of records."""
+    if isinstance(rows, CandleBatch):
+        return rows.to_bq_rows()
+    return [r.to_bq_row() for r in rows]
+
+
+def bq_insert_ids(rows: Union[CandleBatch, List[OHLCVRecord]]) -> List[str]:
+    if isinstance(rows, CandleBatch):
+        return rows.insert_ids()
+    return [r.insert_id() for r in rows]
+
+
+def insert_json_rows(
+    client: bigquery.Client,
+    dataset: str,
+    table: str,
+    payload: List[Dict[str, Any]],
+    row_ids: Optional[List[str]] = None,
+) -> None:
     table_id = f"{client.project}.{dataset}.{table}"
 
     # Ensure schema exists once per table to avoid "no schema" errors in streaming inserts
@@ -57,8 +97,101 @@ def insert_rows(client: bigquery.Client, dataset: str, table: str, rows: List[OH
         ensure_table(client, dataset, table)
         _ensured_tables.add(table_id)
 
-    payload = [r.to_bq_row() for r in rows]
-    errors = client.insert_rows_json(table_id, payload)
+    with INSERT_SECONDS.time(table=table, method="stream"):
+        if row_ids is not None:
+            # insertId lets BigQuery drop retried/duplicate rows on a best-effort basis.
+            errors = client.insert_rows_json(table_id, payload, row_ids=row_ids)
+        else:
+            errors = client.insert_rows_json(table_id, payload)
     if errors:
         raise RuntimeError(f"Failed to insert rows: {errors}")
-
+    ROWS_WRITTEN.inc(len(payload), table=table, method="stream")
+
+
+class LoadJobSink:
+    """
+    History sink that stages rows locally as newline-delimited JSON and commits them
+    to BigQuery with load jobs of up to chunk_rows rows, avoiding streaming inserts.
+
+    Instances are callable with the storage_fn signature; call close() to commit the
+    remaining staged rows.
+    """
+
+    def __init__(self, staging_dir: Optional[str] = None, chunk_rows: int = 500_000, logger=None):
+        self._own_dir = staging_dir is None
+        self.staging_dir = Path(staging_dir or tempfile.mkdtemp(prefix="tda-load-"))
+        self.staging_dir.mkdir(parents=True, exist_ok=True)
+        self.chunk_rows = max(1, chunk_rows)
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._staged: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def __call__(self, client: bigquery.Client, dataset: str, table: str, rows: List[OHLCVRecord]) -> None:
+        with self._lock:
+            key = (dataset, table)
+            staged = self._staged.get(key)
+            if staged is None:
+                path = self.staging_dir / f"{dataset}.{table}.{uuid.uuid4().hex}.ndjson"
+                staged = {
+                    "client": client,
+                    "path": path,
+                    "file": path.open("a", encoding="utf-8"),
+                    "rows": 0,
+                    "callbacks": [],
+                }
+                self._staged[key] = staged
+            staged["file"].writelines(json.dumps(row) + "\n" for row in bq_payload(rows))
+            staged["rows"] += len(rows)
+            self._local.last_key = key
+            if staged["rows"] >= self.chunk_rows:
+                self._commit(key)
+
+    def after_commit(self, callback: Callable[[], None]) -> None:
+        """Run callback once the rows this thread staged last are loaded into BigQuery."""
+        with self._lock:
+            staged = self._staged.get(getattr(self._local, "last_key", None))
+            if staged is not None:
+                staged["callbacks"].append(callback)
+                return
+        callback()
+
+    def flush(self) -> None:
+        with self._lock:
+            for key in list(self._staged):
+                self._commit(key)
+
+    def close(self) -> None:
+        self.flush()
+        if self._own_dir:
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    def _commit(self, key: Tuple[str, str]) -> None:
+        staged = self._staged[key]
+        staged["file"].close()
+        dataset, table = key
+        client = staged["client"]
+        table_id = f"{client.project}.{dataset}.{table}"
+        job_config = bigquery.LoadJobConfig(
+            source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+            schema=OHLCV_SCHEMA,
+        )
+        try:
+            with staged["path"].open("rb") as f, INSERT_SECONDS.time(table=table, method="load"):
+                client.load_table_from_file(f, table_id, job_config=job_config).result()
+        except Exception:
+            # Keep the staged file and reopen it so the next commit retries these rows.
+            staged["file"] = staged["path"].open("a", encoding="utf-8")
+            raise
+        ROWS_WRITTEN.inc(staged["rows"], table=table, method="load")
+        del self._staged[key]
+        staged["path"].unlink(missing_ok=True)
+        for callback in staged["callbacks"]:
+            callback()
+        if self.logger:
+            log_struct(
+                self.logger,
+                {**env_labels(), "mode": "history", "table": table},
+                {"event": "load_job_committed", "rows": staged["rows"]},
+            )
@@ -0,0 +1,239 @@
+import asyncio
+import functools
+import random
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from tda_collector.adapter import build_pro_client
+from tda_collector.checkpoint import after_commit
+from tda_collector.dedup import LastWrittenCache
+from tda_collector.logging_util import env_labels, log_struct
+from tda_collector.metrics import STREAM_RECONNECTS, STREAM_UPDATES
+from tda_collector.models import CandleBatch, OHLCVRecord
+from tda_collector.resilience import retry_with_backoff
+from tda_collector.storage import insert_rows
+
+SeriesKey = Tuple[str, str, str]
+
+
+class CandleCoalescer:
+    """
+    Latest version of every bar seen since the last drain, keyed by
+    (exchange, symbol, timeframe, timestamp): a forming bar updated many times a
+    second is written once per flush with its newest values.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bars: Dict[SeriesKey, Dict[int, List[Any]]] = {}
+
+    def update(self, exchange: str, symbol: str, timeframe: str, candles: Iterable[List[Any]]) -> int:
+        with self._lock:
+            bars = self._bars.setdefault((exchange, symbol, timeframe), {})
+            count = 0
+            for candle in candles:
+                bars[int(candle[0])] = candle
+                count += 1
+            return count
+
+    def drain(self) -> List[OHLCVRecord]:
+        with self._lock:
+            pending, self._bars = self._bars, {}
+        rows: List[OHLCVRecord] = []
+        for (exchange, symbol, timeframe), bars in pending.items():
+            candles = [bars[ts] for ts in sorted(bars)]
+            rows.extend(CandleBatch.from_ohlcv(exchange, symbol, timeframe, candles).records())
+        return rows
+
+    def __len__(self) -> int:
+        with self._lock:
+            return sum(len(bars) for bars in self._bars.values())
+
+
+def _reconnect_delay(attempt: int, backoff_cfg: Dict) -> float:
+    base = backoff_cfg.get("base_delay", 1.0)
+    delay = min(backoff_cfg.get("max_delay", 32.0), base * (backoff_cfg.get("factor", 2.0) ** (attempt - 1)))
+    return delay + random.uniform(0, base)
+
+
+class _ExchangeStream:
+    """All subscriptions of one exchange, multiplexed over the pro client's connection."""
+
+    def __init__(
+        self,
+        client,
+        subscriptions: List[Tuple[str, str]],
+        coalescer: CandleCoalescer,
+        logger,
+        labels: Dict,
+        backoff_cfg: Dict,
+        gap_page_limit: int,
+    ):
+        self.client = client
+        self.subscriptions = subscriptions
+        self.coalescer = coalescer
+        self.logger = logger
+        self.labels = {**labels, "exchange": client.id}
+        self.backoff_cfg = backoff_cfg
+        self.gap_page_limit = gap_page_limit
+        # Open time of the newest bar seen per (symbol, timeframe); older bars in the
+        # pro client's cache were already handled.
+        self.last_seen: Dict[Tuple[str, str], int] = {}
+        # Whether the current subscription has delivered any bar yet.
+        self.delivered = False
+
+    def _accept(self, symbol: str, timeframe: str, candles: List[List[Any]]) -> None:
+        if not candles:
+            return
+        seen = self.last_seen.get((symbol, timeframe))
+        fresh = candles[-2:] if seen is None else [c for c in candles if c[0] >= seen]
+        if fresh:
+            self.coalescer.update(self.client.id, symbol, timeframe, fresh)
+            self.last_seen[(symbol, timeframe)] = max(seen or 0, int(fresh[-1][0]))
+            self.delivered = True
+            STREAM_UPDATES.inc(exchange=self.client.id)
+
+    async def _watch_many(self) -> None:
+        # One subscribe request for every series; updates arrive as {symbol: {timeframe: candles}}.
+        while True:
+            update = await self.client.watch_ohlcv_for_symbols([list(sub) for sub in self.subscriptions])
+            for symbol, by_timeframe in update.items():
+                for timeframe, candles in by_timeframe.items():
+                    self._accept(symbol, timeframe, candles)
+
+    async def _watch_one(self, symbol: str, timeframe: str) -> None:
+        while True:
+            self._accept(symbol, timeframe, await self.client.watch_ohlcv(symbol, timeframe))
+
+    async def _watch(self) -> None:
+        if self.client.has.get("watchOHLCVForSymbols"):
+            await self._watch_many()
+            return
+        watchers = [asyncio.ensure_future(self._watch_one(symbol, tf)) for symbol, tf in self.subscriptions]
+        try:
+            # The first failing watcher tears the group down so every series resubscribes together.
+            done, _ = await asyncio.wait(watchers, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                task.result()
+        finally:
+            for task in watchers:
+                task.cancel()
+            await asyncio.gather(*watchers, return_exceptions=True)
+
+    async def _fill_gaps(self) -> None:
+        """Fetch bars missed while disconnected over REST, from the last bar seen onward."""
+        filled = 0
+        for (symbol, timeframe), since_ms in list(self.last_seen.items()):
+            cursor = since_ms
+            while True:
+                candles = await self.client.fetch_ohlcv(
+                    symbol, timeframe=timeframe, since=cursor, limit=self.gap_page_limit
+                )
+                if not candles:
+                    break
+                self.coalescer.update(self.client.id, symbol, timeframe, candles)
+                filled += len(candles)
+                self.last_seen[(symbol, timeframe)] = max(self.last_seen[(symbol, timeframe)], int(candles[-1][0]))
+                if len(candles) < self.gap_page_limit or int(candles[-1][0]) <= cursor:
+                    break
+                cursor = int(candles[-1][0])
+        log_struct(self.logger, self.labels, {"event": "stream_gap_filled", "rows": filled})
+
+    async def run(self) -> None:
+        attempt = 0
+        while True:
+            self.delivered = False
+            try:
+                if attempt:
+                    await self._fill_gaps()
+                log_struct(
+                    self.logger,
+                    self.labels,
+                    {"event": "stream_subscribed", "subscriptions": len(self.subscriptions)},
+                )
+                await self._watch()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                # A subscription that delivered bars was healthy: back off from the start.
+                attempt = 1 if self.delivered else attempt + 1
+                delay = _reconnect_delay(attempt, self.backoff_cfg)
+                STREAM_RECONNECTS.inc(exchange=self.client.id)
+                log_struct(
+                    self.logger,
+                    self.labels,
+                    {"event": "stream_reconnect", "error": str(exc), "attempt": attempt, "delay_s": round(delay, 3)},
+                )
+                await asyncio.sleep(delay)
+
+
+async def stream_live(
+    tasks: Iterable[Tuple],
+    storage_fn: Callable = insert_rows,
+    logger=None,
+    bq_client=None,
+    dataset="crypto",
+    table="market_data_ohlcv",
+    backoff_cfg=None,
+    client_factory: Callable = build_pro_client,
+    flush_interval_seconds: float = 1.0,
+    gap_page_limit: int = 200,
+    change_cache: Optional[LastWrittenCache] = None,
+    stop_event: Optional[threading.Event] = None,
+) -> None:
+    """
+    Subscribe to every (client, symbol, timeframe) task over WebSocket and write the
+    coalesced bars through storage_fn every flush_interval_seconds. Runs until
+    stop_event is set (forever without one).
+    """
+    labels = {**env_labels(), "mode": "stream"}
+    backoff_cfg = backoff_cfg or {}
+    coalescer = CandleCoalescer()
+    loop = asyncio.get_running_loop()
+
+    subscriptions: Dict[str, List[Tuple[str, str]]] = {}
+    for client, symbol, timeframe in tasks:
+        subscriptions.setdefault(str(client.id), []).append((symbol, timeframe))
+    clients = {exchange_id: client_factory(exchange_id) for exchange_id in subscriptions}
+    streams = [
+        _ExchangeStream(clients[exchange_id], subs, coalescer, logger, labels, backoff_cfg, gap_page_limit)
+        for exchange_id, subs in subscriptions.items()
+    ]
+
+    async def flush() -> None:
+        rows = coalescer.drain()
+        if change_cache:
+            rows = change_cache.changed(rows)
+        if not rows:
+            return
+        try:
+            # storage_fn blocks (BigQuery client, batch writer backpressure); keep it off the loop.
+            await loop.run_in_executor(
+                None,
+                functools.partial(retry_with_backoff, storage_fn, (bq_client, dataset, table, rows), **backoff_cfg),
+            )
+            if change_cache:
+                after_commit(storage_fn, functools.partial(change_cache.mark, rows))
+            log_struct(logger, labels, {"event": "stream_flush", "rows": len(rows)})
+        except Exception as exc:  # pragma: no cover - runtime guard
+            log_struct(logger, labels, {"event": "stream_flush_error", "rows": len(rows), "error": str(exc)})
+
+    watchers = [asyncio.ensure_future(stream.run()) for stream in streams]
+    try:
+        while not (stop_event and stop_event.is_set()):
+            await asyncio.sleep(flush_interval_seconds)
+            await flush()
+    finally:
+        for task in watchers:
+            task.cancel()
+        await asyncio.gather(*watchers, return_exceptions=True)
+        await flush()
+        for client in clients.values():
+            close = getattr(client, "close", None)
+            if close:
+                await close()
+
+
+def run_stream_loop(tasks: Iterable[Tuple], **kwargs) -> None:
+    """Blocking entry point for stream_live."""
+    asyncio.run(stream_live(tasks, **kwargs))
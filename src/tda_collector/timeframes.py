@@ -0,0 +1,50 @@
+from datetime import datetime, timezone
+
+DAY_MS = 86_400_000
+# 1970-01-01 was a Thursday; exchanges open weekly candles on Monday 00:00 UTC.
+WEEK_OFFSET_MS = 4 * DAY_MS
+
+
+def timeframe_ms(client, timeframe: str, fallback_ms: int = 60_000) -> int:
+    """Candle length in ms from the exchange's timeframe parser, or fallback_ms."""
+    if hasattr(client, "parse_timeframe"):
+        try:
+            return int(client.parse_timeframe(timeframe) * 1000)
+        except Exception:
+            return fallback_ms
+    return fallback_ms
+
+
+def _is_monthly(timeframe: str) -> bool:
+    return timeframe.endswith("M")
+
+
+def _add_months(dt: datetime, months: int) -> datetime:
+    month_index = dt.month - 1 + months
+    return dt.replace(year=dt.year + month_index // 12, month=month_index % 12 + 1)
+
+
+def candle_open_ms(ts_ms: int, timeframe: str, step_ms: int) -> int:
+    """Open time of the candle that contains ts_ms, following exchange alignment."""
+    if _is_monthly(timeframe):
+        months = int(timeframe[:-1] or 1)
+        dt = datetime.fromtimestamp(ts_ms / 1000, tz=timezone.utc)
+        month_index = (dt.year * 12 + dt.month - 1) // months * months
+        opened = datetime(month_index // 12, month_index % 12 + 1, 1, tzinfo=timezone.utc)
+        return int(opened.timestamp() * 1000)
+    offset = WEEK_OFFSET_MS if timeframe.endswith("w") else 0
+    return (ts_ms - offset) // step_ms * step_ms + offset
+
+
+def candle_close_ms(open_ms: int, timeframe: str, step_ms: int) -> int:
+    """Close time (exclusive end) of the candle opening at open_ms."""
+    if _is_monthly(timeframe):
+        months = int(timeframe[:-1] or 1)
+        opened = datetime.fromtimestamp(open_ms / 1000, tz=timezone.utc)
+        return int(_add_months(opened, months).timestamp() * 1000)
+    return open_ms + step_ms
+
+
+def next_close_ms(now_ms: int, timeframe: str, step_ms: int) -> int:
+    """Close time of the candle currently forming at now_ms."""
+    return candle_close_ms(candle_open_ms(now_ms, timeframe, step_ms), timeframe, step_ms)
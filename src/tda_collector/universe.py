@@ -0,0 +1,247 @@
+import re
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from tda_collector.logging_util import env_labels, log_struct
+from tda_collector.market_cache import MarketCache
+from tda_collector.metrics import UNIVERSE_SYMBOLS
+from tda_collector.models import ExchangePair, SymbolSelector
+
+TaskKey = Tuple[str, str, str]
+
+
+def task_key(task: Tuple) -> TaskKey:
+    return str(getattr(task[0], "id", None)), task[1], task[2]
+
+
+def select_markets(markets: Dict[str, dict], selector: SymbolSelector, exclude: Iterable[str] = ()) -> List[str]:
+    """
+    Sorted symbols of the active markets matching every filter of selector. A market
+    is skipped when its symbol or exchange id is in exclude (pairs listed explicitly
+    may use either form).
+    """
+    exclude = set(exclude)
+    pattern = re.compile(selector.regex) if selector.regex else None
+    symbols = []
+    for symbol, market in markets.items():
+        if market.get("active") is False:
+            continue
+        if selector.quote and market.get("quote") != selector.quote:
+            continue
+        if selector.market_type and market.get("type") != selector.market_type:
+            continue
+        if pattern and not pattern.search(symbol):
+            continue
+        if symbol in exclude or market.get("id") in exclude:
+            continue
+        symbols.append(symbol)
+    return sorted(symbols)
+
+
+def market_volumes(client, symbols: List[str]) -> Dict[str, float]:
+    """24h quote volume per symbol from one fetch_tickers request."""
+    try:
+        tickers = client.fetch_tickers(symbols)
+    except Exception:
+        # Some exchanges only return every ticker at once.
+        tickers = client.fetch_tickers()
+    volumes: Dict[str, float] = {}
+    for symbol in symbols:
+        ticker = tickers.get(symbol) or {}
+        volume = ticker.get("quoteVolume")
+        if volume is None and ticker.get("baseVolume") is not None and ticker.get("last") is not None:
+            volume = ticker["baseVolume"] * ticker["last"]
+        volumes[symbol] = float(volume or 0.0)
+    return volumes
+
+
+def resolve_pairs(
+    client,
+    pairs: List[ExchangePair],
+    selectors: List[SymbolSelector],
+    volume_fn: Callable = market_volumes,
+) -> List[ExchangePair]:
+    """
+    Explicit pairs followed by the pairs expanded from each selector against
+    client.markets, loaded first when the market cache did not fill them. Explicit
+    pairs and earlier selectors win a symbol; top keeps the highest 24h quote volume.
+    """
+    if selectors and not client.markets:
+        client.load_markets()
+    if selectors and not client.markets:
+        raise ValueError(f"{client.id}: no markets loaded, cannot resolve select entries")
+    resolved = list(pairs)
+    taken: Set[str] = {pair.symbol for pair in pairs}
+    for selector in selectors:
+        symbols = select_markets(client.markets, selector, taken)
+        if selector.top and len(symbols) > selector.top:
+            volumes = volume_fn(client, symbols)
+            symbols = sorted(symbols, key=lambda symbol: (-volumes.get(symbol, 0.0), symbol))[: selector.top]
+        resolved.extend(
+            ExchangePair(symbol=symbol, timeframes=list(selector.timeframes), priority=selector.priority)
+            for symbol in symbols
+        )
+        taken.update(symbols)
+    return resolved
+
+
+def resolve_universe(
+    clients: Dict[str, object],
+    exchanges: Dict[str, List[ExchangePair]],
+    selectors: Dict[str, List[SymbolSelector]],
+    logger=None,
+    mode: str = "live",
+    volume_fn: Callable = market_volumes,
+    previous: Optional[Dict[str, List[ExchangePair]]] = None,
+) -> Dict[str, List[ExchangePair]]:
+    """
+    Pairs per exchange with selectors expanded. Without previous a failing exchange
+    raises; with it, that exchange keeps its previous pairs.
+    """
+    universe: Dict[str, List[ExchangePair]] = {}
+    for ex_name, pairs in exchanges.items():
+        rules = selectors.get(ex_name) or []
+        if not rules:
+            universe[ex_name] = list(pairs)
+            continue
+        labels = {**env_labels(), "mode": mode, "exchange": ex_name}
+        try:
+            universe[ex_name] = resolve_pairs(clients[ex_name], pairs, rules, volume_fn)
+        except Exception as exc:
+            if previous is None or ex_name not in previous:
+                raise
+            log_struct(logger, labels, {"event": "universe_error", "error": str(exc)})
+            universe[ex_name] = previous[ex_name]
+            continue
+        selected = len(universe[ex_name]) - len(pairs)
+        UNIVERSE_SYMBOLS.set(selected, exchange=ex_name)
+        log_struct(
+            logger,
+            labels,
+            {
+                "event": "universe_resolved",
+                "selectors": len(rules),
+                "selected": selected,
+                "pairs": len(universe[ex_name]),
+            },
+        )
+    return universe
+
+
+class LiveTaskSet:
+    """
+    The live task list, replaced as a whole by the universe refresher. Live loops
+    compare version between cycles and pick up a new list without restarting.
+    """
+
+    def __init__(self, tasks: Iterable[Tuple]):
+        self._lock = threading.Lock()
+        self._tasks = list(tasks)
+        self.version = 0
+
+    def snapshot(self) -> Tuple[int, List[Tuple]]:
+        with self._lock:
+            return self.version, list(self._tasks)
+
+    def replace(self, tasks: Iterable[Tuple]) -> Tuple[int, int]:
+        """Install tasks; returns (added, removed) counts. An unchanged set keeps its version."""
+        tasks = list(tasks)
+        with self._lock:
+            old = {task_key(task) for task in self._tasks}
+            new = {task_key(task) for task in tasks}
+            added, removed = len(new - old), len(old - new)
+            if added or removed:
+                self._tasks = tasks
+                self.version += 1
+        return added, removed
+
+
+class UniverseRefresher:
+    """
+    Background thread that re-resolves the selector rules every interval_seconds
+    against freshly loaded markets and hands the resulting tasks to a LiveTaskSet.
+    Markets come from the MarketCache while its entry is younger than the interval
+    (another shard or process reloaded them), else from load_markets(reload=True),
+    which is written back to the cache.
+    """
+
+    def __init__(
+        self,
+        clients: Dict[str, object],
+        exchanges: Dict[str, List[ExchangePair]],
+        selectors: Dict[str, List[SymbolSelector]],
+        universe: Dict[str, List[ExchangePair]],
+        build_tasks: Callable[[Dict[str, List[ExchangePair]]], List[Tuple]],
+        task_set: LiveTaskSet,
+        interval_seconds: float = 3600,
+        market_cache: Optional[MarketCache] = None,
+        logger=None,
+        volume_fn: Callable = market_volumes,
+    ):
+        self.clients = clients
+        self.exchanges = exchanges
+        self.selectors = selectors
+        self.universe = universe
+        self.build_tasks = build_tasks
+        self.task_set = task_set
+        self.interval_seconds = interval_seconds
+        self.market_cache = market_cache
+        self.logger = logger
+        self.volume_fn = volume_fn
+        self.labels = {**env_labels(), "mode": "live"}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="universe-refresher", daemon=True)
+
+    def start(self) -> "UniverseRefresher":
+        self._thread.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout)
+
+    def _reload_markets(self, client) -> None:
+        if self.market_cache is not None:
+            cached = self.market_cache.load(client.id, max_age_seconds=self.interval_seconds)
+            if cached is not None:
+                client.set_markets(*cached)
+                return
+        client.load_markets(True)
+        if self.market_cache is not None:
+            self.market_cache.save(client.id, client.markets, getattr(client, "currencies", None))
+
+    def refresh_once(self) -> Tuple[int, int]:
+        for ex_name in self.selectors:
+            client = self.clients.get(ex_name)
+            if client is None:
+                continue
+            try:
+                self._reload_markets(client)
+            except Exception as exc:  # pragma: no cover - runtime guard
+                # Resolve against the markets already loaded.
+                labels = {**self.labels, "exchange": ex_name}
+                log_struct(self.logger, labels, {"event": "universe_error", "error": str(exc)})
+        self.universe = resolve_universe(
+            self.clients,
+            self.exchanges,
+            self.selectors,
+            self.logger,
+            volume_fn=self.volume_fn,
+            previous=self.universe,
+        )
+        added, removed = self.task_set.replace(self.build_tasks(self.universe))
+        if added or removed:
+            log_struct(
+                self.logger,
+                self.labels,
+                {"event": "universe_changed", "added": added, "removed": removed, "version": self.task_set.version},
+            )
+        return added, removed
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.refresh_once()
+            except Exception as exc:  # pragma: no cover - runtime guard
+                log_struct(self.logger, self.labels, {"event": "universe_error", "error": str(exc)})
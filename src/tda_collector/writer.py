@@ -0,0 +1,193 @@
+import json
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from tda_collector.logging_util import env_labels, log_struct
+from tda_collector.resilience import retry_with_backoff
+from tda_collector.spool import Spool
+from tda_collector.storage import bq_insert_ids, bq_payload, insert_json_rows
+
+_STOP = object()
+
+
+class _Commit:
+    """Queue marker: callback for the rows the same thread submitted before it."""
+
+    def __init__(self, callback: Callable[[], None]):
+        self.callback = callback
+        self.thread = threading.get_ident()
+
+
+class BatchWriter:
+    """
+    Background writer that coalesces rows from many tasks into large BigQuery inserts.
+
+    submit() has the storage_fn signature, so it plugs straight into the scheduler.
+    A batch is flushed when it reaches max_rows or max_bytes, or when its oldest row
+    has waited max_latency_seconds. submit() blocks while the queue is full.
+    after_commit() callbacks run on the writer thread once the rows the calling thread
+    submitted before them are inserted or spooled; dropped rows discard the callback.
+    """
+
+    def __init__(
+        self,
+        insert_fn: Callable = insert_json_rows,
+        *,
+        max_rows: int = 500,
+        max_bytes: int = 5_000_000,
+        max_latency_seconds: float = 2.0,
+        queue_size: int = 10_000,
+        logger=None,
+        backoff_cfg: Optional[Dict[str, Any]] = None,
+        insert_ids: bool = False,
+        spool: Optional[Spool] = None,
+    ):
+        self.insert_fn = insert_fn
+        self.max_rows = max(1, max_rows)
+        self.max_bytes = max(1, max_bytes)
+        self.max_latency_seconds = max_latency_seconds
+        self.logger = logger
+        self.backoff_cfg = backoff_cfg or {}
+        self.insert_ids = insert_ids
+        self.spool = spool
+        self.labels = {**env_labels(), "mode": "writer"}
+        self.rows_dropped = 0
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+        self._thread = threading.Thread(target=self._run, name="bq-writer", daemon=True)
+        self._closed = False
+        self._thread.start()
+
+    def submit(self, bq_client, dataset: str, table: str, rows: List) -> None:
+        if self._closed:
+            raise RuntimeError("BatchWriter is closed")
+        row_ids = bq_insert_ids(rows) if self.insert_ids else [None] * len(rows)
+        thread = threading.get_ident()
+        for payload, row_id in zip(bq_payload(rows), row_ids):
+            self._queue.put((bq_client, dataset, table, payload, row_id, len(json.dumps(payload)), thread))
+
+    __call__ = submit
+
+    def after_commit(self, callback: Callable[[], None]) -> None:
+        if self._closed:
+            raise RuntimeError("BatchWriter is closed")
+        self._queue.put(_Commit(callback))
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Flush everything queued so far and stop the background thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        batches: Dict[Tuple[int, str, str], Dict[str, Any]] = {}
+        callbacks: List[_Commit] = []
+        # Threads whose rows were dropped since their last after_commit().
+        lost: set = set()
+        pending_rows = 0
+        pending_bytes = 0
+        oldest: Optional[float] = None
+        stopping = False
+
+        while not stopping:
+            timeout = None
+            if oldest is not None:
+                timeout = max(0.0, oldest + self.max_latency_seconds - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is _STOP:
+                stopping = True
+            elif isinstance(item, _Commit):
+                if item.thread in lost:
+                    lost.discard(item.thread)
+                elif any(item.thread in batch["threads"] for batch in batches.values()):
+                    callbacks.append(item)
+                else:
+                    item.callback()
+            elif item is not None:
+                bq_client, dataset, table, payload, row_id, size, thread = item
+                batch = batches.setdefault(
+                    (id(bq_client), dataset, table),
+                    {
+                        "client": bq_client,
+                        "dataset": dataset,
+                        "table": table,
+                        "rows": [],
+                        "row_ids": [],
+                        "bytes": 0,
+                        "threads": set(),
+                    },
+                )
+                batch["threads"].add(thread)
+                batch["rows"].append(payload)
+                batch["row_ids"].append(row_id)
+                batch["bytes"] += size
+                pending_rows += 1
+                pending_bytes += size
+                if oldest is None:
+                    oldest = time.monotonic()
+
+            expired = oldest is not None and time.monotonic() - oldest >= self.max_latency_seconds
+            full = pending_rows >= self.max_rows or pending_bytes >= self.max_bytes
+            if batches and (stopping or expired or full):
+                lost |= self._flush(list(batches.values()), oldest)
+                for commit in callbacks:
+                    if commit.thread in lost:
+                        lost.discard(commit.thread)
+                    else:
+                        commit.callback()
+                batches = {}
+                callbacks = []
+                pending_rows = 0
+                pending_bytes = 0
+                oldest = None
+
+    def _flush(self, batches: List[Dict[str, Any]], oldest: Optional[float]) -> set:
+        """Insert every batch; returns the submitting threads of dropped rows."""
+        dropped: set = set()
+        waited_ms = int((time.monotonic() - oldest) * 1000) if oldest is not None else 0
+        for batch in batches:
+            rows = batch["rows"]
+            args = (batch["client"], batch["dataset"], batch["table"], rows)
+            if self.insert_ids:
+                args += (batch["row_ids"],)
+            try:
+                retry_with_backoff(self.insert_fn, args, **self.backoff_cfg)
+                log_struct(
+                    self.logger,
+                    {**self.labels, "table": batch["table"]},
+                    {"event": "writer_flush", "rows": len(rows), "bytes": batch["bytes"], "max_wait_ms": waited_ms},
+                )
+            except Exception as exc:  # pragma: no cover - runtime guard
+                spooled = False
+                if self.spool is not None:
+                    try:
+                        self.spool.append(
+                            batch["dataset"], batch["table"], rows, batch["row_ids"] if self.insert_ids else None
+                        )
+                        spooled = True
+                    except Exception as spool_exc:
+                        # Disk full or unwritable: drop the batch but keep the writer thread alive.
+                        log_struct(
+                            self.logger,
+                            {**self.labels, "table": batch["table"]},
+                            {"event": "writer_spool_error", "rows": len(rows), "error": str(spool_exc)},
+                        )
+                if not spooled:
+                    self.rows_dropped += len(rows)
+                    dropped |= batch["threads"]
+                log_struct(
+                    self.logger,
+                    {**self.labels, "table": batch["table"]},
+                    {"event": "writer_flush_error", "rows": len(rows), "spooled": spooled, "error": str(exc)},
+                )
+        return dropped
@@ -0,0 +1,43 @@
+"""Record, page and exchange-client factories shared by the test modules."""
+
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+import ccxt
+
+from tda_collector.models import CandleBatch, OHLCVRecord
+
+MINUTE_MS = 60_000
+BASE_MS = 1_672_531_200_000  # 2023-01-01T00:00:00Z
+
+
+def make_record(minute, close=1.5, volume=100.0, base_ms=BASE_MS):
+    """A binance BTC/USDT 1m record opening minute minutes after base_ms, ingested a second later."""
+    timestamp = datetime.fromtimestamp((base_ms + minute * MINUTE_MS) / 1000, tz=timezone.utc)
+    return OHLCVRecord(
+        timestamp=timestamp,
+        exchange="binance",
+        symbol="BTC/USDT",
+        timeframe="1m",
+        open=1.0,
+        high=2.0,
+        low=0.5,
+        close=close,
+        volume=volume,
+        ingested_at=timestamp + timedelta(seconds=1),
+    )
+
+
+def make_page(since_ms, limit, exchange="binance", symbol="BTC/USDT", timeframe="1m", until_ms=None):
+    """Up to limit consecutive 1m candles from since_ms, stopping before until_ms when given."""
+    end_ms = since_ms + limit * MINUTE_MS if until_ms is None else min(since_ms + limit * MINUTE_MS, until_ms)
+    candles = [[ts, 1, 2, 0.5, 1.5, 100] for ts in range(since_ms, end_ms, MINUTE_MS)]
+    return CandleBatch.from_ohlcv(exchange, symbol, timeframe, candles)
+
+
+def mock_client(exchange_id="binance", **attrs):
+    """MagicMock exchange client with ccxt's real parse_timeframe; attrs configure the mock."""
+    client = MagicMock(**attrs)
+    client.id = exchange_id
+    client.parse_timeframe = ccxt.Exchange.parse_timeframe
+    return client
@@ -0,0 +1,98 @@
+from unittest.mock import MagicMock
+
+from factories import make_page, mock_client
+
+from tda_collector.__main__ import _build_live_storage
+from tda_collector.catchup import CatchUpFetcher, HighWaterMarks, HighWaterSink
+from tda_collector.models import Config, Settings
+from tda_collector.writer import BatchWriter
+
+MINUTE = 60_000
+
+
+def test_small_gap_uses_plain_live_fetch():
+    fetch_fn = MagicMock(return_value=["prev", "curr"])
+    page_fn = MagicMock()
+    marks = HighWaterMarks({("binance", "BTC/USDT", "1m"): 9 * MINUTE})
+    fetcher = CatchUpFetcher(marks, fetch_fn=fetch_fn, page_fn=page_fn, now_fn=lambda: 10 * MINUTE / 1000 + 5)
+
+    assert fetcher(mock_client(), "BTC/USDT", "1m") == ["prev", "curr"]
+    page_fn.assert_not_called()
+
+
+def test_gap_is_fetched_from_mark_in_one_request():
+    calls = []
+
+    def page_fn(client, symbol, timeframe, since_ms, limit):
+        calls.append((since_ms, limit))
+        return make_page(since_ms, limit, client.id, symbol, timeframe, until_ms=101 * MINUTE)
+
+    marks = HighWaterMarks({("binance", "BTC/USDT", "1m"): 40 * MINUTE})
+    fetcher = CatchUpFetcher(marks, page_fn=page_fn, logger=MagicMock(), now_fn=lambda: 100 * MINUTE / 1000 + 5)
+
+    rows = fetcher(mock_client(), "BTC/USDT", "1m")
+
+    assert calls == [(40 * MINUTE, 61)]
+    assert len(rows) == 61
+
+
+def test_long_gap_is_paged_up_to_max_pages_per_cycle():
+    calls = []
+
+    def page_fn(client, symbol, timeframe, since_ms, limit):
+        calls.append(since_ms)
+        return make_page(since_ms, limit, client.id, symbol, timeframe, until_ms=1001 * MINUTE)
+
+    marks = HighWaterMarks({("binance", "BTC/USDT", "1m"): 0})
+    fetcher = CatchUpFetcher(
+        marks, page_fn=page_fn, page_limit=100, max_pages=3, logger=MagicMock(), now_fn=lambda: 1000 * MINUTE / 1000
+    )
+
+    rows = fetcher(mock_client(), "BTC/USDT", "1m")
+
+    assert calls == [0, 100 * MINUTE, 200 * MINUTE]
+    assert len(rows) == 300
+
+
+def test_high_water_sink_advances_marks_after_storing():
+    marks = HighWaterMarks()
+    stored = []
+    rows = make_page(0, 3).records()
+
+    HighWaterSink(lambda *args: stored.append(args), marks)("bq", "ds", "tbl", rows)
+
+    assert len(stored) == 1
+    assert marks.get(("binance", "BTC/USDT", "1m")) == 2 * MINUTE
+
+
+def test_high_water_sink_keeps_marks_of_rows_the_writer_drops():
+    def failing_insert(client, dataset, table, payload):
+        raise ValueError("bigquery down")
+
+    marks = HighWaterMarks()
+    writer = BatchWriter(failing_insert, max_rows=1000, max_latency_seconds=60, logger=MagicMock())
+    HighWaterSink(writer, marks)("bq", "ds", "tbl", make_page(0, 3).records())
+    writer.close()
+    assert marks.get(("binance", "BTC/USDT", "1m")) is None
+
+    writer = BatchWriter(lambda *args: None, max_rows=2, max_latency_seconds=60, logger=MagicMock())
+    HighWaterSink(writer, marks)("bq", "ds", "tbl", make_page(0, 3).records())
+    writer.close()
+    assert marks.get(("binance", "BTC/USDT", "1m")) == 2 * MINUTE
+
+
+def test_high_water_marks_wait_for_the_live_writer_built_from_settings():
+    cfg = Config(settings=Settings(writer_enabled=True, writer_max_latency_seconds=60), exchanges={})
+    bq_client = MagicMock()
+    bq_client.insert_rows_json.return_value = [{"index": 0, "errors": ["backend error"]}]
+    storage_fn, shutdown_hooks = _build_live_storage(cfg, bq_client, MagicMock(), {})
+    marks = HighWaterMarks()
+
+    HighWaterSink(storage_fn, marks)(bq_client, "ds", "tbl", make_page(0, 3).records())
+    assert marks.get(("binance", "BTC/USDT", "1m")) is None
+    for hook in shutdown_hooks:
+        hook()
+
+    # The flush failed without a spool: the rows are fetched again after a restart.
+    assert bq_client.insert_rows_json.called
+    assert marks.get(("binance", "BTC/USDT", "1m")) is None
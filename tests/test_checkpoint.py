@@ -0,0 +1,53 @@
+from unittest.mock import MagicMock
+
+from factories import make_page
+
+from tda_collector.checkpoint import CheckpointStore
+from tda_collector.scheduler import run_history_loop
+
+
+def test_resume_cursor_walks_committed_ranges(tmp_path):
+    store = CheckpointStore(str(tmp_path / "cp.sqlite"))
+    store.record("binance", "BTC/USDT", "1m", 0, 1000, 400)
+    store.record("binance", "BTC/USDT", "1m", 400, 1000, 700)
+    store.record("binance", "BTC/USDT", "1m", 400, 1000, 600)  # never moves a cursor back
+
+    assert store.resume_cursor("binance", "BTC/USDT", "1m", 0) == 700
+    assert store.resume_cursor("binance", "BTC/USDT", "1m", 800) == 800
+    assert store.resume_cursor("bybit", "BTC/USDT", "1m", 0) == 0
+    store.close()
+
+
+def test_history_loop_resumes_after_interruption(tmp_path):
+    client = MagicMock()
+    client.id = "binance"
+    client.parse_timeframe.return_value = 60
+    store = CheckpointStore(str(tmp_path / "cp.sqlite"))
+    end_ms = 6 * 60_000
+    tasks = [(client, "BTC/USDT", "1m", 0, end_ms)]
+
+    def crashing_insert(client_arg, dataset, table, rows):
+        if rows.first_ms >= 2 * 60_000:
+            raise RuntimeError("node preempted")
+
+    run_history_loop(
+        tasks, fetch_page_fn=lambda c, s, tf, since, limit: make_page(since, limit),
+        storage_fn=crashing_insert, logger=MagicMock(), page_limit=2, checkpoints=store,
+    )
+
+    fetched = []
+    inserted = []
+
+    def fetch(client_arg, symbol, timeframe, since_ms, limit):
+        fetched.append(since_ms)
+        return make_page(since_ms, limit)
+
+    run_history_loop(
+        tasks, fetch_page_fn=fetch,
+        storage_fn=lambda c, d, t, rows: inserted.extend(rows.timestamps), logger=MagicMock(),
+        page_limit=2, checkpoints=store, resume=True,
+    )
+
+    assert fetched == [120_000, 240_000]
+    assert len(inserted) == 4
+    store.close()
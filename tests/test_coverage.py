@@ -0,0 +1,57 @@
+from unittest.mock import MagicMock
+
+from tda_collector.coverage import fetch_high_water_marks, missing_ranges, plan_repair_tasks
+
+HOUR = 3_600_000
+
+
+def test_missing_ranges_complements_covered_islands():
+    covered = [(2 * HOUR, 4 * HOUR), (5 * HOUR, 9 * HOUR)]
+    assert missing_ranges(covered, 0, 10 * HOUR, "1h", HOUR) == [
+        (0, 2 * HOUR),
+        (4 * HOUR, 5 * HOUR),
+        (9 * HOUR, 10 * HOUR),
+    ]
+    # A window starting mid-candle begins at the next candle open.
+    assert missing_ranges([], HOUR // 2, 2 * HOUR, "1h", HOUR) == [(HOUR, 2 * HOUR)]
+    assert missing_ranges([(0, 3 * HOUR)], 0, 3 * HOUR, "1h", HOUR) == []
+
+
+def test_plan_repair_tasks_uses_one_query_and_keeps_only_gaps():
+    client = MagicMock()
+    client.id = "bybit"
+    client.parse_timeframe.side_effect = lambda tf: {"1h": 3600, "1M": 2_592_000}[tf]
+    bq_client = MagicMock()
+    bq_client.project = "proj"
+    bq_client.query.return_value.result.return_value = [
+        {"exchange": "bybit", "symbol": "BTCUSDT", "timeframe": "1h", "first_ms": 0, "end_ms": 3 * HOUR},
+        {"exchange": "bybit", "symbol": "BTCUSDT", "timeframe": "1h", "first_ms": 5 * HOUR, "end_ms": 8 * HOUR},
+    ]
+    tasks = [
+        (client, "BTCUSDT", "1h", 0, 8 * HOUR),
+        (client, "BTCUSDT", "1M", 0, 8 * HOUR),
+    ]
+
+    repair = plan_repair_tasks(tasks, bq_client, "crypto", "ohlcv")
+
+    bq_client.query.assert_called_once()
+    assert "proj.crypto.ohlcv" in bq_client.query.call_args[0][0]
+    assert repair == [
+        (client, "BTCUSDT", "1h", 3 * HOUR, 5 * HOUR),
+        (client, "BTCUSDT", "1M", 0, 8 * HOUR),
+    ]
+
+
+def test_fetch_high_water_marks_reads_one_grouped_query():
+    bq_client = MagicMock()
+    bq_client.project = "proj"
+    bq_client.query.return_value.result.return_value = [
+        {"exchange": "bybit", "symbol": "BTCUSDT", "timeframe": "1h", "last_ms": 7 * HOUR},
+        {"exchange": "bybit", "symbol": "ETHUSDT", "timeframe": "1d", "last_ms": 0},
+    ]
+
+    marks = fetch_high_water_marks(bq_client, "crypto", "ohlcv", [("bybit", "BTCUSDT", "1h")], 0)
+
+    bq_client.query.assert_called_once()
+    assert "GROUP BY" in bq_client.query.call_args[0][0]
+    assert marks == {("bybit", "BTCUSDT", "1h"): 7 * HOUR}
@@ -0,0 +1,82 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from factories import make_record
+
+from tda_collector.dedup import LastWrittenCache
+from tda_collector.scheduler import run_live_loop
+from tda_collector.storage import insert_rows
+from tda_collector import storage
+
+
+def test_last_written_cache_returns_only_new_or_changed_bars():
+    cache = LastWrittenCache(max_bars_per_series=2)
+    first = [make_record(0, 1.5), make_record(1, 1.6)]
+    assert cache.changed(first) == first
+    cache.mark(first)
+
+    # Closed bar unchanged, forming bar moved, a new bar appeared.
+    update = [make_record(0, 1.5), make_record(1, 1.7), make_record(2, 1.8)]
+    assert [row.timestamp.minute for row in cache.changed(update)] == [1, 2]
+    cache.mark(update)
+    # Only the newest two timestamps are retained per series.
+    assert [row.timestamp.minute for row in cache.changed([make_record(0, 1.5)])] == [0]
+
+
+def test_insert_rows_passes_stable_insert_ids(monkeypatch):
+    monkeypatch.setattr(storage, "_ensured_tables", {"proj.ds.tbl"})
+    client = MagicMock()
+    client.project = "proj"
+    client.insert_rows_json.return_value = []
+
+    insert_rows(client, "ds", "tbl", [make_record(0, 1.5)], insert_ids=True)
+    insert_rows(client, "ds", "tbl", [make_record(0, 1.5)], insert_ids=True)
+
+    first_ids = client.insert_rows_json.call_args_list[0].kwargs["row_ids"]
+    second_ids = client.insert_rows_json.call_args_list[1].kwargs["row_ids"]
+    assert first_ids == second_ids
+    assert first_ids != [make_record(0, 1.6).insert_id()]
+
+
+class StopLoop(Exception):
+    pass
+
+
+def test_live_loop_resends_bars_whose_write_never_committed():
+    class DroppingSink:
+        """Queues rows like the batch writer, but no batch ever commits."""
+
+        def __init__(self):
+            self.calls = []
+
+        def __call__(self, client, dataset, table, rows):
+            self.calls.append(rows)
+
+        def after_commit(self, callback):
+            pass
+
+    client = MagicMock()
+    client.id = "binance"
+    client.rateLimit = 0
+    sink = DroppingSink()
+    sleeps = []
+
+    def stop_after_two(delay):
+        sleeps.append(delay)
+        if len(sleeps) >= 2:
+            raise StopLoop()
+
+    with pytest.raises(StopLoop):
+        run_live_loop(
+            60,
+            [(client, "BTC/USDT", "1m")],
+            fetch_fn=lambda *args: [make_record(0, 1.5), make_record(1, 1.6)],
+            storage_fn=sink,
+            logger=MagicMock(),
+            sleep_fn=stop_after_two,
+            change_cache=LastWrittenCache(),
+        )
+
+    # Nothing committed, so the unchanged bars are not treated as written.
+    assert [len(rows) for rows in sink.calls] == [2, 2]
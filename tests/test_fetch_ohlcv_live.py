@@ -22,3 +22,23 @@ def test_fetch_ohlcv_live_formats_previous_and_current():
     assert curr_bar.close == 2.0
     assert prev_bar.timestamp < curr_bar.timestamp
 
+
+def test_fetch_history_page_returns_columnar_batch():
+    client = MagicMock()
+    client.id = "binance"
+    client.fetch_ohlcv.return_value = [
+        [1672531200000, 1, 2, 0.5, 1.5, 100],
+        [1672531260000, 1.5, 2.5, 1.0, 2.0, 120],
+        [1672531320000, 2, 3, 1.5, 2.5, 140],
+    ]
+
+    batch = adapter.fetch_history_page(client, "BTC/USDT", "1m", 1672531200000, limit=3)
+
+    assert list(batch.timestamps) == [1672531200000, 1672531260000, 1672531320000]
+    window = batch.window(1672531260000, 1672531320000)
+    assert len(window) == 1
+    assert window.first_ms == window.last_ms == 1672531260000
+    # Columnar serialization matches the per-record BigQuery row.
+    record = batch.records()[1]
+    assert window.to_bq_rows()[0] == record.to_bq_row()
+    assert window.insert_ids() == [record.insert_id()]
@@ -1,6 +1,9 @@
 from datetime import datetime, timezone
 from unittest.mock import MagicMock
 
+from factories import make_page
+
+from tda_collector.models import CandleBatch
 from tda_collector.scheduler import run_history_loop
 
 
@@ -10,11 +13,15 @@ def test_history_loop_paginates_and_inserts(monkeypatch):
 
     row1_ts = datetime(2023, 1, 1, tzinfo=timezone.utc)
     row2_ts = datetime(2023, 1, 1, 0, 1, tzinfo=timezone.utc)
-
-    row = MagicMock()
-    row.timestamp = row1_ts
-    row2 = MagicMock()
-    row2.timestamp = row2_ts
+    page = CandleBatch.from_ohlcv(
+        "binance",
+        "BTC/USDT",
+        "1m",
+        [
+            [int(row1_ts.timestamp() * 1000), 1, 2, 0.5, 1.5, 100],
+            [int(row2_ts.timestamp() * 1000), 1.5, 2.5, 1.0, 2.0, 120],
+        ],
+    )
 
     fetch_calls = []
 
@@ -24,13 +31,13 @@ def test_history_loop_paginates_and_inserts(monkeypatch):
         fetch_calls.append(since_ms)
         limits_seen.append(limit)
         if len(fetch_calls) == 1:
-            return [row, row2]
-        return []
+            return page
+        return CandleBatch.from_ohlcv("binance", "BTC/USDT", "1m", [])
 
     inserted = []
 
     def fake_insert_rows(client_arg, dataset, table, rows):
-        inserted.extend(rows)
+        inserted.extend(rows.to_bq_rows())
 
     logger = MagicMock()
     tasks = [(client, "BTC/USDT", "1m", 0, int(row2_ts.timestamp() * 1000 + 60000))]
@@ -51,3 +58,40 @@ def test_history_loop_paginates_and_inserts(monkeypatch):
     assert fetch_calls[0] == 0
     assert all(limit == 123 for limit in limits_seen)
 
+
+def test_history_loop_shards_window_across_workers():
+    clients = []
+    for ex_id in ("binance", "bybit"):
+        client = MagicMock()
+        client.id = ex_id
+        client.rateLimit = 0
+        client.parse_timeframe.return_value = 60
+        clients.append(client)
+
+    fetch_calls = []
+
+    def fake_fetch_page(client_arg, symbol, timeframe, since_ms, limit=200):
+        fetch_calls.append((client_arg.id, since_ms))
+        return make_page(since_ms, limit, client_arg.id)
+
+    inserted = []
+
+    def fake_insert_rows(client_arg, dataset, table, rows):
+        inserted.extend(rows.timestamps)
+
+    end_ms = 10 * 60_000
+    tasks = [(client, "BTC/USDT", "1m", 0, end_ms) for client in clients]
+
+    run_history_loop(
+        tasks,
+        fetch_page_fn=fake_fetch_page,
+        storage_fn=fake_insert_rows,
+        logger=MagicMock(),
+        page_limit=2,
+        workers_per_exchange=3,
+        shard_pages=2,
+    )
+
+    # Each 10-candle window splits into shards of 4 candles (2 pages of 2) that run independently.
+    assert sorted(since for ex, since in fetch_calls if ex == "binance") == [0, 120_000, 240_000, 360_000, 480_000]
+    assert sorted(inserted) == sorted(list(range(0, end_ms, 60_000)) * 2)
@@ -0,0 +1,376 @@
+import json
+import threading
+from unittest.mock import MagicMock
+
+import ccxt
+import pytest
+
+from tda_collector.scheduler import run_aligned_live_loop, run_live_loop
+from tda_collector.universe import LiveTaskSet
+
+
+class StopLoop(Exception):
+    pass
+
+
+def _stop_after(cycles):
+    calls = {"count": 0}
+
+    def fake_sleep(delay):
+        calls["count"] += 1
+        if calls["count"] >= cycles:
+            raise StopLoop()
+
+    return fake_sleep
+
+
+def _logged_events(logger):
+    return [json.loads(call.args[0]) for call in logger.info.call_args_list]
+
+
+def test_live_loop_fans_out_per_exchange_and_reports_cycle_time():
+    clients = []
+    for ex_id in ("binance", "bybit"):
+        client = MagicMock()
+        client.id = ex_id
+        client.rateLimit = 0
+        clients.append(client)
+    tasks = [(client, symbol, "1m") for client in clients for symbol in ("BTC/USDT", "ETH/USDT", "SOL/USDT")]
+
+    threads = set()
+    lock = threading.Lock()
+
+    def fake_fetch(client, symbol, timeframe):
+        with lock:
+            threads.add(threading.current_thread().name)
+        return ("prev", "curr")
+
+    stored = []
+
+    def fake_store(client, dataset, table, rows):
+        with lock:
+            stored.append(rows)
+
+    logger = MagicMock()
+    with pytest.raises(StopLoop):
+        run_live_loop(
+            60,
+            tasks,
+            fetch_fn=fake_fetch,
+            storage_fn=fake_store,
+            logger=logger,
+            workers_per_exchange=2,
+            sleep_fn=_stop_after(1),
+        )
+
+    assert len(stored) == len(tasks)
+    assert any(name.startswith("live-binance") for name in threads)
+    assert any(name.startswith("live-bybit") for name in threads)
+    summary = [e for e in _logged_events(logger) if e["event"] == "live_cycle_summary"]
+    assert len(summary) == 1
+    assert summary[0]["tasks"] == len(tasks)
+    assert summary[0]["errors"] == 0
+    assert summary[0]["headroom_ms"] == summary[0]["interval_ms"] - summary[0]["duration_ms"]
+
+
+def test_aligned_live_loop_wakes_after_candle_close():
+    client = MagicMock()
+    client.id = "bybit"
+    client.parse_timeframe.side_effect = lambda tf: {"1h": 3600, "1d": 86400}[tf]
+    tasks = [(client, "BTCUSDT", "1h"), (client, "BTCUSDT", "1d")]
+
+    clock = {"now": 86_400.0 * 100 + 1800}  # 00:30 UTC
+    fetched = []
+    sleeps = []
+
+    def fake_fetch(client_arg, symbol, timeframe):
+        fetched.append((timeframe, clock["now"]))
+        return ("prev", "curr")
+
+    def fake_sleep(delay):
+        sleeps.append(delay)
+        clock["now"] += delay
+        if len(sleeps) >= 3:
+            raise StopLoop()
+
+    with pytest.raises(StopLoop):
+        run_aligned_live_loop(
+            tasks,
+            fetch_fn=fake_fetch,
+            storage_fn=lambda *args: None,
+            logger=MagicMock(),
+            settle_seconds=5,
+            sleep_fn=fake_sleep,
+            now_fn=lambda: clock["now"],
+        )
+
+    day_start = 86_400.0 * 100
+    # Startup pass, then 1h at 01:00:05 and 02:00:05; the daily task waits for midnight.
+    assert fetched == [
+        ("1h", day_start + 1800),
+        ("1d", day_start + 1800),
+        ("1h", day_start + 3605),
+        ("1h", day_start + 7205),
+    ]
+
+
+def test_aligned_refresh_wake_before_settle_keeps_the_settled_wake():
+    client = MagicMock()
+    client.id = "binance"
+    client.rateLimit = 0
+    client.parse_timeframe.side_effect = lambda tf: {"1h": 3600}[tf]
+    clock = {"now": 3600.0 - 28}
+    fetched = []
+    sleeps = []
+
+    def fake_fetch(client_arg, symbol, timeframe):
+        fetched.append(clock["now"])
+        return ("prev", "curr")
+
+    def fake_sleep(delay):
+        sleeps.append(delay)
+        clock["now"] += delay
+        if len(sleeps) >= 3:
+            raise StopLoop()
+
+    with pytest.raises(StopLoop):
+        run_aligned_live_loop(
+            [(client, "BTCUSDT", "1h")],
+            fetch_fn=fake_fetch,
+            storage_fn=lambda *args: None,
+            logger=MagicMock(),
+            settle_seconds=5,
+            forming_refresh_seconds=30,
+            sleep_fn=fake_sleep,
+            now_fn=lambda: clock["now"],
+        )
+
+    # The refresh at close + 2s still leaves the settled wake at close + 5s.
+    assert fetched == [3572.0, 3602.0, 3605.0]
+
+
+def test_live_loop_keeps_fixed_rate_and_defers_slow_timeframes_under_overload():
+    client = MagicMock()
+    client.id = "binance"
+    client.rateLimit = 0
+    client.parse_timeframe.side_effect = lambda tf: {"1m": 60, "1d": 86_400}[tf]
+    tasks = [(client, "ETH/USDT", "1d"), (client, "BTC/USDT", "1m"), (client, "SOL/USDT", "1m")]
+    clock = {"now": 0.0}
+    fetched = []
+    sleeps = []
+
+    def slow_fetch(client_arg, symbol, timeframe):
+        fetched.append((len(sleeps), symbol))
+        clock["now"] += 25  # three tasks need 75s per 60s cycle
+        return ("prev", "curr")
+
+    def fake_sleep(delay):
+        sleeps.append(delay)
+        clock["now"] += delay
+        if len(sleeps) >= 3:
+            raise StopLoop()
+
+    logger = MagicMock()
+    with pytest.raises(StopLoop):
+        run_live_loop(
+            60,
+            tasks,
+            fetch_fn=slow_fetch,
+            storage_fn=lambda *args: None,
+            logger=logger,
+            priorities={("binance", "SOL/USDT"): 1},
+            sleep_fn=fake_sleep,
+            clock_fn=lambda: clock["now"],
+        )
+
+    # First cycle runs everything (priority pair first) and overruns one tick.
+    assert [symbol for cycle, symbol in fetched if cycle == 0] == ["SOL/USDT", "ETH/USDT", "BTC/USDT"]
+    # Later cycles keep both 1m pairs and defer the daily one.
+    assert [symbol for cycle, symbol in fetched if cycle == 1] == ["SOL/USDT", "BTC/USDT"]
+    summaries = [e for e in _logged_events(logger) if e["event"] == "live_cycle_summary"]
+    assert summaries[0]["overrun_ticks"] == 1
+    assert summaries[1]["deferred"] == 1
+    # Cycles start on the 60s grid: 0, 120 (60 was skipped), 180.
+    assert [round(delay) for delay in sleeps] == [45, 10, 10]
+
+
+def test_live_loop_does_not_defer_a_task_whose_last_run_failed():
+    client = MagicMock()
+    client.id = "binance"
+    client.rateLimit = 0
+    client.parse_timeframe.side_effect = lambda tf: {"1m": 60, "1d": 86_400}[tf]
+    tasks = [(client, "ETH/USDT", "1d"), (client, "BTC/USDT", "1m"), (client, "SOL/USDT", "1m")]
+    clock = {"now": 0.0}
+    fetched = []
+    sleeps = []
+
+    def slow_fetch(client_arg, symbol, timeframe):
+        fetched.append((len(sleeps), symbol))
+        clock["now"] += 25
+        if symbol == "ETH/USDT" and len(sleeps) == 0:
+            raise ccxt.ExchangeError("bad gateway")
+        return ("prev", "curr")
+
+    def fake_sleep(delay):
+        sleeps.append(delay)
+        clock["now"] += delay
+        if len(sleeps) >= 2:
+            raise StopLoop()
+
+    with pytest.raises(StopLoop):
+        run_live_loop(
+            60,
+            tasks,
+            fetch_fn=slow_fetch,
+            storage_fn=lambda *args: None,
+            logger=MagicMock(),
+            priorities={("binance", "SOL/USDT"): 1},
+            sleep_fn=fake_sleep,
+            clock_fn=lambda: clock["now"],
+        )
+
+    # The daily fetch failed in the first cycle, so it is retried first instead of shed.
+    assert [symbol for cycle, symbol in fetched if cycle == 1] == ["SOL/USDT", "ETH/USDT", "BTC/USDT"]
+
+def test_live_loop_staggers_first_runs_that_do_not_fit_a_cycle():
+    client = MagicMock()
+    client.id = "binance"
+    client.rateLimit = 0
+    client.parse_timeframe.side_effect = lambda tf: 3600
+    tasks = [(client, f"S{i}/USDT", "1h") for i in range(8)]
+    clock = {"now": 0.0}
+    fetched = []
+    sleeps = []
+
+    def slow_fetch(client_arg, symbol, timeframe):
+        fetched.append((len(sleeps), symbol))
+        clock["now"] += 10
+        return ("prev", "curr")
+
+    def fake_sleep(delay):
+        sleeps.append(delay)
+        clock["now"] += delay
+        if len(sleeps) >= 2:
+            raise StopLoop()
+
+    logger = MagicMock()
+    with pytest.raises(StopLoop):
+        run_live_loop(
+            60,
+            tasks,
+            fetch_fn=slow_fetch,
+            storage_fn=lambda *args: None,
+            logger=logger,
+            sleep_fn=fake_sleep,
+            clock_fn=lambda: clock["now"],
+        )
+
+    summaries = [e for e in _logged_events(logger) if e["event"] == "live_cycle_summary"]
+    assert [symbol for cycle, symbol in fetched if cycle == 0] == [f"S{i}/USDT" for i in range(6)]
+    assert (summaries[0]["deferred"], summaries[0]["overrun_ticks"]) == (2, 0)
+    # The staggered pairs never ran, so they go first in the next cycle.
+    assert [symbol for cycle, symbol in fetched if cycle == 1][:2] == ["S6/USDT", "S7/USDT"]
+
+def test_live_loop_reaches_every_new_task_when_one_fetch_outlasts_the_interval():
+    client = MagicMock()
+    client.id = "binance"
+    client.rateLimit = 0
+    client.parse_timeframe.side_effect = lambda tf: 3600
+    tasks = [(client, f"S{i}/USDT", "1h") for i in range(6)]
+    clock = {"now": 0.0}
+    fetched = []
+
+    def slow_fetch(client_arg, symbol, timeframe):
+        fetched.append(symbol)
+        clock["now"] += 150  # longer than the 60s interval
+        return ("prev", "curr")
+
+    def fake_sleep(delay):
+        clock["now"] += delay
+        if clock["now"] > 3000:
+            raise StopLoop()
+
+    with pytest.raises(StopLoop):
+        run_live_loop(
+            60,
+            tasks,
+            fetch_fn=slow_fetch,
+            storage_fn=lambda *args: None,
+            logger=MagicMock(),
+            sleep_fn=fake_sleep,
+            clock_fn=lambda: clock["now"],
+        )
+
+    # Each cycle still starts one task, so the tail of the list is not starved.
+    assert fetched[:6] == [f"S{i}/USDT" for i in range(6)]
+
+
+def test_live_loops_pick_up_task_set_changes_between_cycles():
+    client = MagicMock()
+    client.id = "bybit"
+    client.rateLimit = 0
+    client.parse_timeframe.side_effect = lambda tf: {"1m": 60, "1h": 3600}[tf]
+
+    for schedule in ("interval", "aligned"):
+        task_set = LiveTaskSet([(client, "BTC/USDT", "1m"), (client, "ETH/USDT", "1h")])
+        clock = {"now": 86_400.0 * 100}
+        fetched = []
+        sleeps = []
+
+        def fake_fetch(client_arg, symbol, timeframe):
+            fetched.append((len(sleeps), symbol))
+            return ("prev", "curr")
+
+        def fake_sleep(delay):
+            sleeps.append(delay)
+            clock["now"] += delay
+            if len(sleeps) == 1:
+                task_set.replace([(client, "BTC/USDT", "1m"), (client, "SOL/USDT", "1m")])
+            if len(sleeps) >= 3:
+                raise StopLoop()
+
+        common = dict(fetch_fn=fake_fetch, storage_fn=lambda *args: None, logger=MagicMock(), sleep_fn=fake_sleep)
+        with pytest.raises(StopLoop):
+            if schedule == "interval":
+                run_live_loop(60, [], task_set=task_set, clock_fn=lambda: clock["now"], **common)
+            else:
+                run_aligned_live_loop([], task_set=task_set, now_fn=lambda: clock["now"], **common)
+
+        assert sorted(symbol for cycle, symbol in fetched if cycle == 0) == ["BTC/USDT", "ETH/USDT"], schedule
+        # The added pair runs right after the swap; the removed one is gone.
+        assert "SOL/USDT" in [symbol for cycle, symbol in fetched if cycle == 1], schedule
+        assert "ETH/USDT" not in [symbol for cycle, symbol in fetched if cycle >= 1], schedule
+
+
+def test_aligned_live_loop_refetches_a_close_crossed_by_a_slow_run():
+    client = MagicMock()
+    client.id = "bybit"
+    client.parse_timeframe.side_effect = lambda tf: {"1h": 3600}[tf]
+    clock = {"now": 86_400.0 * 100 + 3540}  # 00:59 UTC
+    fetched = []
+    sleeps = []
+
+    def slow_fetch(client_arg, symbol, timeframe):
+        fetched.append(clock["now"])
+        clock["now"] += 120  # the startup run ends at 01:01, after the 01:00 close
+        return ("prev", "curr")
+
+    def fake_sleep(delay):
+        sleeps.append(delay)
+        clock["now"] += delay
+        raise StopLoop()
+
+    with pytest.raises(StopLoop):
+        run_aligned_live_loop(
+            [(client, "BTCUSDT", "1h")],
+            fetch_fn=slow_fetch,
+            storage_fn=lambda *args: None,
+            logger=MagicMock(),
+            settle_seconds=5,
+            sleep_fn=fake_sleep,
+            now_fn=lambda: clock["now"],
+        )
+
+    day_start = 86_400.0 * 100
+    # The 00:00 candle closed during the startup run; it is fetched again right away.
+    assert fetched == [day_start + 3540, day_start + 3660]
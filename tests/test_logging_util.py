@@ -0,0 +1,47 @@
+import gzip
+import json
+import logging
+import queue
+from unittest.mock import MagicMock
+
+from tda_collector.logging_util import BatchingLokiHandler
+
+
+def _handler(**kwargs):
+    handler = BatchingLokiHandler(
+        url="http://loki/loki/api/v1/push",
+        auth=("user", "pass"),
+        tags={"service": "svc", "environment": "test"},
+        **kwargs,
+    )
+    handler.session = MagicMock()
+    handler.session.post.return_value.status_code = 204
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    return handler
+
+
+def _record(msg, level=logging.INFO):
+    return logging.LogRecord("tda", level, __file__, 1, msg, None, None)
+
+
+def test_batches_are_grouped_by_labels_and_gzipped():
+    handler = _handler(batch_size=100, flush_interval=60)
+    handler.emit(_record("a"))
+    handler.emit(_record("b", logging.ERROR))
+    handler.emit(_record("c"))
+    handler.close()
+
+    assert handler.session.post.call_count == 1
+    kwargs = handler.session.post.call_args.kwargs
+    assert kwargs["headers"]["Content-Encoding"] == "gzip"
+    payload = json.loads(gzip.decompress(kwargs["data"]))
+    streams = {s["stream"]["severity"]: [v[1] for v in s["values"]] for s in payload["streams"]}
+    assert streams == {"info": ["a", "c"], "error": ["b"]}
+
+
+def test_full_queue_drops_instead_of_blocking():
+    handler = _handler(timeout=0.1)
+    handler._queue = queue.Queue(maxsize=1)
+    handler._queue.put((0, "filler", ()))
+    handler.emit(_record("dropped"))
+    assert handler.dropped == 1
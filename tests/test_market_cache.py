@@ -0,0 +1,43 @@
+import json
+import time
+
+import ccxt
+
+from tda_collector.adapter import build_client
+from tda_collector.market_cache import MarketCache
+
+MARKETS = {
+    "BTC/USDT": {"id": "BTCUSDT", "symbol": "BTC/USDT", "base": "BTC", "quote": "USDT", "spot": True, "type": "spot"}
+}
+
+
+def test_cached_markets_are_preloaded_without_network(tmp_path, monkeypatch):
+    cache = MarketCache(str(tmp_path))
+    cache.save("binance", MARKETS, {"BTC": {"id": "BTC", "code": "BTC"}})
+
+    def no_network(self, *args, **kwargs):
+        raise AssertionError("load_markets should not hit the exchange")
+
+    monkeypatch.setattr(ccxt.binance, "fetch_markets", no_network)
+    client = build_client("binance", cache)
+
+    assert list(client.markets) == ["BTC/USDT"]
+    assert client.load_markets() is client.markets
+
+
+def test_stale_or_other_version_entries_are_refreshed(tmp_path, monkeypatch):
+    cache = MarketCache(str(tmp_path), ttl_seconds=60)
+    cache.save("binance", MARKETS, None)
+    path = tmp_path / "binance.json"
+    entry = json.loads(path.read_text())
+    entry["saved_at"] = time.time() - 120
+    path.write_text(json.dumps(entry))
+    assert cache.load("binance") is None
+
+    cache.save("binance", MARKETS, None)
+    assert MarketCache(str(tmp_path), version="0.0.0").load("binance") is None
+
+    loads = []
+    monkeypatch.setattr(ccxt.binance, "load_markets", lambda self, *a, **k: loads.append(1) or self.markets)
+    build_client("binance", MarketCache(str(tmp_path), version="0.0.0"))
+    assert loads == [1]
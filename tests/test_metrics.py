@@ -0,0 +1,46 @@
+import urllib.request
+
+import ccxt
+
+from tda_collector.metrics import Counter, Histogram, Registry, RETRIES, start_metrics_server
+from tda_collector.resilience import retry_with_backoff
+
+
+def test_registry_renders_prometheus_text():
+    registry = Registry()
+    rows = registry.register(Counter("rows_total", "Rows.", ["table"]))
+    latency = registry.register(Histogram("latency_seconds", "Latency.", ["exchange"], buckets=(0.1, 1.0)))
+    rows.inc(3, table="ohlcv")
+    latency.observe(0.05, exchange="bybit")
+    latency.observe(0.5, exchange="bybit")
+
+    text = registry.render()
+
+    assert "# TYPE rows_total counter" in text
+    assert 'rows_total{table="ohlcv"} 3.0' in text
+    assert 'latency_seconds_bucket{exchange="bybit",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{exchange="bybit",le="+Inf"} 2' in text
+    assert 'latency_seconds_count{exchange="bybit"} 2' in text
+
+
+def test_metrics_server_serves_registry_and_counts_retries():
+    before = RETRIES.value(error="NetworkError")
+    calls = {"count": 0}
+
+    def flaky():
+        calls["count"] += 1
+        if calls["count"] < 3:
+            raise ccxt.NetworkError("blip")
+        return "ok"
+
+    assert retry_with_backoff(flaky, (), sleep_fn=lambda _: None) == "ok"
+    assert RETRIES.value(error="NetworkError") == before + 2
+
+    server = start_metrics_server(0, host="127.0.0.1")
+    try:
+        port = server.server_address[1]
+        body = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5).read().decode()
+    finally:
+        server.shutdown()
+    assert "tda_retries_total" in body
+    assert "tda_fetch_seconds" in body
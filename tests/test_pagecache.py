@@ -0,0 +1,75 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from factories import mock_client
+
+from tda_collector.pagecache import CachingPageFetcher, PageCache, PageCacheMiss
+
+DAY_S = 86_400
+
+
+def test_closed_pages_are_served_from_disk(tmp_path):
+    candles = [[0, 1.0, 2.0, 0.5, 1.5, 3.0], [60_000, 1.5, 2.5, 1.0, 2.0, 4.0]]
+    client = mock_client(fetch_ohlcv=MagicMock(return_value=candles))
+    fetcher = CachingPageFetcher(PageCache(str(tmp_path)), now_fn=lambda: DAY_S)
+
+    first = fetcher(client, "BTC/USDT", "1m", 0, 2)
+    second = fetcher(client, "BTC/USDT", "1m", 0, 2)
+
+    assert client.fetch_ohlcv.call_count == 1
+    assert list(second.timestamps) == list(first.timestamps) == [0, 60_000]
+    assert list(second.close) == [1.5, 2.0]
+
+
+def test_open_pages_are_refetched_but_replayed_offline(tmp_path):
+    client = mock_client(fetch_ohlcv=MagicMock(return_value=[[0, 1.0, 2.0, 0.5, 1.5, 3.0]]))
+    cache = PageCache(str(tmp_path))
+    # Window [0, 200 * 60s) is still open at t=60s.
+    online = CachingPageFetcher(cache, now_fn=lambda: 60)
+
+    online(client, "BTC/USDT", "1m", 0, 200)
+    online(client, "BTC/USDT", "1m", 0, 200)
+    assert client.fetch_ohlcv.call_count == 2
+
+    replay = CachingPageFetcher(cache, offline=True)
+    assert len(replay(client, "BTC/USDT", "1m", 0, 200)) == 1
+    with pytest.raises(PageCacheMiss):
+        replay(client, "BTC/USDT", "1m", 60_000, 200)
+    assert client.fetch_ohlcv.call_count == 2
+
+
+def test_identical_pages_share_one_blob_and_closed_refs_are_kept(tmp_path):
+    cache = PageCache(str(tmp_path))
+    cache.put("ex", "A/USDT", "1m", 0, 10, [], closed=True)
+    cache.put("ex", "B/USDT", "1m", 0, 10, [], closed=True)
+    cache.put("ex", "A/USDT", "1m", 0, 10, [[0, 1, 1, 1, 1, 1]], closed=False)
+
+    assert len(list((tmp_path / "blobs").rglob("*.json.gz"))) == 1
+    assert cache.get("ex", "A/USDT", "1m", 0, 10) == []
+
+
+def test_history_replay_skips_the_exchange_rate_limiter(tmp_path):
+    import time
+
+    from tda_collector.scheduler import run_history_loop
+
+    step_ms = 60_000
+    candles = [[i * step_ms, 1.0, 2.0, 0.5, 1.5, 3.0] for i in range(200)]
+    client = mock_client()
+    client.fetch_ohlcv.side_effect = lambda symbol, timeframe, since, limit: [
+        c for c in candles if since <= c[0] < since + limit * step_ms
+    ]
+    cache = PageCache(str(tmp_path))
+    tasks = [(client, "BTC/USDT", "1m", 0, 200 * step_ms)]
+    run_kwargs = dict(storage_fn=lambda *args: None, logger=MagicMock(), page_limit=10, workers_per_exchange=2)
+    run_history_loop(tasks, fetch_page_fn=CachingPageFetcher(cache, now_fn=lambda: DAY_S), **run_kwargs)
+    requests = client.fetch_ohlcv.call_count
+
+    # One request per second would take 20s if cache hits waited for rate tokens.
+    client.rateLimit = 1000
+    started = time.monotonic()
+    run_history_loop(tasks, fetch_page_fn=CachingPageFetcher(cache, offline=True), **run_kwargs)
+
+    assert time.monotonic() - started < 5
+    assert client.fetch_ohlcv.call_count == requests
@@ -0,0 +1,172 @@
+from unittest.mock import MagicMock
+
+import ccxt
+
+from factories import mock_client
+
+from tda_collector.checkpoint import CheckpointStore
+from tda_collector.models import CandleBatch
+from tda_collector.probing import PageLimitCache, discover_page_limit, find_first_candle_ms
+from tda_collector.scheduler import run_history_loop
+
+STEP_MS = 60_000
+LISTING_MS = 1_700_000_000_000 // STEP_MS * STEP_MS
+
+
+def _exchange_pages(listing_ms, end_ms, max_page=1000, jump_to_listing=True, reject_above=None, halt=None, sparse=1):
+    """
+    fetch_page_fn for a symbol listed at listing_ms that caps pages at max_page. halt is
+    a (from_ms, to_ms) range without candles; sparse keeps every sparse-th candle only.
+    """
+    requests = []
+
+    def exists(ts):
+        in_halt = halt is not None and halt[0] <= ts < halt[1]
+        return listing_ms <= ts < end_ms and not in_halt and (ts - listing_ms) // STEP_MS % sparse == 0
+
+    def fetch_page(client, symbol, timeframe, since_ms, limit):
+        requests.append((since_ms, limit))
+        if reject_above and limit > reject_above:
+            raise ccxt.BadRequest("limit too large")
+        ts = max(since_ms, listing_ms)
+        # Jumping exchanges serve the first candles after since; others only answer
+        # inside the requested window.
+        window_end = end_ms if jump_to_listing else min(end_ms, since_ms + limit * STEP_MS)
+        candles = []
+        while ts < window_end and len(candles) < min(limit, max_page):
+            if halt is not None and halt[0] <= ts < halt[1]:
+                ts = halt[1]
+                continue
+            if exists(ts):
+                candles.append([ts, 1, 2, 0.5, 1.5, 10])
+            ts += STEP_MS
+        return CandleBatch.from_ohlcv(client.id, symbol, timeframe, candles)
+
+    return fetch_page, requests
+
+
+def test_find_first_candle_uses_exchange_jump_in_one_request():
+    fetch, requests = _exchange_pages(LISTING_MS, LISTING_MS + 10_000 * STEP_MS)
+    client = MagicMock(id="ex")
+
+    first = find_first_candle_ms(fetch, client, "X/USDT", "1m", 0, LISTING_MS + 10_000 * STEP_MS, STEP_MS)
+
+    assert first == LISTING_MS
+    assert len(requests) == 1
+
+
+def test_find_first_candle_skips_nothing_when_an_empty_answer_is_ambiguous():
+    end_ms = LISTING_MS + 100_000 * STEP_MS
+    client = MagicMock(id="ex")
+    start_ms = LISTING_MS - 10_000 * STEP_MS
+    # A 40k-minute halt after listing answers like time before listing does.
+    halt = (LISTING_MS + 1_000 * STEP_MS, LISTING_MS + 41_000 * STEP_MS)
+    fetch, requests = _exchange_pages(LISTING_MS, end_ms, jump_to_listing=False, halt=halt)
+
+    assert find_first_candle_ms(fetch, client, "X/USDT", "1m", start_ms, end_ms, STEP_MS) == start_ms
+    assert len(requests) == 1
+
+    # An exchange that jumps to the next candle still skips to the listing.
+    fetch, _ = _exchange_pages(LISTING_MS, end_ms, halt=halt)
+    assert find_first_candle_ms(fetch, client, "X/USDT", "1m", start_ms, end_ms, STEP_MS) == LISTING_MS
+
+
+def test_find_first_candle_seeds_from_market_created_and_confirms_it():
+    end_ms = LISTING_MS + 100_000 * STEP_MS
+    start_ms = LISTING_MS - 50_000 * STEP_MS
+    halt = (LISTING_MS + 1_000 * STEP_MS, LISTING_MS + 41_000 * STEP_MS)
+    fetch, requests = _exchange_pages(LISTING_MS, end_ms, jump_to_listing=False, halt=halt)
+    client = MagicMock(id="ex", markets={"X/USDT": {"created": LISTING_MS + 30_000}})
+
+    assert find_first_candle_ms(fetch, client, "X/USDT", "1m", start_ms, end_ms, STEP_MS) == LISTING_MS
+    # Empty start, the listing candle, and the page right before it.
+    assert len(requests) == 3
+
+    # Metadata that lists the market after its first candles is not trusted.
+    client = MagicMock(id="ex", markets={"X/USDT": {"created": LISTING_MS + 500 * STEP_MS}})
+    assert find_first_candle_ms(fetch, client, "X/USDT", "1m", start_ms, end_ms, STEP_MS) == start_ms
+    # Nor is metadata pointing into a halt.
+    client = MagicMock(id="ex", markets={"X/USDT": {"created": LISTING_MS + 2_000 * STEP_MS}})
+    assert find_first_candle_ms(fetch, client, "X/USDT", "1m", start_ms, end_ms, STEP_MS) == start_ms
+
+
+def test_discover_page_limit_halves_on_rejection_and_caches(tmp_path):
+    end_ms = LISTING_MS + 100_000 * STEP_MS
+    fetch, requests = _exchange_pages(LISTING_MS, end_ms, max_page=1000, reject_above=2500)
+    client = MagicMock(id="ex")
+
+    limit = discover_page_limit(fetch, client, "X/USDT", "1m", LISTING_MS, end_ms, STEP_MS, 200, 5000)
+    assert limit == 1000
+    assert [lim for _, lim in requests] == [5000, 2500]
+
+    # A sparse series returns a short, gappy page: keep the configured default.
+    fetch, _ = _exchange_pages(LISTING_MS, end_ms, max_page=1000, sparse=3)
+    assert discover_page_limit(fetch, client, "X/USDT", "1m", LISTING_MS, end_ms, STEP_MS, 200, 5000) is None
+    fetch, _ = _exchange_pages(LISTING_MS, LISTING_MS + 6_000 * STEP_MS, max_page=37)
+    assert discover_page_limit(fetch, client, "X/USDT", "1m", LISTING_MS, end_ms, STEP_MS, 200, 5000) is None
+
+    cache = PageLimitCache(str(tmp_path / "limits.json"))
+    cache.set("ex", "1m", limit)
+    assert PageLimitCache(str(tmp_path / "limits.json")).get("ex", "1m") == 1000
+
+
+def test_discover_page_limit_clamps_to_short_windows():
+    client = MagicMock(id="ex")
+    # 1095 daily-sized steps: the exchange still caps the clamped request.
+    end_ms = LISTING_MS + 1_095 * STEP_MS
+    fetch, requests = _exchange_pages(LISTING_MS, end_ms, max_page=1000)
+    assert discover_page_limit(fetch, client, "X/USDT", "1m", LISTING_MS, end_ms, STEP_MS, 200, 5000) == 1000
+    assert [lim for _, lim in requests] == [1095]
+
+    # A window that fits in one accepted page yields its full size.
+    end_ms = LISTING_MS + 600 * STEP_MS
+    fetch, _ = _exchange_pages(LISTING_MS, end_ms, max_page=1000)
+    assert discover_page_limit(fetch, client, "X/USDT", "1m", LISTING_MS, end_ms, STEP_MS, 200, 5000) == 600
+
+    # Windows no longer than the default page need no discovery.
+    fetch, requests = _exchange_pages(LISTING_MS, end_ms, max_page=1000)
+    assert discover_page_limit(fetch, client, "X/USDT", "1m", LISTING_MS, LISTING_MS + 150 * STEP_MS, STEP_MS, 200, 5000) is None
+    assert requests == []
+
+
+def test_history_loop_skips_pre_listing_range_and_uses_discovered_pages():
+    end_ms = LISTING_MS + 20_000 * STEP_MS
+    fetch, requests = _exchange_pages(LISTING_MS, end_ms, max_page=1000)
+    client = mock_client("ex", rateLimit=0)
+    stored = []
+
+    run_history_loop(
+        [(client, "X/USDT", "1m", LISTING_MS - 500_000 * STEP_MS, end_ms)],
+        fetch_page_fn=fetch,
+        storage_fn=lambda bq, dataset, table, rows: stored.append(len(rows)),
+        logger=MagicMock(),
+        page_limit=200,
+        page_limits=PageLimitCache(),
+        max_page_limit=5000,
+        probe_listing=True,
+    )
+
+    assert sum(stored) == 20_000
+    # 1 probe + 1 discovery + 20 pages of 1000, instead of 100 pages of 200.
+    assert len(requests) == 22
+
+
+def test_history_resume_keeps_probed_cursor_for_ranges_without_checkpoint(tmp_path):
+    end_ms = LISTING_MS + 2_000 * STEP_MS
+    fetch, requests = _exchange_pages(LISTING_MS, end_ms, max_page=1000)
+    client = mock_client("ex", rateLimit=0)
+    store = CheckpointStore(str(tmp_path / "cp.sqlite"))
+
+    run_history_loop(
+        [(client, "X/USDT", "1m", LISTING_MS - 500_000 * STEP_MS, end_ms)],
+        fetch_page_fn=fetch,
+        storage_fn=lambda bq, dataset, table, rows: None,
+        logger=MagicMock(),
+        page_limit=1000,
+        checkpoints=store,
+        resume=True,
+        probe_listing=True,
+    )
+
+    # 1 probe + 2 pages from the listing, none from the configured start.
+    assert [since for since, _ in requests] == [LISTING_MS - 500_000 * STEP_MS, LISTING_MS, LISTING_MS + 1_000 * STEP_MS]
@@ -0,0 +1,126 @@
+import random
+from unittest.mock import MagicMock
+
+from factories import mock_client
+
+from tda_collector.checkpoint import CheckpointStore
+from tda_collector.models import CandleBatch
+from tda_collector.resample import Resampler, ResamplingFetcher, ResamplingSink, plan_derived_tasks
+from tda_collector.scheduler import run_history_loop
+
+HOUR_MS = 3_600_000
+DAY_MS = 24 * HOUR_MS
+MONDAY_MS = 1_704_067_200_000  # 2024-01-01T00:00:00Z
+
+
+def _hourly(start_ms, count):
+    return [[start_ms + i * HOUR_MS, 10.0 + i, 20.0 + i, 5.0 + i, 11.0 + i, 1.0] for i in range(count)]
+
+
+def test_plan_keeps_only_the_finest_timeframe():
+    client = mock_client()
+    tasks = [(client, "BTC/USDT", tf) for tf in ("1w", "1d", "1h")] + [(client, "ETH/USDT", "1d")]
+
+    fetched, plan = plan_derived_tasks(tasks)
+
+    assert [(task[1], task[2]) for task in fetched] == [("BTC/USDT", "1h"), ("ETH/USDT", "1d")]
+    assert plan == {("binance", "BTC/USDT", "1h"): (HOUR_MS, [("1w", 7 * DAY_MS), ("1d", DAY_MS)])}
+
+
+def test_history_buckets_are_order_independent_and_week_aligned():
+    candles = _hourly(MONDAY_MS, 24 * 8)
+    shuffled = candles[:]
+    random.Random(7).shuffle(shuffled)
+    resampler = Resampler("binance", "BTC/USDT", "1h", HOUR_MS, [("1d", DAY_MS), ("1w", 7 * DAY_MS)])
+
+    batches = []
+    for offset in range(0, len(shuffled), 50):
+        batches.extend(resampler.collect(shuffled[offset : offset + 50]))
+    weekly = [b for b in batches if b.timeframe == "1w"]
+    daily = [b for b in batches if b.timeframe == "1d"]
+
+    assert len(weekly) == 1 and list(weekly[0].timestamps) == [MONDAY_MS]
+    assert weekly[0].open[0] == 10.0 and weekly[0].close[0] == 11.0 + 167
+    assert weekly[0].high[0] == 20.0 + 167 and weekly[0].low[0] == 5.0
+    assert weekly[0].volume[0] == 168.0
+    assert sum(len(b) for b in daily) == 8
+    # The second week is still open and only written by flush().
+    flushed = resampler.flush()
+    assert [(b.timeframe, list(b.timestamps)) for b in flushed] == [("1w", [MONDAY_MS + 7 * DAY_MS])]
+
+
+def test_history_sink_drops_bucket_cut_by_range_start():
+    stored = []
+    sink = ResamplingSink(
+        lambda client, dataset, table, rows: stored.append(rows),
+        {("binance", "BTC/USDT", "1h"): (HOUR_MS, [("1d", DAY_MS)])},
+    )
+    # Starts at 12:00, so the first day is incomplete and must not be written.
+    sink(None, "crypto", "ohlcv", CandleBatch.from_ohlcv("binance", "BTC/USDT", "1h", _hourly(MONDAY_MS + 12 * HOUR_MS, 36)))
+    sink.close()
+
+    derived = [b for b in stored if b.timeframe == "1d"]
+    assert [list(b.timestamps) for b in derived] == [[MONDAY_MS + DAY_MS]]
+
+
+def test_resumed_history_rebuilds_the_derived_bucket_around_its_cursor(tmp_path):
+    client = mock_client(rateLimit=0)
+    store = CheckpointStore(str(tmp_path / "cp.sqlite"))
+    plan = {("binance", "BTC/USDT", "1h"): (HOUR_MS, [("1d", DAY_MS)])}
+    end_ms = MONDAY_MS + 3 * DAY_MS
+    # Two shards of 36h: the first finished, the second stopped at 60h.
+    store.record("binance", "BTC/USDT", "1h", MONDAY_MS, MONDAY_MS + 36 * HOUR_MS, MONDAY_MS + 36 * HOUR_MS)
+    store.record("binance", "BTC/USDT", "1h", MONDAY_MS + 36 * HOUR_MS, end_ms, MONDAY_MS + 60 * HOUR_MS)
+    fetched = []
+    stored = []
+
+    def fetch_page(client, symbol, timeframe, since_ms, limit):
+        fetched.append(since_ms)
+        count = min(limit, (end_ms - since_ms) // HOUR_MS)
+        return CandleBatch.from_ohlcv(client.id, symbol, timeframe, _hourly(since_ms, count))
+
+    sink = ResamplingSink(lambda bq, dataset, table, rows: stored.append(rows), plan)
+    run_history_loop(
+        [(client, "BTC/USDT", "1h", MONDAY_MS, end_ms)],
+        fetch_page_fn=fetch_page,
+        storage_fn=sink,
+        logger=MagicMock(),
+        page_limit=12,
+        workers_per_exchange=2,
+        shard_pages=3,
+        checkpoints=store,
+        resume=True,
+    )
+    sink.close()
+
+    # The second shard re-reads its day from midnight; the third day is whole again.
+    assert fetched[0] == MONDAY_MS + 2 * DAY_MS
+    daily = [b for b in stored if b.timeframe == "1d"]
+    assert [(ts, vol) for b in daily for ts, vol in zip(b.timestamps, b.volume)] == [(MONDAY_MS + 2 * DAY_MS, 24.0)]
+
+
+def test_live_fetcher_seeds_bucket_and_returns_forming_derived_bar():
+    client = mock_client()
+    now_ms = MONDAY_MS + 5 * HOUR_MS + 1
+    seed_pages = []
+
+    def seed_page(client, symbol, timeframe, since_ms, limit):
+        seed_pages.append(since_ms)
+        return CandleBatch.from_ohlcv(client.id, symbol, timeframe, _hourly(MONDAY_MS, 6))
+
+    def fetch_last_two(client, symbol, timeframe):
+        return CandleBatch.from_ohlcv(client.id, symbol, timeframe, _hourly(MONDAY_MS, 6)[4:]).records()
+
+    fetcher = ResamplingFetcher(
+        {("binance", "BTC/USDT", "1h"): (HOUR_MS, [("1d", DAY_MS)])},
+        fetch_fn=fetch_last_two,
+        seed_page_fn=seed_page,
+        seed_page_limit=1000,
+        now_fn=lambda: now_ms / 1000,
+    )
+    rows = fetcher(client, "BTC/USDT", "1h")
+
+    assert seed_pages == [MONDAY_MS]
+    daily = [row for row in rows if row.timeframe == "1d"]
+    assert len(rows) == 3 and len(daily) == 1
+    assert daily[0].open == 10.0 and daily[0].close == 16.0 and daily[0].volume == 6.0
@@ -1,6 +1,16 @@
+from unittest.mock import MagicMock
+
 import ccxt
+import pytest
 
-from tda_collector.resilience import retry_with_backoff
+from tda_collector.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ExchangeGuard,
+    TokenBucket,
+    retry_after_seconds,
+    retry_with_backoff,
+)
 
 
 def test_retry_with_backoff_retries_and_raises_after_max():
@@ -37,3 +47,101 @@ def test_retry_with_backoff_retries_and_raises_after_max():
     assert len(sleeps) == 2
     assert sleeps[0] == 0.01
 
+
+def test_token_bucket_spaces_call_starts():
+    sleeps = []
+    bucket = TokenBucket(2.0, sleep_fn=sleeps.append)
+
+    for _ in range(3):
+        bucket.acquire()
+
+    # First call goes straight through; the next ones wait for their reserved slot.
+    assert len(sleeps) == 2
+    assert sleeps[0] == pytest.approx(0.5, abs=0.05)
+    assert sleeps[1] == pytest.approx(1.0, abs=0.05)
+
+
+def test_token_bucket_halves_rate_and_honours_retry_after():
+    clock = {"now": 100.0}
+    sleeps = []
+    bucket = TokenBucket(10.0, sleep_fn=sleeps.append, now_fn=lambda: clock["now"])
+
+    bucket.throttled(retry_after=3.0)
+    assert bucket.rate == 5.0
+    bucket.acquire()
+    assert sleeps == [pytest.approx(3.0)]
+
+    for _ in range(20):
+        bucket.succeeded()
+    assert bucket.rate == 10.0
+
+
+def test_circuit_breaker_opens_then_probes():
+    clock = {"now": 0.0}
+    breaker = CircuitBreaker(failure_threshold=2, cooldown_seconds=10, now_fn=lambda: clock["now"])
+
+    breaker.record_failure()
+    assert breaker.allow()
+    assert breaker.record_failure() is True
+    assert not breaker.allow()
+
+    clock["now"] = 10.0
+    assert breaker.allow()  # single half-open probe
+    assert not breaker.allow()
+    assert breaker.record_success() is True
+    assert breaker.allow()
+
+
+def test_exchange_guard_throttles_on_rate_limit_and_rejects_when_open():
+    client = MagicMock()
+    client.last_response_headers = {"Retry-After": "2"}
+    bucket = TokenBucket(0, sleep_fn=lambda _: None)
+    guard = ExchangeGuard("ex", bucket, CircuitBreaker(failure_threshold=1, cooldown_seconds=60))
+
+    def rate_limited():
+        raise ccxt.RateLimitExceeded("429")
+
+    with pytest.raises(ccxt.RateLimitExceeded):
+        guard.wrap(client, rate_limited)()
+    assert bucket._paused_until > 0
+    assert guard.breaker.state == CircuitBreaker.CLOSED
+
+    def down():
+        raise ccxt.ExchangeNotAvailable("502")
+
+    with pytest.raises(ccxt.ExchangeNotAvailable):
+        guard.wrap(client, down)()
+    with pytest.raises(CircuitOpenError):
+        guard.wrap(client, lambda: "ok")()
+
+
+def test_exchange_guard_charges_ccxt_endpoint_costs_by_limit():
+    client = ccxt.binance()
+    clock = {"now": 0.0}
+    bucket = TokenBucket(1.0, sleep_fn=lambda delay: clock.update(now=clock["now"] + delay), now_fn=lambda: clock["now"])
+    guard = ExchangeGuard("binance", bucket, CircuitBreaker())
+    klines = {"cost": 1, "byLimit": [[99, 1], [499, 2], [1000, 5], [10000, 10]]}
+
+    def fetch_page(since, limit):
+        # What ccxt's fetch2 does before sending a request with enableRateLimit.
+        return client.calculate_rate_limiter_cost("fapiPublic", "GET", "klines", {"limit": limit}, klines)
+
+    fetch = guard.wrap(client, fetch_page, cost_key=lambda since, limit: limit)
+    fetch(0, 1000)
+    # Charged 1 up front, the remaining 4 units booked once ccxt priced the call.
+    assert bucket._tat == pytest.approx(5.0)
+    fetch(0, 1000)
+    assert clock["now"] == pytest.approx(5.0)
+    assert bucket._tat == pytest.approx(10.0)
+    fetch(0, 50)
+    assert bucket._tat == pytest.approx(11.0)
+
+
+def test_retry_after_seconds_reads_headers():
+    client = MagicMock()
+    client.last_response_headers = {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "7"}
+    assert retry_after_seconds(client) == 7.0
+    client.last_response_headers = {"retry-after": "1.5"}
+    assert retry_after_seconds(client) == 1.5
+    client.last_response_headers = {}
+    assert retry_after_seconds(client) is None
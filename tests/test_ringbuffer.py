@@ -0,0 +1,83 @@
+import json
+import struct
+import urllib.request
+from unittest.mock import MagicMock
+
+from factories import make_record, mock_client
+
+from tda_collector.models import CandleBatch
+from tda_collector.ringbuffer import (
+    BAR_STRUCT,
+    CandleRing,
+    RingFeedingSink,
+    RingStore,
+    start_query_server,
+    warm_ring_store,
+)
+
+
+def test_candle_ring_keeps_newest_in_order_and_overwrites_forming_bar():
+    ring = CandleRing(3)
+    for ts in (60_000, 120_000, 180_000, 240_000):
+        ring.put((ts, 1.0, 2.0, 0.5, float(ts), 1.0))
+    ring.put((240_000, 1.0, 2.0, 0.5, 9.0, 1.0))
+
+    assert [bar[0] for bar in ring.latest(10)] == [120_000, 180_000, 240_000]
+    assert ring.latest(1)[0][4] == 9.0
+    assert [bar[0] for bar in ring.latest(10, since_ms=180_000)] == [180_000, 240_000]
+
+
+def test_seed_does_not_overwrite_live_bars_and_fills_older_ones():
+    store = RingStore(capacity=4)
+    store.add_records([make_record(3, 5.0, base_ms=0)])
+    warmup = [[60_000, 1, 1, 1, 1, 1], [120_000, 1, 1, 1, 2, 1], [180_000, 1, 1, 1, 3, 1]]
+    store.seed(("binance", "BTC/USDT", "1m"), warmup)
+
+    bars = store.latest(("binance", "BTC/USDT", "1m"), 10)
+    assert [(bar[0], bar[4]) for bar in bars] == [(60_000, 1.0), (120_000, 2.0), (180_000, 5.0)]
+
+
+def test_ring_feeding_sink_records_then_stores():
+    store = RingStore(capacity=2)
+    storage_fn = MagicMock()
+    sink = RingFeedingSink(storage_fn, store)
+    rows = [make_record(1, 1.0, base_ms=0)]
+
+    sink("bq", "ds", "tbl", rows)
+
+    storage_fn.assert_called_once_with("bq", "ds", "tbl", rows)
+    assert store.series() == [{"exchange": "binance", "symbol": "BTC/USDT", "timeframe": "1m", "bars": 1}]
+
+
+def test_warm_ring_store_fetches_one_page_per_series():
+    client = mock_client()
+    calls = []
+
+    def page_fn(client, symbol, timeframe, since_ms, limit):
+        calls.append((since_ms, limit))
+        return CandleBatch.from_ohlcv(client.id, symbol, timeframe, [[600_000 - 60_000, 1, 1, 1, 1, 1]])
+
+    store = RingStore(capacity=5)
+    warm_ring_store(store, [(client, "BTC/USDT", "1m")], logger=MagicMock(), page_fn=page_fn, now_fn=lambda: 600.0)
+
+    assert calls == [(300_000, 5)]
+    assert len(store.latest(("binance", "BTC/USDT", "1m"), 5)) == 1
+
+
+def test_query_server_serves_json_and_binary():
+    store = RingStore(capacity=4)
+    store.add_records([make_record(1, 1.0, base_ms=0), make_record(2, 2.0, base_ms=0)])
+    server = start_query_server(store, 0)
+    base = f"http://127.0.0.1:{server.server_address[1]}/candles?exchange=binance&symbol=BTC/USDT&timeframe=1m"
+    try:
+        with urllib.request.urlopen(base + "&limit=1") as response:
+            payload = json.loads(response.read())
+        with urllib.request.urlopen(base + "&format=binary") as response:
+            count = int(response.headers["X-Candle-Count"])
+            body = response.read()
+    finally:
+        server.shutdown()
+
+    assert payload["candles"] == [[120_000, 1.0, 2.0, 0.5, 2.0, 100.0]]
+    assert count == 2
+    assert [bar[0] for bar in struct.iter_unpack(BAR_STRUCT.format, body)] == [60_000, 120_000]
@@ -0,0 +1,127 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from factories import mock_client
+
+from tda_collector.sharding import (
+    run_local_shards,
+    scale_rate_limits,
+    select_shard,
+    shard_argv,
+    shard_dir,
+    weight_by_frequency,
+)
+
+
+def _tasks():
+    clients = [mock_client("binance", rateLimit=100), mock_client("kraken", rateLimit=100)]
+    symbols = [f"S{i}/USDT" for i in range(10)]
+    return [(client, symbol, tf) for client in clients for symbol in symbols for tf in ("1m", "1h", "1d")]
+
+
+def test_select_shard_partitions_tasks_deterministically():
+    tasks = _tasks()
+    shards = [select_shard(tasks, index, 3)[0] for index in range(3)]
+
+    keys = [(t[0].id, t[1], t[2]) for shard in shards for t in shard]
+    assert sorted(keys) == sorted((t[0].id, t[1], t[2]) for t in tasks)
+    assert len(set(keys)) == len(tasks)
+    # Another process building the same config picks the same tasks.
+    assert [(t[0].id, t[1], t[2]) for t in select_shard(_tasks(), 1, 3)[0]] == [
+        (t[0].id, t[1], t[2]) for t in shards[1]
+    ]
+
+
+def test_unweighted_owners_do_not_depend_on_the_rest_of_the_universe():
+    tasks = _tasks()
+    # Two shards that resolved different universes still agree on every shared series.
+    smaller = [task for task in tasks if task[1] != "S3/USDT"]
+    for index in range(3):
+        owned = {(t[0].id, t[1], t[2]) for t in select_shard(tasks, index, 3, weighted=False)[0]}
+        owned_smaller = {(t[0].id, t[1], t[2]) for t in select_shard(smaller, index, 3, weighted=False)[0]}
+        assert owned_smaller == {key for key in owned if key[1] != "S3/USDT"}
+
+
+def test_weighted_shards_balance_one_minute_series():
+    tasks = _tasks()
+    counts = [sum(1 for t in select_shard(tasks, index, 4)[0] if t[2] == "1m") for index in range(4)]
+    assert max(counts) - min(counts) <= 1
+
+
+def test_interval_schedule_shards_by_task_count():
+    client = mock_client("binance", rateLimit=100)
+    tasks = [(client, "BTC/USDT", "1m")] + [(client, f"S{i}/USDT", "1d") for i in range(1000)]
+    weighted = weight_by_frequency("live", "interval")
+
+    shards = [select_shard(tasks, index, 2, weighted) for index in range(2)]
+
+    # Every task costs one request per interval, whatever its timeframe.
+    assert not weighted
+    assert [len(selected) for selected, _ in shards] == pytest.approx([500.5, 500.5], abs=30)
+    for selected, shares in shards:
+        assert shares["binance"] == pytest.approx(len(selected) / len(tasks))
+    assert weight_by_frequency("live", "aligned") and weight_by_frequency("history", "interval")
+    assert not weight_by_frequency("stream", "aligned")
+
+
+def test_select_shard_rejects_bad_index():
+    with pytest.raises(ValueError):
+        select_shard(_tasks(), 3, 3)
+
+
+def test_scale_rate_limits_by_exchange_share():
+    tasks = _tasks()
+    _, shares = select_shard(tasks, 0, 2)
+    client = tasks[0][0]
+    scale_rate_limits([client], shares)
+    assert client.rateLimit == pytest.approx(100 / shares["binance"])
+    assert 0.4 < shares["binance"] < 0.6
+
+
+def test_shard_argv_replaces_shard_options():
+    argv = ["--mode=live", "--local-shards", "3", "--metrics-port=9100", "--config", "c.yaml"]
+    assert shard_argv(argv, 2, 3, 9100) == [
+        "--mode=live",
+        "--config",
+        "c.yaml",
+        "--shard-index",
+        "2",
+        "--shard-count",
+        "3",
+        "--metrics-port",
+        "9102",
+    ]
+
+
+def test_shard_argv_gives_each_child_its_own_query_port():
+    argv = ["--mode=live", "--query-port=8080", "--query-host", "0.0.0.0"]
+    assert shard_argv(argv, 1, 3, query_port=8080) == [
+        "--mode=live",
+        "--query-host",
+        "0.0.0.0",
+        "--shard-index",
+        "1",
+        "--shard-count",
+        "3",
+        "--query-port",
+        "8081",
+    ]
+
+
+def test_shard_dir_separates_spools_only_when_sharded(tmp_path):
+    assert shard_dir(str(tmp_path), 0, 1) == str(tmp_path)
+    assert shard_dir(str(tmp_path), 2, 3) == str(tmp_path / "shard-2")
+
+
+def test_run_local_shards_returns_worst_exit_code():
+    spawned = []
+
+    def spawn(args):
+        child = MagicMock()
+        child.wait.return_value = len(spawned)
+        spawned.append(args)
+        return child
+
+    assert run_local_shards(["--mode=live"], 2, spawn=spawn) == 1
+    assert [args[2] for args in spawned] == ["0", "1"]
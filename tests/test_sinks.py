@@ -0,0 +1,108 @@
+import sqlite3
+import time
+from datetime import datetime, timezone
+from unittest.mock import MagicMock
+
+import pytest
+
+from tda_collector.models import CandleBatch
+from tda_collector.sinks import DuckDBSink, FanoutSink, SQLiteSink, build_local_sinks, fan_out, row_tuples
+
+
+def _batch(close=1.0):
+    ingested = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    return CandleBatch.from_ohlcv(
+        "binance", "BTC/USDT", "1m", [[60_000, 1, 2, 0.5, close, 3], [120_000, 1, 2, 0.5, close, 3]], ingested
+    )
+
+
+def test_row_tuples_match_for_batches_and_records():
+    batch = _batch()
+    assert row_tuples(batch) == row_tuples(batch.records())
+    assert row_tuples(batch)[0] == (60_000, "binance", "BTC/USDT", "1m", 1.0, 2.0, 0.5, 1.0, 3.0, 1704067200000)
+
+
+def test_sqlite_sink_upserts_by_series_and_timestamp(tmp_path):
+    path = tmp_path / "lake.sqlite"
+    sink = SQLiteSink(str(path))
+    sink(None, "crypto", "ohlcv", _batch(close=1.0))
+    sink(None, "crypto", "ohlcv", _batch(close=5.0).records())
+    sink.close()
+
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT timestamp, close FROM ohlcv ORDER BY timestamp").fetchall() == [
+        (60_000, 5.0),
+        (120_000, 5.0),
+    ]
+
+
+def test_duckdb_sink_bulk_upserts_keep_the_last_update(tmp_path):
+    duckdb = pytest.importorskip("duckdb")
+    path = tmp_path / "lake.duckdb"
+    sink = DuckDBSink(str(path))
+    sink(None, "crypto", "ohlcv", _batch(close=1.0))
+    # One write holding two updates of the same bars, as the batch writer merges them.
+    sink(None, "crypto", "ohlcv", _batch(close=2.5).records() + _batch(close=5.0).records())
+    sink.close()
+
+    conn = duckdb.connect(str(path))
+    assert conn.execute("SELECT timestamp, symbol, close, ingested_at FROM ohlcv ORDER BY timestamp").fetchall() == [
+        (60_000, "BTC/USDT", 5.0, 1704067200000),
+        (120_000, "BTC/USDT", 5.0, 1704067200000),
+    ]
+
+
+def test_fanout_writes_every_sink_and_reraises_first_error():
+    good = MagicMock()
+    bad = MagicMock(side_effect=RuntimeError("down"))
+    sink = FanoutSink([bad, good])
+
+    with pytest.raises(RuntimeError):
+        sink("bq", "ds", "tbl", ["row"])
+    good.assert_called_once_with("bq", "ds", "tbl", ["row"])
+
+
+def test_fanout_after_commit_waits_for_every_sink():
+    deferred = []
+    staged = MagicMock()
+    staged.after_commit.side_effect = deferred.append
+    done = []
+
+    FanoutSink([lambda *args: None, staged]).after_commit(lambda: done.append(True))
+    assert done == []
+    deferred[0]()
+    assert done == [True]
+
+
+def test_build_local_sinks_skips_bigquery(tmp_path):
+    sinks = build_local_sinks([{"type": "bigquery"}, {"type": "sqlite", "path": str(tmp_path / "x.sqlite")}])
+    assert [type(sink) for sink in sinks] == [SQLiteSink]
+    primary = MagicMock()
+    assert fan_out(primary, []) is primary
+    assert isinstance(fan_out(primary, sinks), FanoutSink)
+    sinks[0].close()
+
+
+def test_build_local_sinks_gives_each_shard_its_own_database(tmp_path):
+    specs = [{"type": "sqlite", "path": str(tmp_path / "lake.sqlite")}]
+    sinks = build_local_sinks(specs, shard_index=1, shard_count=3)
+    sinks += build_local_sinks(specs)
+    assert [sink.path for sink in sinks] == [str(tmp_path / "lake.shard-1.sqlite"), str(tmp_path / "lake.sqlite")]
+    for sink in sinks:
+        sink.close()
+
+
+def test_parquet_sink_flushes_on_its_interval(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    from tda_collector.sinks import ParquetSink
+
+    sink = ParquetSink(str(tmp_path), flush_interval_seconds=0.05)
+    committed = []
+    sink(None, "crypto", "ohlcv", _batch())
+    sink.after_commit(lambda: committed.append(True))
+    time.sleep(0.5)
+
+    files = list(tmp_path.rglob("*.parquet"))
+    assert committed == [True]
+    assert sum(pq.read_table(str(path)).num_rows for path in files) == 2
+    sink.close()
@@ -0,0 +1,50 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from factories import make_record
+
+from tda_collector.spool import Spool, SpoolingSink, SpoolReplayer
+
+
+def test_spooling_sink_spools_failed_writes_and_replayer_drains(tmp_path):
+    spool = Spool(str(tmp_path), segment_max_bytes=400)
+    failing = MagicMock(side_effect=RuntimeError("bq down"))
+    sink = SpoolingSink(failing, spool, logger=MagicMock(), probe_interval_seconds=60)
+
+    sink(MagicMock(), "crypto", "ohlcv", [make_record(0), make_record(1)])
+    sink(MagicMock(), "crypto", "ohlcv", [make_record(2)])
+
+    # The second write skips the sink entirely while it is marked down.
+    assert failing.call_count == 1
+    segments, size = spool.depth()
+    assert segments >= 2 and size > 0
+
+    replayed = []
+    replayer = SpoolReplayer(
+        spool,
+        MagicMock(),
+        insert_fn=lambda client, dataset, table, rows, row_ids: replayed.extend(rows),
+        logger=MagicMock(),
+    )
+    assert replayer.replay_once() == 3
+    assert [row["timestamp"] for row in replayed] == [
+        "2023-01-01T00:00:00+00:00",
+        "2023-01-01T00:01:00+00:00",
+        "2023-01-01T00:02:00+00:00",
+    ]
+    assert spool.depth() == (0, 0)
+
+
+def test_spool_keeps_segment_when_replay_fails_and_caps_disk(tmp_path):
+    spool = Spool(str(tmp_path), segment_max_bytes=200, max_total_bytes=600)
+    for minute in range(10):
+        spool.append("crypto", "ohlcv", [make_record(minute).to_bq_row()])
+
+    _, size = spool.depth()
+    assert size <= 600 + 300
+    assert spool.rows_dropped > 0
+
+    with pytest.raises(RuntimeError):
+        spool.drain(MagicMock(side_effect=RuntimeError("still down")), MagicMock())
+    assert spool.depth()[0] > 0
@@ -1,9 +1,11 @@
 from datetime import datetime, timezone
 from unittest.mock import MagicMock
 
+from factories import make_record
+
 from tda_collector.models import OHLCVRecord
 from tda_collector import storage
-from tda_collector.storage import ensure_table, insert_rows
+from tda_collector.storage import LoadJobSink, ensure_table, insert_rows
 
 
 class DummyTable:
@@ -77,3 +79,47 @@ def test_insert_rows_ensures_schema_once(monkeypatch):
     assert client.get_table.call_count == 1
     assert client.insert_rows_json.call_count == 2
 
+
+def test_load_job_sink_stages_rows_and_commits_in_chunks(tmp_path):
+    client = MagicMock()
+    client.project = "proj"
+    loaded = []
+
+    def fake_load(file_obj, table_id, job_config=None):
+        loaded.append((table_id, file_obj.read().decode("utf-8").splitlines(), job_config))
+        return MagicMock()
+
+    client.load_table_from_file.side_effect = fake_load
+
+    sink = LoadJobSink(staging_dir=str(tmp_path), chunk_rows=3)
+    records = [make_record(minute) for minute in range(4)]
+
+    sink(client, "ds", "tbl", records[:2])
+    assert loaded == []
+    sink(client, "ds", "tbl", records[2:])
+    sink.close()
+
+    # One load job once the chunk size is reached; nothing left to commit on close.
+    assert len(loaded) == 1
+    table_id, lines, job_config = loaded[0]
+    assert table_id == "proj.ds.tbl"
+    assert len(lines) == 4
+    assert job_config.source_format == "NEWLINE_DELIMITED_JSON"
+    assert list(tmp_path.iterdir()) == []
+    client.insert_rows_json.assert_not_called()
+
+
+def test_load_job_sink_defers_commit_callbacks_until_load(tmp_path):
+    client = MagicMock()
+    client.project = "proj"
+    sink = LoadJobSink(staging_dir=str(tmp_path), chunk_rows=100)
+    record = make_record(0)
+    committed = []
+
+    sink(client, "ds", "tbl", [record])
+    sink.after_commit(lambda: committed.append("cursor"))
+    assert committed == []
+
+    sink.close()
+    assert committed == ["cursor"]
+    client.load_table_from_file.assert_called_once()
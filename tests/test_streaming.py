@@ -0,0 +1,270 @@
+import asyncio
+import json
+import threading
+from unittest.mock import MagicMock
+
+import ccxt
+import pytest
+
+from tda_collector.streaming import CandleCoalescer, run_stream_loop
+
+BASE_MS = 1_700_000_040_000
+# Enough of a ccxt binance market to subscribe without load_markets.
+BTC_USDT_SPOT = {
+    "id": "BTCUSDT",
+    "lowercaseId": "btcusdt",
+    "symbol": "BTC/USDT",
+    "base": "BTC",
+    "quote": "USDT",
+    "baseId": "BTC",
+    "quoteId": "USDT",
+    "type": "spot",
+    "spot": True,
+    "margin": False,
+    "swap": False,
+    "future": False,
+    "option": False,
+    "contract": False,
+    "active": True,
+    "precision": {},
+    "limits": {},
+    "info": {},
+}
+
+
+def _candle(ts_ms, close):
+    return [ts_ms, 1.0, 2.0, 0.5, close, 10.0]
+
+
+class FakeProClient:
+    """Scripted ccxt.pro client: yields updates, drops the connection once, then stops the loop."""
+
+    def __init__(self, exchange_id, script, stop_event, has_many=False):
+        self.id = exchange_id
+        self.has = {"watchOHLCVForSymbols": has_many}
+        self.script = list(script)
+        self.stop_event = stop_event
+        self.rest_calls = []
+        self.closed = False
+
+    async def watch_ohlcv(self, symbol, timeframe):
+        await asyncio.sleep(0)
+        if not self.script:
+            self.stop_event.set()
+            await asyncio.sleep(3600)
+        step = self.script.pop(0)
+        if isinstance(step, Exception):
+            raise step
+        return step
+
+    async def watch_ohlcv_for_symbols(self, subscriptions):
+        candles = await self.watch_ohlcv(*subscriptions[0])
+        return {subscriptions[0][0]: {subscriptions[0][1]: candles}}
+
+    async def fetch_ohlcv(self, symbol, timeframe="1m", since=None, limit=None):
+        self.rest_calls.append(since)
+        return [_candle(BASE_MS + 60_000, 5.0), _candle(BASE_MS + 120_000, 6.0)]
+
+    async def close(self):
+        self.closed = True
+
+
+def _run(has_many=False, script=None, logger=None):
+    stop = threading.Event()
+    script = script or [
+        [_candle(BASE_MS, 1.0)],
+        [_candle(BASE_MS, 2.0)],
+        [_candle(BASE_MS, 3.0)],
+        ccxt.NetworkError("connection closed"),
+        [_candle(BASE_MS + 120_000, 7.0)],
+    ]
+    fake = FakeProClient("binance", script, stop, has_many=has_many)
+    rest_client = MagicMock()
+    rest_client.id = "binance"
+    stored = []
+    logger = logger or MagicMock()
+    run_stream_loop(
+        [(rest_client, "BTC/USDT", "1m")],
+        storage_fn=lambda client, dataset, table, rows: stored.extend(rows),
+        logger=logger,
+        backoff_cfg={"base_delay": 0.001, "max_delay": 0.001},
+        client_factory=lambda exchange_id: fake,
+        flush_interval_seconds=0.01,
+        stop_event=stop,
+    )
+    events = [json.loads(call.args[0])["event"] for call in logger.info.call_args_list]
+    return fake, stored, events
+
+
+def test_stream_coalesces_updates_and_fills_gap_after_reconnect():
+    fake, stored, events = _run()
+
+    latest = {}
+    for row in stored:
+        latest[int(row.timestamp.timestamp() * 1000)] = row.close
+    # The forming bar ends with its last streamed close; the reconnect gap came from REST,
+    # and the bar streamed after the reconnect wins over the REST copy.
+    assert latest == {BASE_MS: 3.0, BASE_MS + 60_000: 5.0, BASE_MS + 120_000: 7.0}
+    assert fake.rest_calls == [BASE_MS]
+    assert "stream_reconnect" in events and "stream_gap_filled" in events
+    assert fake.closed
+
+
+def test_stream_uses_multiplexed_subscription_when_supported():
+    fake, stored, _ = _run(has_many=True)
+    assert {row.close for row in stored} >= {3.0, 7.0}
+
+
+def test_stream_backoff_restarts_after_a_subscription_delivers_bars():
+    logger = MagicMock()
+    _run(
+        script=[
+            ccxt.NetworkError("refused"),
+            ccxt.NetworkError("refused"),
+            [_candle(BASE_MS, 1.0)],
+            ccxt.NetworkError("connection closed"),
+            [_candle(BASE_MS + 60_000, 2.0)],
+        ],
+        logger=logger,
+    )
+
+    payloads = [json.loads(call.args[0]) for call in logger.info.call_args_list]
+    assert [p["attempt"] for p in payloads if p["event"] == "stream_reconnect"] == [1, 2, 1]
+
+
+def test_coalescer_keeps_latest_version_per_bar():
+    coalescer = CandleCoalescer()
+    coalescer.update("ex", "BTC/USDT", "1m", [_candle(BASE_MS, 1.0)])
+    coalescer.update("ex", "BTC/USDT", "1m", [_candle(BASE_MS, 2.0), _candle(BASE_MS + 60_000, 3.0)])
+
+    rows = coalescer.drain()
+    assert [row.close for row in rows] == [2.0, 3.0]
+    assert coalescer.drain() == []
+
+
+class _LocalBinance:
+    """Local WebSocket + REST server speaking Binance's kline stream protocol, in its own thread."""
+
+    def __init__(self, connections, rest_candles, on_done):
+        from aiohttp import web
+
+        self.web = web
+        self.connections = list(connections)
+        self.rest_candles = rest_candles
+        self.on_done = on_done
+        self.subscribes = []
+        self.rest_since = []
+        self.loop = asyncio.new_event_loop()
+        self.started = threading.Event()
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        self.started.wait(5)
+        return self
+
+    def __exit__(self, *exc):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+
+    def _serve(self):
+        asyncio.set_event_loop(self.loop)
+        app = self.web.Application()
+        app.router.add_get("/ws/{stream}", self._ws)
+        app.router.add_get("/api/v3/klines", self._klines)
+        runner = self.web.AppRunner(app)
+        self.loop.run_until_complete(runner.setup())
+        site = self.web.TCPSite(runner, "127.0.0.1", 0)
+        self.loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self.started.set()
+        self.loop.run_forever()
+        self.loop.run_until_complete(runner.cleanup())
+
+    async def _ws(self, request):
+        ws = self.web.WebSocketResponse()
+        await ws.prepare(request)
+        bars = self.connections.pop(0) if self.connections else None
+        async for msg in ws:
+            subscribe = json.loads(msg.data)
+            self.subscribes.append(subscribe)
+            await ws.send_str(json.dumps({"result": None, "id": subscribe["id"]}))
+            for ts_ms, close in bars or []:
+                await ws.send_str(json.dumps(_kline(ts_ms, close)))
+                await asyncio.sleep(0.05)
+            if bars is None or not self.connections:
+                # Last scripted connection: leave time for a flush, then stop the collector.
+                await asyncio.sleep(0.1)
+                self.on_done()
+            else:
+                await ws.close()
+        return ws
+
+    async def _klines(self, request):
+        self.rest_since.append(int(request.query["startTime"]))
+        rows = [[ts, "1", "2", "0.5", str(close), "10", ts + 59_999] for ts, close in self.rest_candles]
+        return self.web.json_response(rows)
+
+
+def _kline(ts_ms, close):
+    return {
+        "e": "kline",
+        "E": ts_ms,
+        "s": "BTCUSDT",
+        "k": {
+            "t": ts_ms,
+            "T": ts_ms + 59_999,
+            "s": "BTCUSDT",
+            "i": "1m",
+            "o": "1",
+            "h": "2",
+            "l": "0.5",
+            "c": str(close),
+            "v": "10",
+            "x": False,
+        },
+    }
+
+
+def test_stream_subscribes_and_reconnects_against_a_local_websocket_server():
+    pytest.importorskip("aiohttp")
+    import ccxt.pro
+
+    stop = threading.Event()
+    connections = [[(BASE_MS, 1.0), (BASE_MS, 2.0), (BASE_MS, 3.0)], [(BASE_MS + 120_000, 7.0)]]
+    rest_candles = [(BASE_MS + 60_000, 5.0), (BASE_MS + 120_000, 6.0)]
+
+    with _LocalBinance(connections, rest_candles, stop.set) as server:
+
+        def pro_client(exchange_id):
+            client = ccxt.pro.binance()
+            client.urls["api"]["ws"]["spot"] = f"ws://127.0.0.1:{server.port}/ws"
+            client.urls["api"]["public"] = f"http://127.0.0.1:{server.port}/api/v3"
+            client.set_markets([BTC_USDT_SPOT])
+            return client
+
+        rest_client = MagicMock()
+        rest_client.id = "binance"
+        stored = []
+        logger = MagicMock()
+        run_stream_loop(
+            [(rest_client, "BTC/USDT", "1m")],
+            storage_fn=lambda client, dataset, table, rows: stored.extend(rows),
+            logger=logger,
+            backoff_cfg={"base_delay": 0.001, "max_delay": 0.001},
+            client_factory=pro_client,
+            flush_interval_seconds=0.01,
+            stop_event=stop,
+        )
+
+    # One multiplexed subscribe per connection, again after the server dropped the first.
+    assert [s["method"] for s in server.subscribes] == ["SUBSCRIBE", "SUBSCRIBE"]
+    assert all(s["params"] == ["btcusdt@kline_1m"] for s in server.subscribes)
+    # The gap while disconnected is fetched over REST from the last streamed bar.
+    assert server.rest_since == [BASE_MS]
+    latest = {}
+    for row in stored:
+        latest[int(row.timestamp.timestamp() * 1000)] = row.close
+    assert latest == {BASE_MS: 3.0, BASE_MS + 60_000: 5.0, BASE_MS + 120_000: 7.0}
+    events = [json.loads(call.args[0])["event"] for call in logger.info.call_args_list]
+    assert "stream_reconnect" in events and "stream_gap_filled" in events
@@ -0,0 +1,19 @@
+from datetime import datetime, timezone
+
+from tda_collector.timeframes import candle_open_ms, next_close_ms
+
+
+def _ms(*args):
+    return int(datetime(*args, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def test_weekly_candles_open_on_monday():
+    wednesday = _ms(2024, 1, 3, 15, 30)
+    assert candle_open_ms(wednesday, "1w", 7 * 86_400_000) == _ms(2024, 1, 1)
+    assert next_close_ms(wednesday, "1w", 7 * 86_400_000) == _ms(2024, 1, 8)
+
+
+def test_monthly_and_intraday_boundaries():
+    assert next_close_ms(_ms(2024, 12, 15), "1M", 30 * 86_400_000) == _ms(2025, 1, 1)
+    assert candle_open_ms(_ms(2024, 1, 1, 10, 17), "1h", 3_600_000) == _ms(2024, 1, 1, 10)
+    assert next_close_ms(_ms(2024, 1, 1, 10, 17), "1h", 3_600_000) == _ms(2024, 1, 1, 11)
@@ -0,0 +1,159 @@
+from unittest.mock import MagicMock
+
+import ccxt
+import pytest
+
+from factories import mock_client
+
+from tda_collector.config import load_config
+from tda_collector.models import ExchangePair, SymbolSelector
+from tda_collector.universe import LiveTaskSet, UniverseRefresher, resolve_pairs, select_markets
+
+
+def _market(symbol, market_id, quote, market_type, active=True):
+    return {"id": market_id, "symbol": symbol, "quote": quote, "type": market_type, "active": active}
+
+
+MARKETS = {
+    "BTC/USDT:USDT": _market("BTC/USDT:USDT", "BTCUSDT", "USDT", "swap"),
+    "ETH/USDT:USDT": _market("ETH/USDT:USDT", "ETHUSDT", "USDT", "swap"),
+    "SOL/USDT:USDT": _market("SOL/USDT:USDT", "SOLUSDT", "USDT", "swap"),
+    "LUNA/USDT:USDT": _market("LUNA/USDT:USDT", "LUNAUSDT", "USDT", "swap", active=False),
+    "ETH/USDC:USDC": _market("ETH/USDC:USDC", "ETHPERP", "USDC", "swap"),
+    "ETH/USDT": _market("ETH/USDT", "ETHUSDT", "USDT", "spot"),
+}
+
+
+def test_config_parses_selector_entries(tmp_path):
+    cfg_file = tmp_path / "config.yaml"
+    cfg_file.write_text(
+        """
+exchanges:
+  bybit:
+    - symbol: "BTCUSDT"
+      timeframes: ["1h"]
+    - select: {quote: USDT, type: swap, regex: "^[A-Z]+/", top: 2}
+      timeframes: ["1m"]
+      priority: -1
+  okx:
+    - select: {quote: USDC}
+      timeframes: ["1d"]
+""",
+        encoding="utf-8",
+    )
+
+    cfg = load_config(str(cfg_file))
+    assert [pair.symbol for pair in cfg.exchanges["bybit"]] == ["BTCUSDT"]
+    assert cfg.exchanges["okx"] == []
+    assert cfg.selectors["bybit"] == [
+        SymbolSelector(timeframes=["1m"], quote="USDT", market_type="swap", regex="^[A-Z]+/", top=2, priority=-1)
+    ]
+
+
+def test_selectors_filter_markets_and_rank_top_by_volume():
+    assert select_markets(MARKETS, SymbolSelector(timeframes=["1m"], quote="USDT", market_type="swap")) == [
+        "BTC/USDT:USDT",
+        "ETH/USDT:USDT",
+        "SOL/USDT:USDT",
+    ]
+
+    client = MagicMock()
+    client.markets = MARKETS
+    volumes = {"ETH/USDT:USDT": 5e9, "SOL/USDT:USDT": 2e9}
+    volume_fn = MagicMock(side_effect=lambda client_arg, symbols: {s: volumes.get(s, 0.0) for s in symbols})
+    explicit = [ExchangePair(symbol="BTCUSDT", timeframes=["1h"])]
+    selectors = [
+        SymbolSelector(timeframes=["1m"], quote="USDT", market_type="swap", top=1, priority=2),
+        SymbolSelector(timeframes=["1d"], regex="^(ETH|SOL)/"),
+    ]
+
+    pairs = resolve_pairs(client, explicit, selectors, volume_fn)
+
+    # BTCUSDT is listed by exchange id; ETH wins the volume ranking; the second rule
+    # only adds what the first did not take.
+    assert [(pair.symbol, pair.timeframes, pair.priority) for pair in pairs] == [
+        ("BTCUSDT", ["1h"], 0),
+        ("ETH/USDT:USDT", ["1m"], 2),
+        ("ETH/USDC:USDC", ["1d"], 0),
+        ("ETH/USDT", ["1d"], 0),
+        ("SOL/USDT:USDT", ["1d"], 0),
+    ]
+    volume_fn.assert_called_once_with(client, ["ETH/USDT:USDT", "SOL/USDT:USDT"])
+
+
+def test_selectors_load_markets_the_cache_did_not_provide():
+    client = MagicMock()
+    client.id = "bybit"
+    client.markets = {}
+    client.load_markets.side_effect = lambda: setattr(client, "markets", MARKETS)
+    selectors = [SymbolSelector(timeframes=["1m"], quote="USDC")]
+
+    pairs = resolve_pairs(client, [], selectors)
+
+    client.load_markets.assert_called_once_with()
+    assert [pair.symbol for pair in pairs] == ["ETH/USDC:USDC"]
+
+
+def test_selectors_without_markets_fail_naming_the_exchange():
+    client = MagicMock()
+    client.id = "bybit"
+    client.markets = None
+    selectors = [SymbolSelector(timeframes=["1m"], quote="USDT")]
+
+    with pytest.raises(ValueError, match="bybit"):
+        resolve_pairs(client, [], selectors)
+    # Explicit pairs alone need no markets.
+    assert resolve_pairs(client, [ExchangePair(symbol="BTCUSDT", timeframes=["1h"])], []) != []
+
+
+def test_refresher_swaps_tasks_when_markets_change():
+    client = MagicMock()
+    client.id = "bybit"
+    client.markets = {"BTC/USDT:USDT": MARKETS["BTC/USDT:USDT"]}
+    exchanges = {"bybit": []}
+    selectors = {"bybit": [SymbolSelector(timeframes=["1m"], quote="USDT")]}
+
+    def build_tasks(universe):
+        return [(client, pair.symbol, tf) for pair in universe["bybit"] for tf in pair.timeframes]
+
+    universe = {"bybit": [ExchangePair(symbol="BTC/USDT:USDT", timeframes=["1m"])]}
+    task_set = LiveTaskSet(build_tasks(universe))
+
+    def listing_and_delisting(reload=False):
+        client.markets = {"ETH/USDT:USDT": MARKETS["ETH/USDT:USDT"], "SOL/USDT:USDT": MARKETS["SOL/USDT:USDT"]}
+
+    client.load_markets.side_effect = listing_and_delisting
+    logger = MagicMock()
+    refresher = UniverseRefresher({"bybit": client}, exchanges, selectors, universe, build_tasks, task_set, logger=logger)
+
+    assert refresher.refresh_once() == (2, 1)
+    version, tasks = task_set.snapshot()
+    assert version == 1
+    assert [task[1] for task in tasks] == ["ETH/USDT:USDT", "SOL/USDT:USDT"]
+    # Same markets again: no new version for the live loops to pick up.
+    assert refresher.refresh_once() == (0, 0)
+    assert task_set.version == 1
+
+
+def test_failed_refresh_keeps_previous_pairs():
+    client = mock_client("bybit", markets=MARKETS)
+    selectors = {"bybit": [SymbolSelector(timeframes=["1m"], quote="USDT", top=1)]}
+    universe = {"bybit": [ExchangePair(symbol="BTC/USDT:USDT", timeframes=["1m"])]}
+    task_set = LiveTaskSet([(client, "BTC/USDT:USDT", "1m")])
+
+    def build_tasks(resolved):
+        return [(client, pair.symbol, tf) for pair in resolved["bybit"] for tf in pair.timeframes]
+
+    refresher = UniverseRefresher(
+        {"bybit": client},
+        {"bybit": []},
+        selectors,
+        universe,
+        build_tasks,
+        task_set,
+        logger=MagicMock(),
+        volume_fn=MagicMock(side_effect=ccxt.NetworkError("tickers down")),
+    )
+
+    assert refresher.refresh_once() == (0, 0)
+    assert refresher.universe == universe
@@ -0,0 +1,53 @@
+from unittest.mock import MagicMock
+
+from factories import make_record
+
+from tda_collector.writer import BatchWriter
+
+
+def test_batch_writer_coalesces_rows_across_tasks():
+    calls = []
+
+    def fake_insert(client, dataset, table, payload):
+        calls.append((dataset, table, list(payload)))
+
+    writer = BatchWriter(fake_insert, max_rows=4, max_latency_seconds=60, logger=MagicMock())
+    bq_client = MagicMock()
+    for minute in range(0, 8, 2):
+        writer.submit(bq_client, "crypto", "ohlcv", [make_record(minute), make_record(minute + 1)])
+    writer.close()
+
+    # Eight rows from four tasks become two inserts of four rows each.
+    assert [len(payload) for _, _, payload in calls] == [4, 4]
+    assert calls[0][2][0]["timestamp"] == "2023-01-01T00:00:00+00:00"
+
+
+def test_batch_writer_flushes_remaining_rows_on_close():
+    calls = []
+    writer = BatchWriter(
+        lambda client, dataset, table, payload: calls.append(payload),
+        max_rows=1000,
+        max_latency_seconds=60,
+        logger=MagicMock(),
+    )
+    writer.submit(MagicMock(), "crypto", "ohlcv", [make_record(0)])
+    writer.close()
+
+    assert len(calls) == 1
+    assert len(calls[0]) == 1
+
+
+def test_batch_writer_survives_a_failing_spool():
+    def failing_insert(client, dataset, table, payload):
+        raise ValueError("bigquery down")
+
+    spool = MagicMock()
+    spool.append.side_effect = OSError("disk full")
+    writer = BatchWriter(failing_insert, max_rows=1, max_latency_seconds=60, logger=MagicMock(), spool=spool)
+    writer.submit(MagicMock(), "crypto", "ohlcv", [make_record(0)])
+    writer.submit(MagicMock(), "crypto", "ohlcv", [make_record(1)])
+    writer.close(timeout=5)
+
+    # Both batches reached the spool: the thread outlived the first spool error.
+    assert spool.append.call_count == 2
+    assert writer.rows_dropped == 2